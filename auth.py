@@ -0,0 +1,178 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+# Параметры scrypt: ~16 МБ памяти и десятки миллисекунд CPU на одну проверку
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_SIZE = 16
+KEY_SIZE = 32
+HASH_PREFIX = 'scrypt'
+
+AUTH_CACHE_SIZE = 1024
+AUTH_CACHE_TTL = 15 * 60
+# Сессия на сервере бронирования действует сутки - дольше смены кассира
+SESSION_TTL = 24 * 60 * 60
+SESSION_CACHE_SIZE = 1024
+
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p, maxmem=128 * r * n * 2, dklen=KEY_SIZE)
+
+
+# Формат хранения: scrypt$n$r$p$соль$ключ (соль и ключ в base64)
+def hash_password(password):
+    salt = os.urandom(SALT_SIZE)
+    key = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f'{HASH_PREFIX}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(key)}'
+
+
+def is_hashed(stored):
+    return stored.startswith(HASH_PREFIX + '$')
+
+
+# Возвращает (пароль верен, нужно ли перехешировать). Строки, оставшиеся
+# с открытым паролем, и хеши со старыми параметрами помечаются на перехеширование
+def verify_password(password, stored):
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8')), True
+    try:
+        _, n, r, p, salt, key = stored.split('$')
+        n, r, p = int(n), int(r), int(p)
+        salt, key = base64.b64decode(salt), base64.b64decode(key)
+    except ValueError:
+        return False, False
+    ok = hmac.compare_digest(_scrypt(password, salt, n, r, p), key)
+    return ok, ok and (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+# KDF намеренно нагружает процессор, поэтому хеширование идёт в пуле
+# процессов: проверки параллелятся по ядрам и не держат GIL вызывающего процесса
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # multiprocessing и concurrent.futures нужны только к первому входу,
+            # поэтому не замедляют запуск кассы
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            _executor = ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def hash_password_pooled(password):
+    return _get_executor().submit(hash_password, password).result()
+
+
+def hash_passwords_pooled(passwords, chunksize=16):
+    # Пакетное хеширование для импорта: пароли раздаются процессам порциями
+    return list(_get_executor().map(hash_password, passwords, chunksize=chunksize))
+
+
+def verify_password_pooled(password, stored):
+    return _get_executor().submit(verify_password, password, stored).result()
+
+
+def shutdown_pool():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+# Кэш успешных входов: повторный вход кассира с тем же паролем проверяется
+# по HMAC со случайным ключом процесса, без scrypt и без запроса к users.
+# Записи вытесняются по LRU и устаревают через ttl секунд
+class AuthCache:
+    def __init__(self, size=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL, clock=time.monotonic):
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        self._key = secrets.token_bytes(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _digest(self, username, password):
+        return hmac.new(self._key, f'{username}\0{password}'.encode('utf-8'), hashlib.sha256).digest()
+
+    def get(self, username, password):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return None
+            digest, user, expires_at = entry
+            if expires_at <= self.clock():
+                del self._entries[username]
+                return None
+            if not hmac.compare_digest(digest, self._digest(username, password)):
+                return None
+            self._entries.move_to_end(username)
+            return user
+
+    def put(self, username, password, user):
+        with self._lock:
+            self._entries[username] = (self._digest(username, password), user, self.clock() + self.ttl)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
+
+
+# Токен сессии сервера бронирования. В базе хранится только его SHA-256,
+# поэтому копия базы не даёт войти чужими сессиями
+def new_session_token():
+    return secrets.token_urlsafe(32)
+
+
+def token_digest(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+# Кэш проверенных сессий, чтобы вызов сервера не читал auth_sessions:
+# digest токена -> (пользователь, срок действия по time.time()). Новые
+# сессии действуют ttl секунд; записи вытесняются по LRU
+class SessionCache:
+    def __init__(self, size=SESSION_CACHE_SIZE, ttl=SESSION_TTL, clock=time.time):
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at <= self.clock():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return user
+
+    def put(self, digest, user, expires_at):
+        with self._lock:
+            self._entries[digest] = (user, expires_at)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
@@ -0,0 +1,66 @@
+# Сравнение накладных расходов на соединение: sqlite3.connect на каждую
+# операцию (как было в обработчиках экранов) против общего пула соединений.
+#
+# Запуск: python benchmarks/bench_connections.py [--ops N]
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import SQL_OCCUPIED_SEATS, CinemaRepository, ConnectionPool, initialize_database
+
+
+def per_call_connection(path, ops):
+    start = time.perf_counter()
+    for i in range(ops):
+        conn = sqlite3.connect(path)
+        cursor = conn.cursor()
+        cursor.execute(SQL_OCCUPIED_SEATS, (i % 2 + 1,))
+        cursor.fetchall()
+        conn.close()
+    return time.perf_counter() - start
+
+
+def pooled_connection(path, ops):
+    pool = ConnectionPool(path)
+    repository = CinemaRepository(pool)
+    repository.occupied_seats(1)  # прогрев пула
+    start = time.perf_counter()
+    for i in range(ops):
+        repository.occupied_seats(i % 2 + 1)
+    elapsed = time.perf_counter() - start
+    pool.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ops', type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'cinema.db')
+        pool = ConnectionPool(path)
+        initialize_database(pool)
+        with pool.transaction() as conn:
+            conn.executemany(
+                'INSERT INTO tickets (user_id, showtime_id, seat_number, purchase_date) VALUES (?, ?, ?, DATE(\'now\'))',
+                [(2, m, f'{r}-{c}') for m in (1, 2) for r in range(1, 6) for c in range(1, 11)],
+            )
+        pool.close()
+
+        before = per_call_connection(path, args.ops)
+        after = pooled_connection(path, args.ops)
+
+    print(f'Операций: {args.ops}')
+    print(f'connect на каждый вызов: {before / args.ops * 1e6:8.1f} мкс/оп')
+    print(f'пул соединений:          {after / args.ops * 1e6:8.1f} мкс/оп')
+    print(f'ускорение:               {before / after:8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
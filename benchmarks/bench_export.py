@@ -0,0 +1,124 @@
+# Пиковая память и время выгрузки статистики: прежний способ (весь JOIN в
+# DataFrame и один to_excel) против потоковой выгрузки export.py.
+# Каждый замер идёт в отдельном процессе, чтобы ru_maxrss не смешивались.
+#
+# Запуск: python benchmarks/bench_export.py [--tickets 1000000] [--formats xlsx,csv,parquet]
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import ConnectionPool, initialize_database
+from export import export_ticket_stats
+
+SEATS_PER_SHOWTIME = 50
+USERS = 10000
+BATCH_SIZE = 100000
+
+SQL_LEGACY = '''
+    SELECT tickets.id, users.full_name, films.title, tickets.seat_number, tickets.purchase_date
+    FROM tickets
+    JOIN users ON tickets.user_id = users.id
+    JOIN showtimes ON tickets.showtime_id = showtimes.id
+    JOIN films ON showtimes.film_id = films.id
+'''
+
+
+def seed(path, tickets):
+    pool = ConnectionPool(path)
+    initialize_database(pool)
+    showtimes = tickets // SEATS_PER_SHOWTIME + 1
+    with pool.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO users (full_name, username, password, role) VALUES (?, ?, 'x', 'user')",
+            ((f'Пользователь {i}', f'user{i}') for i in range(USERS)),
+        )
+        # Фильмы и сеансы получают id с 3: первые два заняты примерными данными
+        conn.executemany(
+            "INSERT INTO films (title, description) VALUES (?, '')", ((f'Фильм {i + 3}',) for i in range(showtimes)),
+        )
+        conn.execute(
+            "INSERT INTO showtimes (film_id, hall_id, start_ts) SELECT id, 1, '2024-12-01 18:00' FROM films WHERE id > 2 ORDER BY id"
+        )
+        for offset in range(0, tickets, BATCH_SIZE):
+            conn.executemany(
+                'INSERT INTO tickets (user_id, showtime_id, seat_number, purchase_date) VALUES (?, ?, ?, ?)',
+                (
+                    (i % USERS + 3, i // SEATS_PER_SHOWTIME + 3, f'{i % SEATS_PER_SHOWTIME // 10 + 1}-{i % 10 + 1}',
+                     f'2024-12-{i % 28 + 1:02d}')
+                    for i in range(offset, min(offset + BATCH_SIZE, tickets))
+                ),
+            )
+    pool.close()
+
+
+def run_legacy(db_path, out_path):
+    import sqlite3
+
+    import pandas as pd
+
+    conn = sqlite3.connect(db_path)
+    tickets_df = pd.read_sql_query(SQL_LEGACY, conn)
+    conn.close()
+    tickets_df.to_excel(out_path, index=False)
+    return len(tickets_df)
+
+
+def run_streaming(db_path, out_path):
+    pool = ConnectionPool(db_path)
+    written = export_ticket_stats(pool, out_path)
+    pool.close()
+    return written
+
+
+def child(mode, db_path, out_path):
+    start = time.perf_counter()
+    rows = run_legacy(db_path, out_path) if mode == 'legacy' else run_streaming(db_path, out_path)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss в Linux измеряется в килобайтах
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'mode': mode, 'rows': rows, 'seconds': elapsed, 'peak_rss_mb': peak_mb}))
+
+
+def measure(mode, db_path, out_path):
+    output = subprocess.run(
+        [sys.executable, __file__, '--child', mode, db_path, out_path],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=1000000)
+    parser.add_argument('--formats', default='xlsx,csv,parquet')
+    parser.add_argument('--skip-legacy', action='store_true')
+    parser.add_argument('--child', nargs=3, metavar=('MODE', 'DB', 'OUT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'cinema.db')
+        seed(db_path, args.tickets)
+
+        runs = [] if args.skip_legacy else [('legacy', 'legacy.xlsx')]
+        runs += [('streaming', f'stream.{fmt}') for fmt in args.formats.split(',')]
+        print(f'{"способ":<20} {"строк":>10} {"время, с":>10} {"пик RSS, МБ":>12}')
+        for mode, name in runs:
+            result = measure(mode, db_path, os.path.join(tmp, name))
+            label = mode if mode == 'legacy' else f'{mode} {name.split(".")[1]}'
+            print(f'{label:<20} {result["rows"]:>10} {result["seconds"]:>10.2f} {result["peak_rss_mb"]:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
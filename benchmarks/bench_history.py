@@ -0,0 +1,70 @@
+# История покупок пользователя ("Мои билеты", история в админке): первая
+# страница и следующая за ней по ключу (время покупки, id) на покрывающем
+# индексе tickets (user_id, purchase_date, id, ...). Печатает план запроса:
+# билеты читаются по индексу (SEARCH ... COVERING INDEX), без SCAN tickets;
+# TEMP B-TREE в плане сортирует при слиянии с архивом не больше страницы строк.
+#
+# Запуск: python benchmarks/bench_history.py [--tickets 1000000]
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import SQL_TICKET_HISTORY_PAGE, TICKET_HISTORY_FIRST_KEY, CinemaRepository, ConnectionPool, initialize_database
+from seed import seed
+
+PAGE_SIZE = 10
+SAMPLES = 500
+
+
+def percentiles(times):
+    times.sort()
+    return statistics.median(times), times[int(len(times) * 0.95)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=1000000)
+    args = parser.parse_args()
+    rng = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = ConnectionPool(os.path.join(tmp, 'cinema.db'))
+        initialize_database(pool)
+        counts = seed(pool, args.tickets)
+        repository = CinemaRepository(pool)
+        users = [counts['first_user'] + rng.randrange(counts['users']) for _ in range(SAMPLES)]
+
+        first, second = [], []
+        for user_id in users:
+            start = time.perf_counter()
+            rows = repository.ticket_history_page(user_id, TICKET_HISTORY_FIRST_KEY, PAGE_SIZE)
+            first.append((time.perf_counter() - start) * 1000)
+            if rows:
+                start = time.perf_counter()
+                repository.ticket_history_page(user_id, (rows[-1][1], rows[-1][0]), PAGE_SIZE)
+                second.append((time.perf_counter() - start) * 1000)
+
+        with pool.connection() as conn:
+            plan = conn.execute(
+                'EXPLAIN QUERY PLAN ' + SQL_TICKET_HISTORY_PAGE, (users[0], *TICKET_HISTORY_FIRST_KEY, PAGE_SIZE),
+            ).fetchall()
+        pool.close()
+
+    print(f'билетов {args.tickets}, пользователей {counts["users"]}, страница {PAGE_SIZE} строк')
+    for label, times in (('первая страница', first), ('следующая', second)):
+        p50, p95 = percentiles(times)
+        print(f'  {label:<16} p50 {p50:7.3f} мс   p95 {p95:7.3f} мс')
+    print('план запроса:')
+    for row in plan:
+        print('  ', row[-1])
+
+
+if __name__ == '__main__':
+    main()
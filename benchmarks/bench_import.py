@@ -0,0 +1,55 @@
+# Массовый импорт расписания: построчное добавление через add_session
+# (как из диалога) против importer.import_file с пачками executemany.
+#
+# Запуск: python benchmarks/bench_import.py [--rows 1000000] [--single-rows 5000]
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import CinemaRepository, ConnectionPool, initialize_database
+from importer import import_file
+
+
+def write_schedule(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['title', 'description', 'date', 'time', 'hall_id'])
+        for i in range(rows):
+            writer.writerow([f'Фильм {i % 500}', 'Описание', f'2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}', f'{i % 24:02d}:00', 1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--single-rows', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = ConnectionPool(os.path.join(tmp, 'cinema.db'))
+        initialize_database(pool)
+        repository = CinemaRepository(pool)
+
+        start = time.perf_counter()
+        for i in range(args.single_rows):
+            repository.add_session(f'Фильм {i}', 'Описание', '2025-01-01', '18:00')
+        single = args.single_rows / (time.perf_counter() - start)
+
+        path = os.path.join(tmp, 'schedule.csv')
+        write_schedule(path, args.rows)
+        start = time.perf_counter()
+        report = import_file(pool, 'sessions', path)
+        elapsed = time.perf_counter() - start
+        assert report.imported == args.rows, report.summary()
+        pool.close()
+
+    print(f'add_session по одной строке: {single:12.0f} строк/с')
+    print(f'import_file:                 {args.rows / elapsed:12.0f} строк/с ({args.rows} строк за {elapsed:.1f} с)')
+
+
+if __name__ == '__main__':
+    main()
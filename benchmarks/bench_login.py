@@ -0,0 +1,67 @@
+# Пропускная способность входа: проверка scrypt в одном процессе, вход через
+# BookingService с пулом процессов (холодный кэш) и повторный вход из кэша.
+#
+# Запуск: python benchmarks/bench_login.py [--users 64] [--threads N]
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth import AuthCache, hash_password, shutdown_pool, verify_password
+from core import BookingService
+from database import CinemaRepository, ConnectionPool, initialize_database
+
+
+def throughput(fn, items, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        results = list(executor.map(fn, items))
+    elapsed = time.perf_counter() - start
+    assert all(results), 'вход не удался'
+    return len(items) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=64)
+    parser.add_argument('--threads', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    cores = os.cpu_count()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = ConnectionPool(os.path.join(tmp, 'cinema.db'), size=args.threads + 1)
+        initialize_database(pool)
+        stored = hash_password('secret')
+        with pool.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO users (full_name, username, password, role) VALUES ('Кассир', ?, ?, 'user')",
+                ((f'cashier{i}', stored) for i in range(args.users)),
+            )
+        users = [f'cashier{i}' for i in range(args.users)]
+
+        start = time.perf_counter()
+        for _ in range(8):
+            verify_password('secret', stored)
+        single = 8 / (time.perf_counter() - start)
+
+        service = BookingService(CinemaRepository(pool), auth_cache=AuthCache())
+        service.authenticate(users[0], 'secret')  # запуск пула процессов
+        service.auth_cache.invalidate(users[0])
+        cold = throughput(lambda username: service.authenticate(username, 'secret'), users, args.threads)
+        cached = throughput(lambda username: service.authenticate(username, 'secret'), users * 100, args.threads)
+
+        shutdown_pool()
+        pool.close()
+
+    print(f'ядер: {cores}, потоков: {args.threads}')
+    print(f'scrypt в одном процессе:      {single:10.1f} входов/с')
+    print(f'вход через пул процессов:     {cold:10.1f} входов/с ({cold / cores:.1f} на ядро)')
+    print(f'повторный вход из кэша:       {cached:10.1f} входов/с')
+
+
+if __name__ == '__main__':
+    main()
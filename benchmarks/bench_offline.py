@@ -0,0 +1,137 @@
+# Касса с сервером бронирования: задержка чтений напрямую через RPC и через
+# локальный кэш offline.py, затем обрыв связи. Сервер останавливается,
+# касса продаёт места в офлайн-журнал (одно из них тем временем продаёт
+# другая касса напрямую в базу), сервер запускается снова, и замеряется,
+# за сколько журнал проводится и сколько конфликтов найдено.
+#
+# Запуск: python benchmarks/bench_offline.py [--tickets 100000] [--purchases 200]
+import argparse
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from client import RemoteBookingService
+from core import QUEUED
+from database import CinemaRepository, ConnectionPool, initialize_database
+from offline import OfflineBookingService
+from seed import HALL_COLS, HALL_ROWS, SEED_PASSWORD, TICKETS_PER_SHOWTIME, seat_label, seed
+
+SAMPLES = 300
+PAGE_SIZE = 200
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(db_path, port):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'server.py'), '--db', db_path, '--port', str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError('сервер не запустился')
+
+
+def latency(fn, args_list):
+    times = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return statistics.median(times), times[int(len(times) * 0.95)]
+
+
+def report(label, remote, cached):
+    print(f'  {label:<14} RPC p50 {remote[0]:7.3f} мс p95 {remote[1]:7.3f} мс   '
+          f'кэш p50 {cached[0]:7.3f} мс p95 {cached[1]:7.3f} мс')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=100000)
+    parser.add_argument('--purchases', type=int, default=200)
+    args = parser.parse_args()
+    rng = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'cinema.db')
+        pool = ConnectionPool(db_path)
+        initialize_database(pool)
+        counts = seed(pool, args.tickets)
+        showtimes = list(range(counts['first_showtime'], counts['first_showtime'] + counts['showtimes']))
+        port = free_port()
+        server = start_server(db_path, port)
+        remote = RemoteBookingService(f'http://127.0.0.1:{port}', timeout=2)
+        remote.authenticate(f'load{counts["first_user"]}', SEED_PASSWORD)
+        service = OfflineBookingService(remote, os.path.join(tmp, 'offline.db'), retry_interval=0.2)
+        try:
+            now = datetime.now().strftime('%Y-%m-%d %H:%M')
+            until = (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d')
+            print(f'билетов {args.tickets}, сеансов {counts["showtimes"]}')
+            pages = [((now, 0), PAGE_SIZE, until)] * SAMPLES
+            report('список сеансов', latency(remote.showtimes_page, pages), latency(service.showtimes_page, pages))
+            # Схема зала в кэше живёт OCCUPANCY_MAX_AGE секунд: замеряются
+            # повторные открытия нескольких сеансов подряд
+            picks = [(rng.choice(showtimes[:20]),) for _ in range(SAMPLES)]
+            report('схема зала', latency(remote.occupancy, picks), latency(service.occupancy, picks))
+
+            # Обрыв связи: покупки уходят в журнал, одно место тем временем
+            # продаёт другая касса напрямую в базу
+            targets = showtimes[:20]
+            for showtime_id in targets:
+                service.occupancy(showtime_id)
+            server.terminate()
+            server.wait()
+            seats = rng.sample(
+                [(showtime_id, index) for showtime_id in targets
+                 for index in range(TICKETS_PER_SHOWTIME, HALL_ROWS * HALL_COLS)],
+                args.purchases,
+            )
+            start = time.perf_counter()
+            queued = [
+                service.purchase_ticket(counts['first_user'], showtime_id, seat_label(index))
+                for showtime_id, index in seats
+            ]
+            queue_ms = (time.perf_counter() - start) * 1000 / len(seats)
+            print(f'  без связи: в журнале {queued.count(QUEUED)} из {len(seats)} покупок, '
+                  f'{queue_ms:.3f} мс на покупку; схема из кэша: {service.occupancy(targets[0]) is not None}')
+            contested_showtime, contested_index = seats[0]
+            CinemaRepository(pool).purchase_ticket(counts['first_user'], contested_showtime, seat_label(contested_index))
+
+            server = start_server(db_path, port)
+            start = time.perf_counter()
+            while service.pending_count() and time.perf_counter() - start < 30:
+                time.sleep(0.01)
+            replay_s = time.perf_counter() - start
+            sold = sum(remote.occupancy(showtime_id).taken_count() - TICKETS_PER_SHOWTIME for showtime_id in targets)
+            print(f'  связь восстановлена: журнал проведён за {replay_s:.2f} с (включая ожидание проверки связи), '
+                  f'конфликтов {len(service.conflicts())}, продано на сервере {sold}')
+        finally:
+            service.close()
+            server.terminate()
+            server.wait()
+            pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+# Продажи во время тяжёлого отчёта: отдельный процесс в цикле строит
+# reports.build_report по основной базе или по реплике (replica.py), а
+# основной процесс всё это время покупает билеты. Печатает задержку покупки
+# и размер WAL основной базы: долгое чтение на ней не даёт контрольной точке
+# дойти до конца, и WAL растёт, пока идёт отчёт. В конце - время онлайн-копии
+# (manage.py backup) и обновления реплики под теми же продажами.
+#
+# Запуск: python benchmarks/bench_replica.py [--tickets 1000000] [--seconds 20] [--db seeded.db]
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import CinemaRepository, ConnectionPool, initialize_database
+from replica import Replica, snapshot
+from seed import HALL_COLS, HALL_ROWS, TICKETS_PER_SHOWTIME, seat_label, seed
+
+
+def report_loop(path):
+    # Режим дочернего процесса: отчёты подряд, пока процесс не завершат
+    from reports import build_report
+
+    pool = ConnectionPool(path)
+    while True:
+        build_report(pool)
+
+
+def free_seats(first_showtime, showtimes):
+    # Места после проданных сидом, по кругу по сеансам
+    for seat in range(TICKETS_PER_SHOWTIME, HALL_ROWS * HALL_COLS):
+        for showtime_id in range(first_showtime, first_showtime + showtimes):
+            yield showtime_id, seat_label(seat)
+
+
+def sell(repository, seats, user_id, seconds):
+    times = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        showtime_id, seat = next(seats)
+        start = time.perf_counter()
+        repository.purchase_ticket(user_id, showtime_id, seat)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def wal_size(path):
+    wal = f'{path}-wal'
+    return os.path.getsize(wal) / 2 ** 20 if os.path.exists(wal) else 0
+
+
+def scenario(label, path, reader_path, repository, seats, user_id, seconds):
+    with repository.pool.connection() as conn:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    reader = None
+    if reader_path:
+        reader = subprocess.Popen([sys.executable, __file__, '--reader', reader_path])
+        # Даём отчёту начать чтение
+        time.sleep(1)
+    try:
+        times = sell(repository, seats, user_id, seconds)
+    finally:
+        if reader:
+            reader.kill()
+            reader.wait()
+    times.sort()
+    print(
+        f'  {label:<24} покупок {len(times):6}   p50 {statistics.median(times):6.2f} мс   '
+        f'p95 {times[int(len(times) * 0.95)]:7.2f} мс   макс. {times[-1]:8.2f} мс   WAL {wal_size(path):6.1f} МБ'
+    )
+
+
+def timed_under_load(label, fn, repository, seats, user_id):
+    stop = threading.Event()
+
+    def load():
+        while not stop.is_set():
+            sell(repository, seats, user_id, 0.1)
+
+    thread = threading.Thread(target=load)
+    thread.start()
+    try:
+        start = time.perf_counter()
+        fn()
+        print(f'  {label:<24} {time.perf_counter() - start:6.2f} с')
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run(path, tmp, seconds):
+    pool = ConnectionPool(path)
+    repository = CinemaRepository(pool)
+    with pool.connection() as conn:
+        tickets = conn.execute('SELECT COUNT(*) FROM tickets').fetchone()[0]
+        first_showtime, showtimes = conn.execute('SELECT MIN(id), COUNT(*) FROM showtimes').fetchone()
+        user_id = conn.execute('SELECT MIN(id) FROM users').fetchone()[0]
+    seats = free_seats(first_showtime, showtimes)
+    replica_path = os.path.join(tmp, 'replica.db')
+    replica = Replica(path, replica_path)
+    replica.refresh()
+
+    print(f'билетов {tickets}, продажи по {seconds} с')
+    scenario('без отчёта', path, None, repository, seats, user_id, seconds)
+    scenario('отчёт по основной базе', path, path, repository, seats, user_id, seconds)
+    scenario('отчёт по реплике', path, replica_path, repository, seats, user_id, seconds)
+
+    print('копирование под продажами:')
+    timed_under_load(
+        'резервная копия', lambda: snapshot(os.path.join(tmp, 'backup.db'), path), repository, seats, user_id,
+    )
+    timed_under_load('обновление реплики', lambda: replica.refresh(force=True), repository, seats, user_id)
+    replica.stop()
+    pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=1000000)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--db', help='заполненная база (создаётся, если её нет); покупки дописываются в неё')
+    parser.add_argument('--reader', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.reader:
+        report_loop(args.reader)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, 'cinema.db')
+        fresh = not os.path.exists(path)
+        pool = ConnectionPool(path)
+        initialize_database(pool)
+        if fresh:
+            seed(pool, args.tickets)
+        pool.close()
+        run(path, tmp, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# Отчёт о выручке и заполняемости (reports.build_report): порции билетов
+# сворачиваются numpy.bincount, сводки - группировки pandas. Для сравнения
+# те же суммы по сеансам и дням считаются циклом Python по строкам и
+# GROUP BY в SQLite; итоги всех трёх способов сверяются.
+#
+# Запуск: python benchmarks/bench_reports.py [--tickets 10000000] [--db seeded.db]
+# С --db база заполняется один раз и переиспользуется при следующих запусках.
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import ConnectionPool, initialize_database
+from reports import UNIX_EPOCH_JULIAN_DAY, build_report
+from seed import seed
+
+SQL_ROWS = f'''
+    SELECT showtime_id, price, CAST(julianday(purchase_date) - {UNIX_EPOCH_JULIAN_DAY} AS INTEGER) FROM tickets
+    UNION ALL
+    SELECT showtime_id, price, CAST(julianday(purchase_date) - {UNIX_EPOCH_JULIAN_DAY} AS INTEGER) FROM archived_tickets
+'''
+SQL_GROUP_BY_SHOWTIME = '''
+    SELECT showtime_id, COUNT(*), SUM(COALESCE(price, 0)) FROM (
+        SELECT showtime_id, price FROM tickets UNION ALL SELECT showtime_id, price FROM archived_tickets
+    )
+    GROUP BY showtime_id
+'''
+SQL_GROUP_BY_DAY = '''
+    SELECT date(purchase_date), COUNT(*), SUM(COALESCE(price, 0)) FROM (
+        SELECT purchase_date, price FROM tickets UNION ALL SELECT purchase_date, price FROM archived_tickets
+    )
+    GROUP BY date(purchase_date)
+'''
+
+
+def row_loop(pool):
+    sold = defaultdict(int)
+    revenue = defaultdict(int)
+    days = defaultdict(int)
+    with pool.connection() as conn:
+        for showtime_id, price, day in conn.execute(SQL_ROWS):
+            sold[showtime_id] += 1
+            revenue[showtime_id] += price or 0
+            days[day] += price or 0
+    return sum(sold.values()), sum(revenue.values())
+
+
+def group_by(pool):
+    with pool.connection() as conn:
+        showtimes = conn.execute(SQL_GROUP_BY_SHOWTIME).fetchall()
+        conn.execute(SQL_GROUP_BY_DAY).fetchall()
+    return sum(row[1] for row in showtimes), sum(row[2] for row in showtimes)
+
+
+def vectorized(pool):
+    report = build_report(pool)
+    return report.sold, report.revenue
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def run(pool, tickets):
+    print(f'билетов {tickets}')
+    for label, fn, args in (
+        ('цикл по строкам', row_loop, ()),
+        ('GROUP BY SQLite', group_by, ()),
+        ('NumPy/pandas', vectorized, ()),
+    ):
+        seconds, (sold, revenue) = timed(fn, pool, *args)
+        print(f'  {label:<16} {seconds:7.2f} с   продано {sold}, выручка {revenue}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=10000000)
+    parser.add_argument('--db', help='заполненная база (создаётся, если её нет)')
+    args = parser.parse_args()
+
+    if args.db:
+        fresh = not os.path.exists(args.db)
+        pool = ConnectionPool(args.db)
+        initialize_database(pool)
+        if fresh:
+            seed(pool, args.tickets)
+        with pool.connection() as conn:
+            tickets = conn.execute('SELECT COUNT(*) FROM tickets').fetchone()[0]
+        run(pool, tickets)
+        pool.close()
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = ConnectionPool(os.path.join(tmp, 'cinema.db'))
+        initialize_database(pool)
+        seed(pool, args.tickets)
+        run(pool, args.tickets)
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
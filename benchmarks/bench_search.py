@@ -0,0 +1,91 @@
+# Поиск пользователей: первая страница поиска по префиксу через FTS5
+# (users_page с search) против LIKE по всем строкам users.
+#
+# Запуск: python benchmarks/bench_search.py [--users 1000000]
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import CinemaRepository, ConnectionPool, initialize_database
+
+BATCH_SIZE = 100000
+PAGE_SIZE = 200
+SAMPLES = 200
+
+FIRST_NAMES = ['Иван', 'Пётр', 'Анна', 'Мария', 'Олег', 'Елена', 'Сергей', 'Ольга', 'Дмитрий', 'Наталья']
+LAST_NAMES = ['Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов', 'Новиков']
+
+SQL_LIKE = '''
+    SELECT id, full_name, username, phone, email, birth_date, role FROM users
+    WHERE full_name LIKE ? OR username LIKE ? OR email LIKE ? OR phone LIKE ?
+    ORDER BY id LIMIT ?
+'''
+
+
+def user_rows(start, count):
+    for i in range(start, start + count):
+        name = f'{LAST_NAMES[i % len(LAST_NAMES)]} {FIRST_NAMES[i // 7 % len(FIRST_NAMES)]}'
+        yield name, f'user{i}', 'x', f'+7{9000000000 + i}', f'user{i}@example.com'
+
+
+def seed(pool, users):
+    with pool.transaction() as conn:
+        for offset in range(0, users, BATCH_SIZE):
+            conn.executemany(
+                "INSERT INTO users (full_name, username, password, phone, email, role) VALUES (?, ?, ?, ?, ?, 'user')",
+                user_rows(offset, min(BATCH_SIZE, users - offset)),
+            )
+
+
+def percentiles(fn, queries):
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return statistics.median(times), times[int(len(times) * 0.95)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = ConnectionPool(os.path.join(tmp, 'cinema.db'))
+        initialize_database(pool)
+        start = time.perf_counter()
+        seed(pool, args.users)
+        print(f'пользователей: {args.users}, заполнение с индексом FTS5: {time.perf_counter() - start:.1f} с')
+
+        repository = CinemaRepository(pool)
+        rng = random.Random(1)
+        # Ввод по буквам: префиксы фамилий, логинов и телефонов разной длины
+        queries = []
+        for _ in range(SAMPLES):
+            word = rng.choice([rng.choice(LAST_NAMES), f'user{rng.randrange(args.users)}', f'79{rng.randrange(10 ** 6)}'])
+            queries.append(word[:rng.randint(2, len(word))])
+
+        fts = percentiles(lambda query: repository.users_page(0, PAGE_SIZE, query), queries)
+
+        def like(query):
+            with pool.connection() as conn:
+                pattern = f'%{query}%'
+                conn.execute(SQL_LIKE, (pattern, pattern, pattern, pattern, PAGE_SIZE)).fetchall()
+
+        scan = percentiles(like, queries[:20])
+        pool.close()
+
+    print(f'FTS5 префикс:  p50 {fts[0]:8.2f} мс   p95 {fts[1]:8.2f} мс')
+    print(f'LIKE по users: p50 {scan[0]:8.2f} мс   p95 {scan[1]:8.2f} мс')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# Задержка загрузки схемы мест и покупки билета по мере роста таблицы tickets.
+# С индексом idx_tickets_showtime_seat время должно оставаться постоянным.
+#
+# Запуск: python benchmarks/bench_seat_lookup.py [--tickets 10000000] [--checkpoints 5]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import CinemaRepository, ConnectionPool, initialize_database
+
+SEATS_PER_SHOWTIME = 50
+BATCH_SIZE = 100000
+SAMPLES = 2000
+
+
+def ticket_rows(first_id, count):
+    for ticket_id in range(first_id, first_id + count):
+        showtime_id, seat = divmod(ticket_id, SEATS_PER_SHOWTIME)
+        yield 2, showtime_id + 1, f'{seat // 10 + 1}-{seat % 10 + 1}', '2024-11-26'
+
+
+def add_showtimes(pool, count):
+    # Билеты ссылаются на сеансы через внешний ключ, поэтому сеансы создаются заранее
+    with pool.transaction() as conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO showtimes (id, film_id, hall_id, start_ts) VALUES (?, 1, 1, '2024-11-26 18:00')",
+            ((showtime_id,) for showtime_id in range(1, count + 1)),
+        )
+
+
+def fill(pool, start, stop):
+    with pool.transaction() as conn:
+        for offset in range(start, stop, BATCH_SIZE):
+            conn.executemany(
+                'INSERT INTO tickets (user_id, showtime_id, seat_number, purchase_date) VALUES (?, ?, ?, ?)',
+                ticket_rows(offset, min(BATCH_SIZE, stop - offset)),
+            )
+
+
+def measure(repository, total, next_showtime_id):
+    showtimes = max(total // SEATS_PER_SHOWTIME, 1)
+
+    start = time.perf_counter()
+    for _ in range(SAMPLES):
+        repository.occupied_seats(random.randint(1, showtimes))
+    lookup = (time.perf_counter() - start) / SAMPLES
+
+    # Покупка занятого места должна отклоняться так же быстро, как и свободного
+    start = time.perf_counter()
+    for _ in range(SAMPLES):
+        repository.purchase_ticket(2, random.randint(1, showtimes), '1-1')
+    conflict = (time.perf_counter() - start) / SAMPLES
+
+    start = time.perf_counter()
+    for i in range(SAMPLES):
+        repository.purchase_ticket(2, next_showtime_id + i // SEATS_PER_SHOWTIME, f'x-{i}')
+    purchase = (time.perf_counter() - start) / SAMPLES
+    return lookup, conflict, purchase
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=10000000)
+    parser.add_argument('--checkpoints', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = ConnectionPool(os.path.join(tmp, 'cinema.db'))
+        initialize_database(pool)
+        repository = CinemaRepository(pool)
+        add_showtimes(pool, args.tickets // SEATS_PER_SHOWTIME + 10 + args.checkpoints * (SAMPLES // SEATS_PER_SHOWTIME + 1))
+
+        print(f'{"билетов":>12} {"схема мест":>12} {"конфликт":>12} {"покупка":>12}')
+        filled = 0
+        # Покупки в замерах идут в сеансы за пределами заполненного диапазона
+        next_showtime_id = args.tickets // SEATS_PER_SHOWTIME + 10
+        for step in range(1, args.checkpoints + 1):
+            target = args.tickets * step // args.checkpoints
+            fill(pool, filled, target)
+            filled = target
+            lookup, conflict, purchase = measure(repository, filled, next_showtime_id)
+            next_showtime_id += SAMPLES // SEATS_PER_SHOWTIME + 1
+            print(f'{filled:>12} {lookup * 1e6:>9.1f} мкс {conflict * 1e6:>9.1f} мкс {purchase * 1e6:>9.1f} мкс')
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
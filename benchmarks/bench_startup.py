@@ -0,0 +1,108 @@
+# Холодный старт интерфейса: время импорта main по python -X importtime
+# (самые дорогие модули) и время от запуска процесса до первого кадра окна
+# входа с QT_QPA_PLATFORM=offscreen, на новой базе и на заполненной seed.py.
+#
+# Запуск: python benchmarks/bench_startup.py [--tickets 1000000] [--runs 5] [--top 15]
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import ConnectionPool, initialize_database
+from seed import seed
+
+# Дочерний процесс: окно входа и выход после первой отрисовки. Событие Paint
+# приходит до рисования, поэтому время фиксируется на следующем витке цикла
+FIRST_FRAME = '''
+import sys
+sys.path.insert(0, {root!r})
+from PyQt6 import QtCore, QtWidgets
+import main
+
+class FirstFrame(QtCore.QObject):
+    def eventFilter(self, watched, event):
+        if event.type() == QtCore.QEvent.Type.Paint:
+            watched.removeEventFilter(self)
+            QtCore.QTimer.singleShot(0, app.quit)
+        return False
+
+app = QtWidgets.QApplication([])
+window = main.CinemaApp()
+first_frame = FirstFrame()
+window.login_screen.installEventFilter(first_frame)
+window.show()
+app.exec()
+print('frame', flush=True)
+'''
+
+
+def child_env():
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    for name in ('CINEMA_SERVER', 'CINEMA_PROFILE', 'CINEMA_CPROFILE'):
+        env.pop(name, None)
+    return env
+
+
+def import_times(cwd):
+    # (собственное, накопленное время в мкс, модуль) из python -X importtime
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import sys; sys.path.insert(0, {ROOT!r}); import main'],
+        cwd=cwd, env=child_env(), capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(own), int(cumulative), name.strip()))
+    return rows
+
+
+def first_frame(cwd):
+    # Время от запуска интерпретатора до первого кадра, мс
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, '-c', FIRST_FRAME.format(root=ROOT)],
+        cwd=cwd, env=child_env(), capture_output=True, text=True, check=True,
+    )
+    return (time.perf_counter() - start) * 1000
+
+
+def measure(label, cwd, runs, top):
+    frames = [first_frame(cwd) for _ in range(runs)]
+    rows = import_times(cwd)
+    main_row = next(row for row in rows if row[2] == 'main')
+    print(f'{label}: первый кадр p50 {statistics.median(frames):7.1f} мс (мин {min(frames):.1f}), '
+          f'импорт main {main_row[1] / 1000:6.1f} мс')
+    for own, cumulative, name in sorted(rows, key=lambda row: row[0], reverse=True)[:top]:
+        print(f'    {own / 1000:7.1f} мс собств. {cumulative / 1000:7.1f} мс всего  {name}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=1000000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Первый запуск создаёт базу, остальные открывают уже готовую
+        print(f'первый запуск с созданием базы: {first_frame(tmp):.1f} мс')
+        measure('пустая база', tmp, args.runs, args.top)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = ConnectionPool(os.path.join(tmp, 'cinema.db'))
+        initialize_database(pool)
+        seed(pool, args.tickets)
+        pool.close()
+        measure(f'база на {args.tickets} билетов', tmp, args.runs, args.top)
+
+
+if __name__ == '__main__':
+    main()
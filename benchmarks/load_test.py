@@ -0,0 +1,370 @@
+# Нагрузочный тест ядра бронирования без интерфейса. Для каждого масштаба
+# база заполняется seed.py, затем замеряются задержки входа, списка сеансов,
+# схемы зала, покупки одного места и группы мест рядом, выгрузки. N касс в
+# отдельных процессах одновременно раскупают одни и те же сеансы, что даёт
+# пропускную способность и долю конфликтов. Интерфейс замеряется в дочернем процессе с
+# QT_QPA_PLATFORM=offscreen через profiling. Результат - JSON; с --baseline
+# он сравнивается с прошлым прогоном, и при росте p95 код выхода 1.
+# Быстрые замеры тех же операций на малой базе - tests/test_benchmarks.py.
+#
+# Запуск: python benchmarks/load_test.py [--scales 10000,100000,1000000]
+#         [--cashiers 8] [--rounds 20] [--out results.json] [--baseline old.json]
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth import AuthCache, shutdown_pool
+from core import BookingService
+from database import CinemaRepository, ConnectionPool, initialize_database
+from export import export_ticket_stats
+from seatmap import OCCUPANCY_CACHE_SIZE
+from seed import HALL_COLS, HALL_ROWS, SEED_PASSWORD, TICKETS_PER_SHOWTIME, seat_label, seed
+
+SAMPLES = 500
+LOGIN_SAMPLES = 32
+PAGE_SIZE = 200
+# Размер группы при покупке нескольких мест рядом
+GROUP_SIZE = 4
+UI_SAMPLES = 20
+UI_TIMEOUT = 30
+
+
+def latency(fn, args_list):
+    # Задержка каждого вызова fn(*args) в мс: процентили по всем вызовам
+    times = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        times.append((time.perf_counter() - start) * 1000)
+    return summarize(times)
+
+
+def summarize(times):
+    if not times:
+        return {'n': 0}
+    times = sorted(times)
+    return {
+        'n': len(times),
+        'p50_ms': statistics.median(times),
+        'p95_ms': times[min(int(len(times) * 0.95), len(times) - 1)],
+        'mean_ms': statistics.fmean(times),
+        'max_ms': times[-1],
+    }
+
+
+def measure_core(pool, counts, rng):
+    service = BookingService(CinemaRepository(pool), auth_cache=AuthCache())
+    showtimes = range(counts['first_showtime'], counts['first_showtime'] + counts['showtimes'])
+    users = [f'load{counts["first_user"] + i}' for i in rng.sample(range(counts['users']), LOGIN_SAMPLES)]
+    now = datetime.now().strftime('%Y-%m-%d %H:%M')
+    until = (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d')
+    results = {}
+
+    service.authenticate('missing', SEED_PASSWORD)  # запуск пула процессов scrypt
+    results['login_cold'] = latency(service.authenticate, [(user, SEED_PASSWORD) for user in users])
+    results['login_cached'] = latency(service.authenticate, [(user, SEED_PASSWORD) for user in users] * 20)
+
+    results['session_list'] = latency(service.showtimes_page, [((now, 0), PAGE_SIZE, until)] * SAMPLES)
+    titles = [f'Нагрузочный {rng.randrange(counts["films"])}' for _ in range(SAMPLES)]
+    results['session_search'] = latency(
+        lambda title: service.showtimes_page((now, 0), PAGE_SIZE, until, search=title), [(t,) for t in titles],
+    )
+
+    def seat_map_cold(showtime_id):
+        service.repository.occupancy_cache.invalidate(showtime_id)
+        service.occupancy(showtime_id)
+
+    picks = [(rng.choice(showtimes),) for _ in range(SAMPLES)]
+    results['seat_map_cold'] = latency(seat_map_cold, picks)
+    # Повторное открытие схемы: сеансов не больше, чем помещается в кэш
+    warm = [(showtime_id,) for showtime_id in rng.sample(showtimes, min(len(showtimes), OCCUPANCY_CACHE_SIZE // 2))]
+    latency(service.occupancy, warm)
+    results['seat_map_cached'] = latency(service.occupancy, [rng.choice(warm) for _ in range(SAMPLES)])
+
+    # Покупки на свободные места: у каждого сеанса проданы первые TICKETS_PER_SHOWTIME мест
+    seats = rng.sample(
+        [(showtime_id, index) for showtime_id in rng.sample(showtimes, min(len(showtimes), 50))
+         for index in range(TICKETS_PER_SHOWTIME, HALL_ROWS * HALL_COLS)],
+        SAMPLES,
+    )
+    results['purchase'] = latency(
+        service.purchase_ticket, [(counts['first_user'], showtime_id, seat_label(index)) for showtime_id, index in seats],
+    )
+
+    # Группа: поиск GROUP_SIZE мест рядом по схеме из кэша и их покупка одной транзакцией
+    groups = [(rng.choice(showtimes),) for _ in range(SAMPLES)]
+    occupancies = [(service.occupancy(showtime_id),) for showtime_id, in groups]
+    results['seat_search'] = latency(lambda occupancy: occupancy.find_adjacent(GROUP_SIZE), occupancies)
+
+    def group_purchase(showtime_id):
+        seats = service.occupancy(showtime_id).find_adjacent(GROUP_SIZE)
+        service.purchase_seats(counts['first_user'], showtime_id, [seat_label(index) for index in seats])
+
+    results['group_purchase'] = latency(group_purchase, groups)
+    return results
+
+
+def measure_export(pool, tmp):
+    path = os.path.join(tmp, 'stats.csv')
+    start = time.perf_counter()
+    written = export_ticket_stats(pool, path)
+    elapsed = time.perf_counter() - start
+    os.remove(path)
+    return {'rows': written, 'seconds': elapsed, 'rows_per_s': written / elapsed if elapsed else 0.0}
+
+
+def cashier(db_path, showtime_ids, user_id, seed_value, barrier, results):
+    # Касса в своём процессе: берёт случайное свободное место по своей схеме
+    # зала и покупает его, пока в зале есть свободные места
+    pool = ConnectionPool(db_path, size=1)
+    service = BookingService(CinemaRepository(pool))
+    rng = random.Random(seed_value)
+    attempts = conflicts = errors = 0
+    times = []
+    barrier.wait()
+    for showtime_id in showtime_ids:
+        while True:
+            occupancy = service.occupancy(showtime_id)
+            free = [i for i in range(occupancy.hall.seat_count) if not occupancy.is_taken(i)]
+            if not free:
+                break
+            start = time.perf_counter()
+            try:
+                purchased = service.purchase_ticket(user_id, showtime_id, occupancy.hall.seat_label(rng.choice(free)))
+            except sqlite3.OperationalError:
+                # database is locked: ожидание записи дольше busy_timeout
+                errors += 1
+                continue
+            finally:
+                times.append((time.perf_counter() - start) * 1000)
+                attempts += 1
+            if not purchased:
+                conflicts += 1
+                # Чужая покупка не сбрасывает кэш этого процесса
+                service.repository.occupancy_cache.invalidate(showtime_id)
+    pool.close()
+    results.put((attempts, conflicts, errors, times))
+
+
+def measure_cashiers(db_path, counts, cashiers, rounds):
+    pool = ConnectionPool(db_path)
+    with pool.transaction() as conn:
+        base = conn.execute('SELECT MAX(id) FROM showtimes').fetchone()[0]
+        conn.executemany(
+            "INSERT INTO showtimes (id, film_id, hall_id, start_ts) VALUES (?, 1, ?, '2030-01-01 12:00')",
+            ((base + i + 1, counts['hall_id']) for i in range(rounds)),
+        )
+    pool.close()
+    showtime_ids = [base + i + 1 for i in range(rounds)]
+
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(cashiers + 1)
+    results = context.Queue()
+    processes = [
+        context.Process(target=cashier, args=(db_path, showtime_ids, counts['first_user'] + i, i, barrier, results))
+        for i in range(cashiers)
+    ]
+    for process in processes:
+        process.start()
+    barrier.wait()
+    start = time.perf_counter()
+    collected = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.join()
+
+    attempts = sum(item[0] for item in collected)
+    conflicts = sum(item[1] for item in collected)
+    errors = sum(item[2] for item in collected)
+    sold = attempts - conflicts - errors
+    return {
+        'cashiers': cashiers,
+        'showtimes': rounds,
+        'seats': rounds * HALL_ROWS * HALL_COLS,
+        'sold': sold,
+        'attempts': attempts,
+        'conflict_rate': conflicts / attempts if attempts else 0.0,
+        'lock_errors': errors,
+        'purchases_per_s': sold / elapsed if elapsed else 0.0,
+        'purchase': summarize([t for item in collected for t in item[3]]),
+    }
+
+
+def measure_ui(tmp):
+    # main.py работает с cinema.db в текущем каталоге, поэтому дочерний
+    # процесс запускается в каталоге с базой
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen', CINEMA_PROFILE='1')
+    env.pop('CINEMA_SERVER', None)
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child-ui'],
+        cwd=tmp, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    operations = json.loads(output.strip().splitlines()[-1])
+    return {
+        row['name']: {'n': row['count'], 'p50_ms': row['p50_ms'], 'p95_ms': row['p95_ms'], 'max_ms': row['max_ms']}
+        for row in operations if row['name'].startswith('ui.')
+    }
+
+
+def child_ui():
+    # Проход кассира по экранам: список сеансов, схема зала, назад; админка
+    import profiling
+    from PyQt6 import QtWidgets
+
+    import main
+    from workers import get_runner
+
+    app = QtWidgets.QApplication([])
+    window = main.CinemaApp()
+    window.show()
+    with main.get_pool().connection() as conn:
+        window.current_user = conn.execute(
+            "SELECT id, full_name, username, NULL, phone, email, birth_date, role FROM users WHERE role = 'admin'"
+        ).fetchone()
+
+    def wait_for(condition):
+        deadline = time.monotonic() + UI_TIMEOUT
+        while not condition():
+            if time.monotonic() > deadline:
+                raise TimeoutError('интерфейс не ответил вовремя')
+            get_runner().wait(10)
+            app.processEvents()
+        app.processEvents()
+
+    sessions = window.session_screen
+    seats = window.purchase_screen.seat_map
+    for _ in range(UI_SAMPLES):
+        window.central_widget.setCurrentWidget(sessions)
+        wait_for(lambda: sessions.model.rowCount() > 0)
+        window.selected_movie_id = sessions.model.row_key(random.randrange(sessions.model.rowCount()))
+        seats.occupancy = None
+        window.central_widget.setCurrentWidget(window.purchase_screen)
+        wait_for(lambda: seats.occupancy is not None)
+        seats.repaint()
+    window.central_widget.setCurrentWidget(window.admin_screen)
+    wait_for(lambda: window.admin_screen.sessions_model.rowCount() > 0)
+    window.close()
+    print(json.dumps(profiling.snapshot()))
+
+
+def run_scale(tickets, args):
+    rng = random.Random(tickets)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'cinema.db')
+        pool = ConnectionPool(db_path)
+        initialize_database(pool)
+        start = time.perf_counter()
+        counts = seed(pool, tickets)
+        result = {'scale': counts, 'seed_seconds': time.perf_counter() - start}
+        report(f'билетов {tickets}: заполнение {result["seed_seconds"]:.1f} с')
+
+        result['latency'] = measure_core(pool, counts, rng)
+        for name, stats in result['latency'].items():
+            report(f'  {name:16} p50 {stats["p50_ms"]:9.3f} мс   p95 {stats["p95_ms"]:9.3f} мс')
+        if not args.skip_export:
+            result['export'] = measure_export(pool, tmp)
+            report(f'  export           {result["export"]["rows_per_s"]:9.0f} строк/с')
+        pool.close()
+
+        if args.cashiers:
+            result['cashiers'] = measure_cashiers(db_path, counts, args.cashiers, args.rounds)
+            cashiers = result['cashiers']
+            report(f'  кассы x{cashiers["cashiers"]}: {cashiers["purchases_per_s"]:.0f} покупок/с, '
+                   f'конфликтов {cashiers["conflict_rate"]:.1%}, p95 {cashiers["purchase"]["p95_ms"]:.2f} мс')
+        if not args.skip_ui:
+            result['ui'] = measure_ui(tmp)
+            for name, stats in sorted(result['ui'].items()):
+                report(f'  {name:28} p50 {stats["p50_ms"]:9.3f} мс   p95 {stats["p95_ms"]:9.3f} мс')
+    return result
+
+
+def metrics(result):
+    # Сравниваемые метрики прогона: имя -> p95, мс
+    found = {f'latency.{name}': stats['p95_ms'] for name, stats in result.get('latency', {}).items()}
+    found.update({name: stats['p95_ms'] for name, stats in result.get('ui', {}).items()})
+    if 'cashiers' in result:
+        found['cashiers.purchase'] = result['cashiers']['purchase']['p95_ms']
+    return found
+
+
+def compare(results, baseline, tolerance, min_delta):
+    # Метрики, у которых p95 вырос больше чем на долю tolerance относительно
+    # baseline и при этом больше чем на min_delta мс: доли миллисекунды - шум
+    previous = {run['scale']['tickets']: metrics(run) for run in baseline['runs']}
+    regressions = []
+    for run in results['runs']:
+        old = previous.get(run['scale']['tickets'], {})
+        for name, value in metrics(run).items():
+            if name in old and value - old[name] > max(old[name] * tolerance, min_delta):
+                regressions.append({
+                    'tickets': run['scale']['tickets'], 'metric': name,
+                    'baseline_p95_ms': old[name], 'p95_ms': value,
+                })
+    return regressions
+
+
+def report(line):
+    print(line, file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест ядра бронирования')
+    parser.add_argument('--scales', default='10000,100000,1000000',
+                        help='числа билетов через запятую, например 10000,100000,1000000,10000000')
+    parser.add_argument('--cashiers', type=int, default=8, help='процессов-касс (0 - без теста касс)')
+    parser.add_argument('--rounds', type=int, default=20, help='сеансов, которые раскупают кассы')
+    parser.add_argument('--skip-export', action='store_true')
+    parser.add_argument('--skip-ui', action='store_true')
+    parser.add_argument('--out', help='файл для результатов JSON (по умолчанию - stdout)')
+    parser.add_argument('--baseline', help='прошлый результат JSON для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='допустимый рост p95, доля')
+    parser.add_argument('--min-delta', type=float, default=0.1, help='рост p95 меньше стольких мс не считается')
+    parser.add_argument('--child-ui', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_ui:
+        child_ui()
+        return
+
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'runs': [run_scale(int(tickets), args) for tickets in args.scales.split(',')],
+    }
+    shutdown_pool()
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            results['regressions'] = compare(results, json.load(file), args.tolerance, args.min_delta)
+        for item in results['regressions']:
+            report(f'регрессия: {item["tickets"]} билетов, {item["metric"]}: '
+                   f'p95 {item["baseline_p95_ms"]:.3f} -> {item["p95_ms"]:.3f} мс')
+        exit_code = 1 if results['regressions'] else 0
+
+    data = json.dumps(results, ensure_ascii=False, indent=1)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as file:
+            file.write(data)
+    else:
+        print(data)
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
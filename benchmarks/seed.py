@@ -0,0 +1,147 @@
+# Синтетические данные для нагрузочных тестов: фильмы, сеансы, пользователи
+# и билеты. Масштаб задаётся числом билетов (от 10 тыс. до 10 млн), остальное
+# выводится из него. Сеансы идут в большом зале и лежат в окне от 90 дней
+# назад до 30 дней вперёд, поэтому есть и прошедшие, и ближайшие. У всех
+# пользователей пароль SEED_PASSWORD. Базовые цены сеансов чередуются из
+# SHOWTIME_PRICES, у зала есть зоны SEAT_ZONES, цена билета вычисляется
+# тем же выражением, что и при продаже.
+#
+# Запуск: python benchmarks/seed.py [--tickets 1000000] [--db cinema.db]
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auth import hash_password
+from database import DB_PATH, ConnectionPool, initialize_database, ticket_price_sql
+
+SEED_PASSWORD = 'secret'
+HALL_ROWS = 20
+HALL_COLS = 25
+# Проданная часть зала: остальные места остаются для покупок в тестах
+TICKETS_PER_SHOWTIME = 100
+SHOWTIMES_PER_FILM = 50
+TICKETS_PER_USER = 20
+PAST_DAYS = 90
+FUTURE_DAYS = 30
+BATCH_SIZE = 100000
+SHOWTIME_PRICES = (300, 350, 400, 450)
+# (название, первый ряд, последний ряд, коэффициент)
+SEAT_ZONES = (('Первые ряды', 1, 3, 0.8), ('Центр', 8, 14, 1.25))
+
+SQL_SEED_TICKET = f'''
+    INSERT INTO tickets (user_id, showtime_id, seat_number, purchase_date, price)
+    VALUES (?1, ?2, ?3, ?4, {ticket_price_sql('?2', '?3')})
+'''
+
+
+def scale(tickets):
+    # Число фильмов, сеансов и пользователей для заданного числа билетов
+    showtimes = max(tickets // TICKETS_PER_SHOWTIME, 10)
+    return {
+        'tickets': tickets,
+        'showtimes': showtimes,
+        'films': max(showtimes // SHOWTIMES_PER_FILM, 10),
+        'users': max(tickets // TICKETS_PER_USER, 100),
+    }
+
+
+def seat_label(index):
+    return f'{index // HALL_COLS + 1}-{index % HALL_COLS + 1}'
+
+
+def _batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed(pool, tickets, progress=None):
+    # Дописывает данные к базе pool; возвращает счётчики и id первого сеанса и пользователя.
+    # progress(stage) вызывается перед каждым этапом
+    counts = scale(tickets)
+    first = datetime.now().replace(second=0, microsecond=0) - timedelta(days=PAST_DAYS)
+    step = timedelta(days=PAST_DAYS + FUTURE_DAYS) / counts['showtimes']
+    password = hash_password(SEED_PASSWORD)
+    with pool.transaction() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        hall_id = conn.execute(
+            "INSERT INTO halls (name, rows, cols) VALUES ('Большой зал', ?, ?)", (HALL_ROWS, HALL_COLS),
+        ).lastrowid
+        conn.executemany(
+            'INSERT INTO seat_zones (hall_id, name, first_row, last_row, multiplier) VALUES (?, ?, ?, ?, ?)',
+            [(hall_id, *zone) for zone in SEAT_ZONES],
+        )
+        film_base = conn.execute('SELECT COALESCE(MAX(id), 0) FROM films').fetchone()[0]
+        showtime_base = conn.execute('SELECT COALESCE(MAX(id), 0) FROM showtimes').fetchone()[0]
+        user_base = conn.execute('SELECT COALESCE(MAX(id), 0) FROM users').fetchone()[0]
+
+        if progress:
+            progress('films')
+        conn.executemany(
+            'INSERT INTO films (id, title, description) VALUES (?, ?, ?)',
+            ((film_base + i + 1, f'Нагрузочный фильм {film_base + i + 1}', 'Описание для нагрузочного теста')
+             for i in range(counts['films'])),
+        )
+        if progress:
+            progress('showtimes')
+        for batch in _batches(
+            (showtime_base + i + 1, film_base + i % counts['films'] + 1, hall_id,
+             (first + step * i).strftime('%Y-%m-%d %H:%M'), SHOWTIME_PRICES[i % len(SHOWTIME_PRICES)])
+            for i in range(counts['showtimes'])
+        ):
+            conn.executemany(
+                'INSERT INTO showtimes (id, film_id, hall_id, start_ts, base_price) VALUES (?, ?, ?, ?, ?)', batch,
+            )
+        if progress:
+            progress('users')
+        for batch in _batches(
+            (user_base + i + 1, f'Пользователь {i}', f'load{user_base + i + 1}', password,
+             f'+7{9000000000 + i}', f'load{i}@example.com')
+            for i in range(counts['users'])
+        ):
+            conn.executemany(
+                "INSERT INTO users (id, full_name, username, password, phone, email, role) "
+                "VALUES (?, ?, ?, ?, ?, ?, 'user')",
+                batch,
+            )
+        if progress:
+            progress('tickets')
+        # Билеты сеанса занимают первые места зала; куплены за несколько часов до сеанса
+        for batch in _batches(
+            (user_base + i * 7919 % counts['users'] + 1, showtime_base + i // TICKETS_PER_SHOWTIME + 1,
+             seat_label(i % TICKETS_PER_SHOWTIME),
+             (first + step * (i // TICKETS_PER_SHOWTIME) - timedelta(minutes=3 * (i % TICKETS_PER_SHOWTIME) + 1))
+             .strftime('%Y-%m-%d %H:%M:%S'))
+            for i in range(tickets)
+        ):
+            conn.executemany(SQL_SEED_TICKET, batch)
+    counts.update(hall_id=hall_id, first_showtime=showtime_base + 1, first_user=user_base + 1)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Заполнение базы синтетическими данными')
+    parser.add_argument('--tickets', type=int, default=1000000)
+    parser.add_argument('--db', default=DB_PATH)
+    args = parser.parse_args()
+
+    pool = ConnectionPool(args.db)
+    initialize_database(pool)
+    start = time.perf_counter()
+    counts = seed(pool, args.tickets, progress=lambda stage: print(f'{stage}...', file=sys.stderr))
+    pool.close()
+    print(f'{args.db}: фильмов {counts["films"]}, сеансов {counts["showtimes"]}, '
+          f'пользователей {counts["users"]}, билетов {counts["tickets"]} за {time.perf_counter() - start:.1f} с')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+import http.client
+import json
+import select
+import threading
+from urllib.parse import urlsplit
+
+import profiling
+from core import ERRORS, ServiceError, hall_from_json, occupancy_from_json
+
+# Сколько ждать отчёта о выручке, секунд: сервер считает его по всем билетам
+REPORT_TIMEOUT = 600
+# Вызовы, которые можно отправить повторно, если ответ не пришёл: чтения и
+# брони (повторная бронь той же сессией только продлевает её). Покупки и
+# правки не повторяются - сервер мог провести их до обрыва связи
+RETRY_METHODS = {
+    'authenticate', 'showtimes_page', 'sessions_full_page', 'users_page', 'list_films', 'list_halls', 'occupancy',
+    'latest_change', 'changes_since', 'ticket_history_page', 'seat_prices', 'refresh_stats', 'showtime_stats_page',
+    'daily_stats_page', 'film_stats_page', 'ticket_stats_page', 'count_ticket_stats', 'revenue_report',
+    'hold_seat', 'release_seat',
+}
+
+
+# Клиент сервера бронирования (server.py) с тем же набором методов, что
+# у core.BookingService. Соединение HTTP/1.1 держится открытым, у каждого
+# потока своё, так как вызовы идут из фоновых задач. Токен сессии, выданный
+# при входе, уходит со всеми вызовами
+class RemoteBookingService:
+    def __init__(self, url, timeout=10):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.token = None
+        # Пользователь сессии: None до входа
+        self.user_id = None
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        elif conn.sock is not None and select.select([conn.sock], [], [], 0)[0]:
+            # Между ответами сокет читается, только если сервер закрыл
+            # простаивающее соединение: запрос уйдёт по новому
+            conn.close()
+        return conn
+
+    def _reset(self, conn):
+        conn.close()
+        self._local.conn = None
+
+    def _post(self, payload, timeout=None, retry=False):
+        # timeout - ожидание ответа для долгого вызова вместо self.timeout.
+        # Запрос, который не удалось отправить, повторяется один раз всегда;
+        # отправленный без ответа - только с retry (см. RETRY_METHODS)
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        headers = {'Content-Type': 'application/json; charset=utf-8'}
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request('POST', '/rpc', body, headers)
+            except (ConnectionError, http.client.HTTPException):
+                # Тело целиком не ушло, и сервер запрос не выполнит
+                self._reset(conn)
+                if attempt:
+                    raise
+                continue
+            try:
+                if timeout is None:
+                    return json.loads(conn.getresponse().read())
+                conn.sock.settimeout(timeout)
+                try:
+                    return json.loads(conn.getresponse().read())
+                finally:
+                    if conn.sock is not None:
+                        conn.sock.settimeout(self.timeout)
+            except (ConnectionError, http.client.HTTPException):
+                self._reset(conn)
+                if attempt or not retry:
+                    raise
+
+    @staticmethod
+    def _unwrap(response):
+        error = response.get('error')
+        if error:
+            raise ERRORS.get(error.get('type'), ServiceError)(error.get('message'))
+        return response.get('result')
+
+    def call(self, method, **params):
+        return self._call(method, params)
+
+    def _call(self, method, params, timeout=None):
+        with profiling.timed(f'rpc.{method}'):
+            payload = {'id': 0, 'method': method, 'params': params, 'token': self.token}
+            return self._unwrap(self._post(payload, timeout, method in RETRY_METHODS))
+
+    def batch(self, calls, return_errors=False):
+        # calls - список (method, params); все запросы уходят одним HTTP-запросом.
+        # С return_errors ошибка вызова возвращается на его месте, а не выбрасывается
+        responses = self._post([
+            {'id': i, 'method': method, 'params': params, 'token': self.token}
+            for i, (method, params) in enumerate(calls)
+        ], retry=all(method in RETRY_METHODS for method, _ in calls))
+        if not return_errors:
+            return [self._unwrap(response) for response in responses]
+        results = []
+        for response in responses:
+            try:
+                results.append(self._unwrap(response))
+            except ServiceError as e:
+                results.append(e)
+        return results
+
+    def authenticate(self, username, password):
+        result = self.call('authenticate', username=username, password=password)
+        if result is None:
+            return None
+        self.token = result['token']
+        self.user_id = result['user'][0]
+        return result['user']
+
+    def register_user(self, full_name, username, password, phone, email, birth_date):
+        self.call(
+            'register_user', full_name=full_name, username=username, password=password,
+            phone=phone, email=email, birth_date=birth_date,
+        )
+
+    def showtimes_page(self, after_key, limit, until, film_id=None, hall_id=None, search=None):
+        return self.call(
+            'showtimes_page', after_key=after_key, limit=limit, until=until, film_id=film_id, hall_id=hall_id,
+            search=search,
+        )
+
+    def sessions_full_page(self, after_id, limit):
+        return self.call('sessions_full_page', after_id=after_id, limit=limit)
+
+    def users_page(self, after_id, limit, search=None):
+        return self.call('users_page', after_id=after_id, limit=limit, search=search)
+
+    def ticket_history_page(self, user_id, after_key, limit):
+        return self.call('ticket_history_page', user_id=user_id, after_key=after_key, limit=limit)
+
+    def list_films(self):
+        return self.call('list_films')
+
+    def list_halls(self):
+        return [hall_from_json(hall) for hall in self.call('list_halls')]
+
+    def latest_change(self):
+        return self.call('latest_change')
+
+    def changes_since(self, seq, limit):
+        return self.call('changes_since', seq=seq, limit=limit)
+
+    def add_session(self, title, description, date, time, hall_id=1, price=None):
+        return self.call(
+            'add_session', title=title, description=description, date=date, time=time, hall_id=hall_id, price=price,
+        )
+
+    def delete_session(self, session_id):
+        self.call('delete_session', session_id=session_id)
+
+    def delete_sessions(self, session_ids):
+        return tuple(self.call('delete_sessions', session_ids=session_ids))
+
+    def archive_sessions(self, session_ids):
+        return tuple(self.call('archive_sessions', session_ids=session_ids))
+
+    def purge_sessions(self, days):
+        return tuple(self.call('purge_sessions', days=days))
+
+    def rebuild_stats(self):
+        self.call('rebuild_stats')
+
+    # Статистика, выгрузка и отчёт читают реплику базы сервера
+    def refresh_stats(self):
+        return self._call('refresh_stats', {}, REPORT_TIMEOUT)
+
+    def showtime_stats_page(self, after_id, limit):
+        return self.call('showtime_stats_page', after_id=after_id, limit=limit)
+
+    def daily_stats_page(self, after_date, limit):
+        return self.call('daily_stats_page', after_date=after_date, limit=limit)
+
+    def film_stats_page(self, after_title, limit):
+        return self.call('film_stats_page', after_title=after_title, limit=limit)
+
+    def ticket_stats_page(self, after_id, limit, date_from=None, date_to=None):
+        return self.call('ticket_stats_page', after_id=after_id, limit=limit, date_from=date_from, date_to=date_to)
+
+    def count_ticket_stats(self, date_from=None, date_to=None):
+        return self.call('count_ticket_stats', date_from=date_from, date_to=date_to)
+
+    def export_ticket_stats(self, path, date_from=None, date_to=None, progress=None):
+        # Файл пишется на кассе, строки приходят с сервера страницами
+        from export import iter_ticket_pages, write_export
+
+        total = self.count_ticket_stats(date_from, date_to) if progress else 0
+        pages = iter_ticket_pages(lambda after_id, limit: self.ticket_stats_page(after_id, limit, date_from, date_to))
+        return write_export(path, pages, total, progress)
+
+    def revenue_report(self, date_from=None, date_to=None, progress=None):
+        # Отчёт считается на сервере одним вызовом, поэтому progress не вызывается
+        from reports import RevenueReport
+
+        return RevenueReport.from_json(
+            self._call('revenue_report', {'date_from': date_from, 'date_to': date_to}, REPORT_TIMEOUT),
+        )
+
+    def occupancy(self, movie_id, owner=None):
+        return occupancy_from_json(self.call('occupancy', movie_id=movie_id, owner=owner))
+
+    def seat_prices(self, movie_id, seats):
+        return self.call('seat_prices', movie_id=movie_id, seats=seats)
+
+    def hold_seat(self, movie_id, seat, owner):
+        return self.call('hold_seat', movie_id=movie_id, seat=seat, owner=owner)
+
+    def release_seat(self, movie_id, seat, owner):
+        self.call('release_seat', movie_id=movie_id, seat=seat, owner=owner)
+
+    def purchase_ticket(self, user_id, movie_id, seat, owner=None):
+        return self.call('purchase_ticket', user_id=user_id, movie_id=movie_id, seat=seat, owner=owner)
+
+    def purchase_seats(self, user_id, movie_id, seats, owner=None):
+        return self.call('purchase_seats', user_id=user_id, movie_id=movie_id, seats=seats, owner=owner)
@@ -0,0 +1,395 @@
+import base64
+import os
+import sqlite3
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from auth import AuthCache, SessionCache, hash_password_pooled, new_session_token, token_digest, verify_password_pooled
+from database import ChangeLog, get_repository
+from events import RESET, SEAT_SOLD, SHOWTIME_REMOVED, ChangeFeed, EventBus
+from holds import SeatHolds
+from replica import get_replica
+from seatmap import Hall, SeatOccupancy
+
+# Идентификатор этой кассы - владелец её временных броней
+TERMINAL_ID = uuid.uuid4().hex
+
+# Результат покупки без связи с сервером: она записана в офлайн-журнал
+# кассы (offline.py) и будет проведена позже
+QUEUED = 'queued'
+
+
+class ServiceError(Exception):
+    pass
+
+
+class DuplicateUsername(ServiceError):
+    pass
+
+
+class InvalidSeat(ServiceError):
+    pass
+
+
+class UnknownSession(ServiceError):
+    pass
+
+
+class NotAuthenticated(ServiceError):
+    pass
+
+
+class AccessDenied(ServiceError):
+    pass
+
+
+# Ошибки, которые сервер передаёт клиенту по имени класса
+ERRORS = {
+    cls.__name__: cls
+    for cls in (ServiceError, DuplicateUsername, InvalidSeat, UnknownSession, NotAuthenticated, AccessDenied)
+}
+
+
+def hall_to_json(hall):
+    return {'id': hall.id, 'name': hall.name, 'rows': hall.rows, 'cols': hall.cols}
+
+
+def hall_from_json(data):
+    return Hall(data['id'], data['name'], data['rows'], data['cols'])
+
+
+def _bits_to_json(bits):
+    return base64.b64encode(bytes(bits)).decode('ascii') if bits is not None else None
+
+
+def _bits_from_json(data):
+    return bytearray(base64.b64decode(data)) if data is not None else None
+
+
+def occupancy_to_json(occupancy):
+    if occupancy is None:
+        return None
+    return {
+        'hall': hall_to_json(occupancy.hall),
+        'bits': _bits_to_json(occupancy.bits),
+        'held': _bits_to_json(occupancy.held),
+    }
+
+
+def occupancy_from_json(data):
+    if data is None:
+        return None
+    return SeatOccupancy(hall_from_json(data['hall']), _bits_from_json(data['bits']), _bits_from_json(data['held']))
+
+
+# Логика бронирования, входа и списка сеансов без зависимостей от Qt.
+# Экраны работают с ней напрямую или через client.RemoteBookingService,
+# у которого тот же набор методов
+# Статистика, выгрузка и отчёт читают реплику базы (replica.py): без
+# replica - общую реплику процесса, get_replica(), которая создаётся при
+# первом обращении. Сервер бронирования передаёт реплику своей базы
+class BookingService:
+    def __init__(self, repository, holds=None, auth_cache=None, replica=None):
+        self.repository = repository
+        self.replica = replica
+        self.holds = holds or SeatHolds()
+        self.auth_cache = auth_cache or AuthCache()
+        self.sessions = SessionCache()
+        self._dummy_hash = None
+
+    def authenticate(self, username, password):
+        # Возвращает строку пользователя без хеша пароля или None
+        user = self.auth_cache.get(username, password)
+        if user is not None:
+            return user
+        row = self.repository.user_by_username(username)
+        if row is None:
+            # Проверка с фиктивным хешем, чтобы по времени ответа нельзя было узнать, есть ли логин
+            if self._dummy_hash is None:
+                self._dummy_hash = hash_password_pooled('')
+            verify_password_pooled(password, self._dummy_hash)
+            return None
+        ok, needs_rehash = verify_password_pooled(password, row[3])
+        if not ok:
+            return None
+        if needs_rehash:
+            self.repository.update_password(row[0], hash_password_pooled(password))
+        # Позиции столбцов сохраняются, вместо хеша - None
+        user = tuple(row[:3]) + (None,) + tuple(row[4:])
+        self.auth_cache.put(username, password, user)
+        return user
+
+    # Сессии для клиентов сервера бронирования (server.py): вход выдаёт
+    # токен, и остальные вызовы сервер принимает только с ним
+    def open_session(self, user):
+        token = new_session_token()
+        now = time.time()
+        expires_at = now + self.sessions.ttl
+        self.repository.open_auth_session(token_digest(token), user[0], expires_at, now)
+        self.sessions.put(token_digest(token), user, expires_at)
+        return token
+
+    def session_user(self, token):
+        # Пользователь сессии (как у authenticate) или None, если токен неизвестен или истёк
+        if not token:
+            return None
+        digest = token_digest(token)
+        user = self.sessions.get(digest)
+        if user is None:
+            row = self.repository.auth_session_user(digest, time.time())
+            if row is None:
+                return None
+            user = tuple(row[:3]) + (None,) + tuple(row[4:-1])
+            self.sessions.put(digest, user, row[-1])
+        return user
+
+    def register_user(self, full_name, username, password, phone, email, birth_date):
+        try:
+            self.repository.register_user(
+                full_name, username, hash_password_pooled(password), phone, email, birth_date,
+            )
+        except sqlite3.IntegrityError:
+            raise DuplicateUsername('Логин уже существует.')
+
+    def showtimes_page(self, after_key, limit, until, film_id=None, hall_id=None, search=None):
+        return self.repository.showtimes_page(after_key, limit, until, film_id, hall_id, search)
+
+    def sessions_full_page(self, after_id, limit):
+        return self.repository.sessions_full_page(after_id, limit)
+
+    def users_page(self, after_id, limit, search=None):
+        return self.repository.users_page(after_id, limit, search)
+
+    def ticket_history_page(self, user_id, after_key, limit):
+        # Билеты пользователя, новые первыми, вместе с перенесёнными в архив
+        return self.repository.ticket_history_page(user_id, after_key, limit)
+
+    def list_films(self):
+        return self.repository.list_films()
+
+    def list_halls(self):
+        return self.repository.list_halls()
+
+    # Журнал изменений для лент в терминалах, подключённых к серверу
+    def latest_change(self):
+        return self.repository.latest_change()
+
+    def changes_since(self, seq, limit):
+        return self.repository.changes_since(seq, limit)
+
+    def apply_changes(self, changes):
+        # Продажи и удаления из других процессов сбрасывают кэш занятости;
+        # свои изменения репозиторий уже учёл, повторный сброс безвреден
+        for change in changes:
+            if change.kind == RESET:
+                self.repository.occupancy_cache.clear()
+            elif change.kind in (SEAT_SOLD, SHOWTIME_REMOVED):
+                self.repository.occupancy_cache.invalidate(change.showtime_id)
+
+    def add_session(self, title, description, date, time, hall_id=1, price=None):
+        return self.repository.add_session(title, description, date, time, hall_id, price)
+
+    def delete_session(self, session_id):
+        self.repository.delete_session(session_id)
+
+    # Пакетные операции возвращают (сеансов, билетов)
+    def delete_sessions(self, session_ids):
+        return self.repository.delete_sessions(session_ids)
+
+    def archive_sessions(self, session_ids):
+        return self.repository.archive_sessions(session_ids)
+
+    def rebuild_stats(self):
+        # Пересчёт сводных таблиц продаж по tickets
+        self.repository.rebuild_stats()
+
+    def _replica(self):
+        return self.replica or get_replica()
+
+    def refresh_stats(self):
+        # Реплика догоняет основную базу; True - если скопирована заново
+        return self._replica().refresh()
+
+    def showtime_stats_page(self, after_id, limit):
+        return self._replica().repository.showtime_stats_page(after_id, limit)
+
+    def daily_stats_page(self, after_date, limit):
+        return self._replica().repository.daily_stats_page(after_date, limit)
+
+    def film_stats_page(self, after_title, limit):
+        return self._replica().repository.film_stats_page(after_title, limit)
+
+    def ticket_stats_page(self, after_id, limit, date_from=None, date_to=None):
+        from export import ticket_stats_page
+
+        with self._replica().pool.connection() as conn:
+            return ticket_stats_page(conn, after_id, limit, date_from, date_to)
+
+    def count_ticket_stats(self, date_from=None, date_to=None):
+        from export import count_tickets
+
+        with self._replica().pool.connection() as conn:
+            return count_tickets(conn, date_from, date_to)
+
+    def export_ticket_stats(self, path, date_from=None, date_to=None, progress=None):
+        from export import export_ticket_stats
+
+        return export_ticket_stats(self._replica().pool, path, date_from, date_to, progress=progress)
+
+    def revenue_report(self, date_from=None, date_to=None, progress=None):
+        # pandas грузится только при первом отчёте
+        from reports import build_report
+
+        return build_report(self._replica().pool, date_from, date_to, progress=progress)
+
+    def purge_sessions(self, days):
+        # Архивирует сеансы, начавшиеся больше days дней назад
+        before = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M')
+        return self.repository.purge_sessions(before)
+
+    def occupancy(self, movie_id, owner=None):
+        # Проданные места берутся из кэша занятости, брони других касс - из памяти,
+        # поэтому обновление схемы не обращается к tickets
+        occupancy = self.repository.occupancy(movie_id)
+        if occupancy is None:
+            return None
+        held = self.holds.held_by_others(movie_id, owner)
+        return occupancy.with_holds(held) if held else occupancy
+
+    def seat_prices(self, movie_id, seats):
+        # Стоимость выбранных мест до покупки; в билет цена записывается при продаже
+        for seat in seats:
+            self.check_seat(movie_id, seat)
+        return self.repository.seat_prices(movie_id, seats)
+
+    def hold_seat(self, movie_id, seat, owner):
+        # False, если место уже продано или его держит другая касса
+        self.check_seat(movie_id, seat)
+        occupancy = self.repository.occupancy(movie_id)
+        if occupancy.is_taken(occupancy.hall.parse_label(seat)):
+            return False
+        return self.holds.hold(movie_id, seat, owner)
+
+    def release_seat(self, movie_id, seat, owner):
+        self.holds.release(movie_id, seat, owner)
+
+    def check_seat(self, movie_id, seat):
+        occupancy = self.repository.occupancy(movie_id)
+        if occupancy is None:
+            raise UnknownSession(f'Сеанс {movie_id} не найден.')
+        if occupancy.hall.parse_label(seat) is None:
+            raise InvalidSeat(f'Места {seat} нет в зале {occupancy.hall.name}.')
+
+    def _held_by_other(self, movie_id, seat, owner):
+        holder = self.holds.holder(movie_id, seat)
+        return holder is not None and holder != owner
+
+    def purchase_ticket(self, user_id, movie_id, seat, owner=None):
+        # Покупка превращает бронь этой кассы в билет; место под чужой бронью не продаётся
+        result = self.commit_purchases([(user_id, movie_id, seat, owner)])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def purchase_seats(self, user_id, movie_id, seats, owner=None):
+        # Несколько мест одного сеанса: продаются все или ни одного. False, если
+        # какое-то место уже продано или его держит другая касса
+        if not seats or len(set(seats)) != len(seats):
+            raise InvalidSeat('Места в покупке не должны повторяться.')
+        for seat in seats:
+            self.check_seat(movie_id, seat)
+        if any(self._held_by_other(movie_id, seat, owner) for seat in seats):
+            return False
+        if not self.repository.purchase_seats(user_id, movie_id, seats):
+            return False
+        for seat in seats:
+            self.holds.release(movie_id, seat, owner)
+        return True
+
+    def commit_purchases(self, purchases):
+        # Покупки (user_id, movie_id, seat, owner) одной транзакцией. Для каждой
+        # возвращается True, False (место занято) или исключение проверки
+        results = [None] * len(purchases)
+        valid = []
+        for i, (_, movie_id, seat, owner) in enumerate(purchases):
+            try:
+                self.check_seat(movie_id, seat)
+            except ServiceError as e:
+                results[i] = e
+                continue
+            if self._held_by_other(movie_id, seat, owner):
+                results[i] = False
+            else:
+                valid.append(i)
+        if valid:
+            committed = self.repository.purchase_tickets([purchases[i][:3] for i in valid])
+            for i, purchased in zip(valid, committed):
+                results[i] = purchased
+                if purchased:
+                    _, movie_id, seat, owner = purchases[i]
+                    self.holds.release(movie_id, seat, owner)
+        return results
+
+
+_service = None
+
+
+# Адрес сервера бронирования задаётся переменной окружения CINEMA_SERVER
+# (например, http://127.0.0.1:8765); без неё терминал работает с базой сам.
+# С сервером чтения кэшируются, а покупки без связи копятся в локальном
+# файле CINEMA_OFFLINE_DB (по умолчанию offline.db)
+def get_service():
+    global _service
+    if _service is None:
+        server_url = os.environ.get('CINEMA_SERVER')
+        if server_url:
+            from client import RemoteBookingService
+            from offline import OFFLINE_DB_PATH, OfflineBookingService
+
+            _service = OfflineBookingService(
+                RemoteBookingService(server_url), os.environ.get('CINEMA_OFFLINE_DB', OFFLINE_DB_PATH), get_event_bus(),
+            )
+        else:
+            _service = BookingService(get_repository())
+    return _service
+
+
+def is_remote():
+    # Терминал работает через сервер бронирования, а не со своей базой
+    return not isinstance(get_service(), BookingService)
+
+
+_event_bus = None
+_change_feed = None
+
+
+def get_event_bus():
+    global _event_bus
+    if _event_bus is None:
+        _event_bus = EventBus()
+    return _event_bus
+
+
+def start_change_feed():
+    # Лента изменений для шины: без сервера - журнал базы с проверкой
+    # data_version на отдельном соединении, с сервером - его журнал по RPC
+    global _change_feed
+    if _change_feed is None:
+        service = get_service()
+        bus = get_event_bus()
+        if isinstance(service, BookingService):
+            log = ChangeLog(service.repository.pool.path)
+            _change_feed = ChangeFeed(bus, log.latest, log.since, log.changed, log.close)
+        else:
+            _change_feed = ChangeFeed(bus, service.latest_change, service.changes_since)
+        bus.subscribe(service.apply_changes)
+        _change_feed.start()
+    return _change_feed
+
+
+def stop_change_feed():
+    global _change_feed
+    if _change_feed is not None:
+        _change_feed.stop()
+        _change_feed = None
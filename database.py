@@ -0,0 +1,1185 @@
+import itertools
+import queue
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import profiling
+from seatmap import Hall, OccupancyCache, SeatOccupancy
+
+DB_PATH = 'cinema.db'
+POOL_SIZE = 4
+
+# Настройки соединения: WAL позволяет читать во время записи,
+# synchronous=NORMAL безопасен в режиме WAL и заметно ускоряет коммиты
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-16000',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA foreign_keys=ON',
+)
+
+# Размер кэша подготовленных выражений sqlite3 на одно соединение.
+# Все запросы ниже - константы, поэтому повторный execute не парсит SQL заново
+STATEMENT_CACHE_SIZE = 256
+
+# Сколько сеансов архивирует одна транзакция плановой очистки
+PURGE_BATCH_SIZE = 1000
+
+# Журнал изменений хранит последние CHANGES_KEEP записей; старые удаляет
+# триггер на каждой CHANGES_PRUNE_EVERY-й вставке
+CHANGES_KEEP = 10000
+CHANGES_PRUNE_EVERY = 1000
+
+
+def connect(path=DB_PATH, read_only=False):
+    conn = sqlite3.connect(path, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    if read_only:
+        # Соединение только читает: любая запись завершится ошибкой
+        conn.execute('PRAGMA query_only=ON')
+    profiling.attach(conn)
+    return conn
+
+
+# Пул долгоживущих соединений с базой
+class ConnectionPool:
+    def __init__(self, path=DB_PATH, size=POOL_SIZE, read_only=False):
+        self.path = path
+        self.size = size
+        self.read_only = read_only
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return connect(self.path, self.read_only)
+        return self._idle.get()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def transaction(self):
+        with self.connection() as conn:
+            with conn:
+                yield conn
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._created = 0
+
+
+# Миграция 1: исходная схема и примерные данные
+def _migration_1_base_schema(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            full_name TEXT NOT NULL,
+            username TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL,
+            phone TEXT,
+            email TEXT,
+            birth_date TEXT,
+            role TEXT NOT NULL
+        )
+    ''')
+
+    # Создание таблицы фильмов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS movies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            description TEXT,
+            date TEXT,
+            time TEXT
+        )
+    ''')
+
+    # Создание таблицы билетов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tickets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            movie_id INTEGER,
+            seat_number TEXT,
+            purchase_date TEXT,
+            FOREIGN KEY(user_id) REFERENCES users(id),
+            FOREIGN KEY(movie_id) REFERENCES movies(id)
+        )
+    ''')
+
+    # Примерные данные только в новую базу: у базы прежней версии (user_version 0)
+    # таблицы уже заполнены, а у movies нет уникального ключа, и INSERT OR IGNORE
+    # продублировал бы сеансы
+    if cursor.execute('SELECT EXISTS (SELECT 1 FROM users) OR EXISTS (SELECT 1 FROM movies)').fetchone()[0]:
+        return
+
+    # Вставка примерных данных пользователей
+    cursor.execute('''
+        INSERT OR IGNORE INTO users (full_name, username, password, phone, email, birth_date, role)
+        VALUES
+        ('Admin User', 'admin', 'adminpass', '1234567890', 'admin@example.com', '1980-01-01', 'admin'),
+        ('John Doe', 'johndoe', 'password123', '0987654321', 'john@example.com', '1990-05-15', 'user')
+    ''')
+
+    # Вставка примерных данных фильмов
+    cursor.execute('''
+        INSERT OR IGNORE INTO movies (title, description, date, time)
+        VALUES
+        ('Фильм 1', 'Захватывающий приключенческий фильм.', '2024-11-26', '18:00'),
+        ('Фильм 2', 'Драматическая история.', '2024-11-27', '20:00')
+    ''')
+
+
+# Миграция 2: индексы для поиска мест и уникальность места на сеансе
+def _migration_2_ticket_indexes(cursor):
+    # Дубликаты могли появиться из-за гонки проверки и вставки - оставляем самый ранний билет
+    cursor.execute('''
+        DELETE FROM tickets WHERE id NOT IN (
+            SELECT MIN(id) FROM tickets GROUP BY movie_id, seat_number
+        )
+    ''')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_tickets_movie_seat ON tickets (movie_id, seat_number)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tickets_user ON tickets (user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_movies_date ON movies (date)')
+
+
+# Миграция 3: залы произвольного размера, сеанс привязан к залу
+def _migration_3_halls(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS halls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            rows INTEGER NOT NULL,
+            cols INTEGER NOT NULL
+        )
+    ''')
+    # Прежний зал 5x10 становится залом по умолчанию для существующих сеансов
+    cursor.execute("INSERT INTO halls (id, name, rows, cols) VALUES (1, 'Зал 1', 5, 10)")
+    cursor.execute('ALTER TABLE movies ADD COLUMN hall_id INTEGER NOT NULL DEFAULT 1')
+
+
+# Миграция 4: сводные таблицы продаж, которые поддерживаются триггерами
+def _migration_4_sales_stats(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS showtime_stats (
+            movie_id INTEGER PRIMARY KEY,
+            tickets_sold INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            purchase_date TEXT PRIMARY KEY,
+            tickets_sold INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tickets_stats_insert AFTER INSERT ON tickets
+        BEGIN
+            INSERT INTO showtime_stats (movie_id, tickets_sold) VALUES (NEW.movie_id, 1)
+            ON CONFLICT(movie_id) DO UPDATE SET tickets_sold = tickets_sold + 1;
+            INSERT INTO daily_stats (purchase_date, tickets_sold) VALUES (NEW.purchase_date, 1)
+            ON CONFLICT(purchase_date) DO UPDATE SET tickets_sold = tickets_sold + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tickets_stats_delete AFTER DELETE ON tickets
+        BEGIN
+            UPDATE showtime_stats SET tickets_sold = tickets_sold - 1 WHERE movie_id = OLD.movie_id;
+            UPDATE daily_stats SET tickets_sold = tickets_sold - 1 WHERE purchase_date = OLD.purchase_date;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tickets_stats_update AFTER UPDATE OF movie_id, purchase_date ON tickets
+        BEGIN
+            UPDATE showtime_stats SET tickets_sold = tickets_sold - 1 WHERE movie_id = OLD.movie_id;
+            UPDATE daily_stats SET tickets_sold = tickets_sold - 1 WHERE purchase_date = OLD.purchase_date;
+            INSERT INTO showtime_stats (movie_id, tickets_sold) VALUES (NEW.movie_id, 1)
+            ON CONFLICT(movie_id) DO UPDATE SET tickets_sold = tickets_sold + 1;
+            INSERT INTO daily_stats (purchase_date, tickets_sold) VALUES (NEW.purchase_date, 1)
+            ON CONFLICT(purchase_date) DO UPDATE SET tickets_sold = tickets_sold + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS movies_stats_delete AFTER DELETE ON movies
+        BEGIN
+            DELETE FROM showtime_stats WHERE movie_id = OLD.id;
+        END
+    ''')
+    # Начальное заполнение по схеме этой версии (rebuild_stats ниже работает с текущей)
+    cursor.execute('''
+        INSERT INTO showtime_stats (movie_id, tickets_sold)
+        SELECT tickets.movie_id, COUNT(*) FROM tickets
+        JOIN movies ON movies.id = tickets.movie_id
+        GROUP BY tickets.movie_id
+    ''')
+    cursor.execute('''
+        INSERT INTO daily_stats (purchase_date, tickets_sold)
+        SELECT purchase_date, COUNT(*) FROM tickets GROUP BY purchase_date
+    ''')
+
+
+# Полный пересчёт сводных таблиц по tickets одним проходом GROUP BY
+def rebuild_stats(cursor):
+    cursor.execute('DELETE FROM showtime_stats')
+    cursor.execute('DELETE FROM daily_stats')
+    cursor.execute('''
+        INSERT INTO showtime_stats (showtime_id, tickets_sold)
+        SELECT tickets.showtime_id, COUNT(*) FROM tickets
+        JOIN showtimes ON showtimes.id = tickets.showtime_id
+        GROUP BY tickets.showtime_id
+    ''')
+    # Продажи по дням включают билеты, перенесённые в архив
+    cursor.execute('''
+        INSERT INTO daily_stats (purchase_date, tickets_sold)
+        SELECT date(purchase_date), COUNT(*) FROM (
+            SELECT purchase_date FROM tickets
+            UNION ALL
+            SELECT purchase_date FROM archived_tickets
+        )
+        GROUP BY date(purchase_date)
+    ''')
+
+
+# Миграция 5: контрольные точки массового импорта (importer.py).
+# indexes - JSON со снятыми на время импорта индексами
+def _migration_5_import_checkpoints(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS import_checkpoints (
+            source TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            records_done INTEGER NOT NULL DEFAULT 0,
+            indexes TEXT NOT NULL DEFAULT '[]'
+        )
+    ''')
+
+
+# Миграция 6: movies разделена на фильмы (films) и сеансы (showtimes).
+# Дата и время сеанса хранятся одной строкой start_ts 'ГГГГ-ММ-ДД ЧЧ:ММ',
+# которая сортируется как время, поэтому выборка окна дат - диапазон по индексу.
+# id сеансов сохраняются, билеты ссылаются на них через tickets.showtime_id
+def _migration_6_showtimes(cursor):
+    cursor.execute('''
+        CREATE TABLE films (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL UNIQUE,
+            description TEXT
+        )
+    ''')
+    # Сеансы с одинаковым названием становятся одним фильмом, описание берётся у самого раннего
+    cursor.execute('''
+        INSERT INTO films (title, description)
+        SELECT title, description FROM movies
+        WHERE id IN (SELECT MIN(id) FROM movies GROUP BY title)
+        ORDER BY id
+    ''')
+    cursor.execute('''
+        CREATE TABLE showtimes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            film_id INTEGER NOT NULL REFERENCES films(id),
+            hall_id INTEGER NOT NULL REFERENCES halls(id),
+            start_ts TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO showtimes (id, film_id, hall_id, start_ts)
+        SELECT movies.id, films.id, movies.hall_id,
+               TRIM(COALESCE(movies.date, '') || ' ' || COALESCE(movies.time, ''))
+        FROM movies JOIN films ON films.title = movies.title
+    ''')
+
+    # tickets пересоздаётся, чтобы внешний ключ указывал на showtimes
+    cursor.execute('''
+        CREATE TABLE tickets_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER REFERENCES users(id),
+            showtime_id INTEGER REFERENCES showtimes(id),
+            seat_number TEXT,
+            purchase_date TEXT
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO tickets_new (id, user_id, showtime_id, seat_number, purchase_date)
+        SELECT id, user_id, movie_id, seat_number, purchase_date FROM tickets
+    ''')
+    cursor.execute('DROP TABLE tickets')
+    cursor.execute('DROP TABLE movies')
+    cursor.execute('ALTER TABLE tickets_new RENAME TO tickets')
+    cursor.execute('ALTER TABLE showtime_stats RENAME COLUMN movie_id TO showtime_id')
+
+    cursor.execute('CREATE UNIQUE INDEX idx_tickets_showtime_seat ON tickets (showtime_id, seat_number)')
+    cursor.execute('CREATE INDEX idx_tickets_user ON tickets (user_id)')
+    cursor.execute('CREATE INDEX idx_showtimes_start ON showtimes (start_ts)')
+    cursor.execute('CREATE INDEX idx_showtimes_film_start ON showtimes (film_id, start_ts)')
+    cursor.execute('CREATE INDEX idx_showtimes_hall_start ON showtimes (hall_id, start_ts)')
+
+    cursor.execute('''
+        CREATE TRIGGER tickets_stats_insert AFTER INSERT ON tickets
+        BEGIN
+            INSERT INTO showtime_stats (showtime_id, tickets_sold) VALUES (NEW.showtime_id, 1)
+            ON CONFLICT(showtime_id) DO UPDATE SET tickets_sold = tickets_sold + 1;
+            INSERT INTO daily_stats (purchase_date, tickets_sold) VALUES (NEW.purchase_date, 1)
+            ON CONFLICT(purchase_date) DO UPDATE SET tickets_sold = tickets_sold + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER tickets_stats_delete AFTER DELETE ON tickets
+        BEGIN
+            UPDATE showtime_stats SET tickets_sold = tickets_sold - 1 WHERE showtime_id = OLD.showtime_id;
+            UPDATE daily_stats SET tickets_sold = tickets_sold - 1 WHERE purchase_date = OLD.purchase_date;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER tickets_stats_update AFTER UPDATE OF showtime_id, purchase_date ON tickets
+        BEGIN
+            UPDATE showtime_stats SET tickets_sold = tickets_sold - 1 WHERE showtime_id = OLD.showtime_id;
+            UPDATE daily_stats SET tickets_sold = tickets_sold - 1 WHERE purchase_date = OLD.purchase_date;
+            INSERT INTO showtime_stats (showtime_id, tickets_sold) VALUES (NEW.showtime_id, 1)
+            ON CONFLICT(showtime_id) DO UPDATE SET tickets_sold = tickets_sold + 1;
+            INSERT INTO daily_stats (purchase_date, tickets_sold) VALUES (NEW.purchase_date, 1)
+            ON CONFLICT(purchase_date) DO UPDATE SET tickets_sold = tickets_sold + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER showtimes_stats_delete AFTER DELETE ON showtimes
+        BEGIN
+            DELETE FROM showtime_stats WHERE showtime_id = OLD.id;
+        END
+    ''')
+    # Снятые индексы незавершённых импортов относились к movies
+    cursor.execute('DELETE FROM import_checkpoints')
+
+
+# Миграция 7: полнотекстовый поиск FTS5 по фильмам и пользователям.
+# Таблицы с внешним содержимым хранят только индекс, текст читается из films и
+# users; триггеры поддерживают индекс при изменениях. prefix='2 3' ускоряет
+# поиск по первым буквам, который идёт при каждом нажатии клавиши
+def _migration_7_search(cursor):
+    cursor.execute('''
+        CREATE VIRTUAL TABLE films_fts USING fts5(
+            title, description, content='films', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    ''')
+    cursor.execute('''
+        CREATE VIRTUAL TABLE users_fts USING fts5(
+            full_name, username, email, phone, content='users', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER films_fts_insert AFTER INSERT ON films
+        BEGIN
+            INSERT INTO films_fts (rowid, title, description) VALUES (NEW.id, NEW.title, NEW.description);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER films_fts_delete AFTER DELETE ON films
+        BEGIN
+            INSERT INTO films_fts (films_fts, rowid, title, description)
+            VALUES ('delete', OLD.id, OLD.title, OLD.description);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER films_fts_update AFTER UPDATE OF title, description ON films
+        BEGIN
+            INSERT INTO films_fts (films_fts, rowid, title, description)
+            VALUES ('delete', OLD.id, OLD.title, OLD.description);
+            INSERT INTO films_fts (rowid, title, description) VALUES (NEW.id, NEW.title, NEW.description);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER users_fts_insert AFTER INSERT ON users
+        BEGIN
+            INSERT INTO users_fts (rowid, full_name, username, email, phone)
+            VALUES (NEW.id, NEW.full_name, NEW.username, NEW.email, NEW.phone);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER users_fts_delete AFTER DELETE ON users
+        BEGIN
+            INSERT INTO users_fts (users_fts, rowid, full_name, username, email, phone)
+            VALUES ('delete', OLD.id, OLD.full_name, OLD.username, OLD.email, OLD.phone);
+        END
+    ''')
+    # Перехеширование пароля при входе не трогает индекс: триггер следит только за текстовыми полями
+    cursor.execute('''
+        CREATE TRIGGER users_fts_update AFTER UPDATE OF full_name, username, email, phone ON users
+        BEGIN
+            INSERT INTO users_fts (users_fts, rowid, full_name, username, email, phone)
+            VALUES ('delete', OLD.id, OLD.full_name, OLD.username, OLD.email, OLD.phone);
+            INSERT INTO users_fts (rowid, full_name, username, email, phone)
+            VALUES (NEW.id, NEW.full_name, NEW.username, NEW.email, NEW.phone);
+        END
+    ''')
+    cursor.execute("INSERT INTO films_fts (films_fts) VALUES ('rebuild')")
+    cursor.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+
+
+# Миграция 8: архив прошедших сеансов и их билетов. Архив лежит в той же
+# базе: в режиме WAL транзакция над присоединённой базой атомарна только
+# внутри каждого файла, а перенос должен быть одной транзакцией.
+# Билеты удалённых раньше сеансов (до включения foreign_keys) переносятся в архив
+def _migration_8_archive(cursor):
+    cursor.execute('''
+        CREATE TABLE archived_showtimes (
+            id INTEGER PRIMARY KEY,
+            film_id INTEGER NOT NULL,
+            hall_id INTEGER NOT NULL,
+            start_ts TEXT NOT NULL,
+            archived_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE archived_tickets (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            showtime_id INTEGER,
+            seat_number TEXT,
+            purchase_date TEXT,
+            archived_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX idx_archived_tickets_showtime ON archived_tickets (showtime_id)')
+    cursor.execute('''
+        INSERT INTO archived_tickets (id, user_id, showtime_id, seat_number, purchase_date, archived_at)
+        SELECT id, user_id, showtime_id, seat_number, purchase_date, datetime('now') FROM tickets
+        WHERE showtime_id NOT IN (SELECT id FROM showtimes)
+    ''')
+    # Триггер удаления уменьшит daily_stats, а архивные продажи в ней остаются
+    cursor.execute('''
+        INSERT INTO daily_stats (purchase_date, tickets_sold)
+        SELECT purchase_date, COUNT(*) FROM tickets
+        WHERE showtime_id NOT IN (SELECT id FROM showtimes)
+        GROUP BY purchase_date
+        ON CONFLICT(purchase_date) DO UPDATE SET tickets_sold = tickets_sold + excluded.tickets_sold
+    ''')
+    cursor.execute('DELETE FROM tickets WHERE showtime_id NOT IN (SELECT id FROM showtimes)')
+
+
+# Миграция 9: журнал изменений для шины событий (events.ChangeFeed).
+# Его ведут триггеры, поэтому в журнал попадают записи из любого процесса.
+# Удаление билетов не журналируется: они удаляются только вместе с сеансом
+def _migration_9_changes(cursor):
+    cursor.execute('''
+        CREATE TABLE changes (
+            seq INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            showtime_id INTEGER NOT NULL,
+            start_ts TEXT,
+            seat_number TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER changes_showtime_insert AFTER INSERT ON showtimes
+        BEGIN
+            INSERT INTO changes (kind, showtime_id, start_ts) VALUES ('showtime_added', NEW.id, NEW.start_ts);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER changes_showtime_delete AFTER DELETE ON showtimes
+        BEGIN
+            INSERT INTO changes (kind, showtime_id, start_ts) VALUES ('showtime_removed', OLD.id, OLD.start_ts);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER changes_ticket_insert AFTER INSERT ON tickets
+        BEGIN
+            INSERT INTO changes (kind, showtime_id, seat_number) VALUES ('seat_sold', NEW.showtime_id, NEW.seat_number);
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER changes_prune AFTER INSERT ON changes
+        WHEN NEW.seq % {CHANGES_PRUNE_EVERY} = 0
+        BEGIN
+            DELETE FROM changes WHERE seq <= NEW.seq - {CHANGES_KEEP};
+        END
+    ''')
+
+
+# Миграция 10: история покупок. purchase_date становится отметкой времени
+# 'ГГГГ-ММ-ДД ЧЧ:ММ:СС' (местное время), прежние даты получают полночь.
+# Продажи по дням считаются по date(purchase_date). Индексы (user_id,
+# purchase_date, ...) отдают страницу истории пользователя без сортировки и
+# покрывают её столбцы (с ценой - после миграции 11), поэтому таблица не
+# читается; индекс по одному user_id становится лишним
+def _migration_10_ticket_history(cursor):
+    for trigger in ('tickets_stats_insert', 'tickets_stats_delete', 'tickets_stats_update'):
+        cursor.execute(f'DROP TRIGGER {trigger}')
+    for table in ('tickets', 'archived_tickets'):
+        cursor.execute(f"""
+            UPDATE {table} SET purchase_date = purchase_date || ' 00:00:00' WHERE length(purchase_date) = 10
+        """)
+    cursor.execute('''
+        CREATE TRIGGER tickets_stats_insert AFTER INSERT ON tickets
+        BEGIN
+            INSERT INTO showtime_stats (showtime_id, tickets_sold) VALUES (NEW.showtime_id, 1)
+            ON CONFLICT(showtime_id) DO UPDATE SET tickets_sold = tickets_sold + 1;
+            INSERT INTO daily_stats (purchase_date, tickets_sold) VALUES (date(NEW.purchase_date), 1)
+            ON CONFLICT(purchase_date) DO UPDATE SET tickets_sold = tickets_sold + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER tickets_stats_delete AFTER DELETE ON tickets
+        BEGIN
+            UPDATE showtime_stats SET tickets_sold = tickets_sold - 1 WHERE showtime_id = OLD.showtime_id;
+            UPDATE daily_stats SET tickets_sold = tickets_sold - 1 WHERE purchase_date = date(OLD.purchase_date);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER tickets_stats_update AFTER UPDATE OF showtime_id, purchase_date ON tickets
+        BEGIN
+            UPDATE showtime_stats SET tickets_sold = tickets_sold - 1 WHERE showtime_id = OLD.showtime_id;
+            UPDATE daily_stats SET tickets_sold = tickets_sold - 1 WHERE purchase_date = date(OLD.purchase_date);
+            INSERT INTO showtime_stats (showtime_id, tickets_sold) VALUES (NEW.showtime_id, 1)
+            ON CONFLICT(showtime_id) DO UPDATE SET tickets_sold = tickets_sold + 1;
+            INSERT INTO daily_stats (purchase_date, tickets_sold) VALUES (date(NEW.purchase_date), 1)
+            ON CONFLICT(purchase_date) DO UPDATE SET tickets_sold = tickets_sold + 1;
+        END
+    ''')
+    cursor.execute('DROP INDEX idx_tickets_user')
+    # id в индексе явно: иначе при равных purchase_date порядок по id потребовал бы сортировки
+    cursor.execute(
+        'CREATE INDEX idx_tickets_user_purchased ON tickets (user_id, purchase_date, id, showtime_id, seat_number)'
+    )
+    cursor.execute(
+        'CREATE INDEX idx_archived_tickets_user_purchased '
+        'ON archived_tickets (user_id, purchase_date, id, showtime_id, seat_number)'
+    )
+
+
+# Миграция 11: цены. Базовая цена задаётся залу и, при необходимости, сеансу;
+# зоны зала (диапазоны рядов) и правила по времени начала и дню недели дают
+# коэффициенты к ней. Цена вычисляется при продаже и хранится в билете, чтобы
+# выручка не менялась при смене правил. Цена прежних билетов неизвестна (NULL)
+def _migration_11_pricing(cursor):
+    cursor.execute('ALTER TABLE halls ADD COLUMN base_price INTEGER NOT NULL DEFAULT 300')
+    cursor.execute('ALTER TABLE showtimes ADD COLUMN base_price INTEGER')
+    cursor.execute('ALTER TABLE archived_showtimes ADD COLUMN base_price INTEGER')
+    cursor.execute('ALTER TABLE tickets ADD COLUMN price INTEGER')
+    cursor.execute('ALTER TABLE archived_tickets ADD COLUMN price INTEGER')
+    # История покупок показывает цену: без неё в индексе каждая строка
+    # страницы читалась бы из таблицы
+    cursor.execute('DROP INDEX idx_tickets_user_purchased')
+    cursor.execute('DROP INDEX idx_archived_tickets_user_purchased')
+    cursor.execute(
+        'CREATE INDEX idx_tickets_user_purchased ON tickets (user_id, purchase_date, id, showtime_id, seat_number, price)'
+    )
+    cursor.execute(
+        'CREATE INDEX idx_archived_tickets_user_purchased '
+        'ON archived_tickets (user_id, purchase_date, id, showtime_id, seat_number, price)'
+    )
+    cursor.execute('''
+        CREATE TABLE seat_zones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hall_id INTEGER NOT NULL REFERENCES halls(id),
+            name TEXT NOT NULL,
+            first_row INTEGER NOT NULL,
+            last_row INTEGER NOT NULL,
+            multiplier REAL NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX idx_seat_zones_hall ON seat_zones (hall_id, first_row)')
+    # start_time и end_time - 'ЧЧ:ММ', конец не входит ('24:00' - до конца суток);
+    # weekdays - дни недели цифрами strftime('%w'), 0 - воскресенье
+    cursor.execute('''
+        CREATE TABLE price_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            start_time TEXT NOT NULL,
+            end_time TEXT NOT NULL,
+            weekdays TEXT NOT NULL DEFAULT '0123456',
+            multiplier REAL NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO price_rules (name, start_time, end_time, weekdays, multiplier) VALUES
+        ('Утренние сеансы', '00:00', '12:00', '0123456', 0.7),
+        ('Вечер пятницы и выходных', '18:00', '24:00', '560', 1.2)
+    ''')
+
+
+# Миграция 12: сессии сервера бронирования (токен хранится как SHA-256)
+def _migration_12_auth_sessions(cursor):
+    cursor.execute('''
+        CREATE TABLE auth_sessions (
+            token_hash TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            expires_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX idx_auth_sessions_expires ON auth_sessions (expires_at)')
+
+
+# Миграции применяются по порядку, номер последней хранится в PRAGMA user_version
+MIGRATIONS = (
+    _migration_1_base_schema,
+    _migration_2_ticket_indexes,
+    _migration_3_halls,
+    _migration_4_sales_stats,
+    _migration_5_import_checkpoints,
+    _migration_6_showtimes,
+    _migration_7_search,
+    _migration_8_archive,
+    _migration_9_changes,
+    _migration_10_ticket_history,
+    _migration_11_pricing,
+    _migration_12_auth_sessions,
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def initialize_database(pool):
+    with pool.connection() as conn:
+        # Обычный запуск: схема актуальна, и хватает одного чтения user_version
+        # без блокировки записи и полной проверки внешних ключей
+        if schema_version(conn) == len(MIGRATIONS):
+            return
+        # Миграции пересоздают таблицы, поэтому внешние ключи на это время
+        # выключаются (внутри транзакции PRAGMA foreign_keys не действует),
+        # а перед коммитом целостность проверяется целиком
+        conn.execute('PRAGMA foreign_keys=OFF')
+        try:
+            # BEGIN IMMEDIATE не даст двум терминалам применить одну миграцию одновременно
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                version = schema_version(conn)
+                for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                    migration(conn.cursor())
+                    conn.execute(f'PRAGMA user_version={number}')
+                violation = conn.execute('PRAGMA foreign_key_check').fetchone()
+                if violation is not None:
+                    raise sqlite3.IntegrityError(f'Нарушен внешний ключ после миграции: {tuple(violation)}')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            conn.execute('PRAGMA foreign_keys=ON')
+
+
+# Запросы вынесены в константы, чтобы sqlite3 переиспользовал подготовленные выражения
+SQL_USER_BY_USERNAME = 'SELECT * FROM users WHERE username=?'
+SQL_UPDATE_PASSWORD = 'UPDATE users SET password=? WHERE id=?'
+SQL_SESSION_ADD = 'INSERT INTO auth_sessions (token_hash, user_id, expires_at) VALUES (?, ?, ?)'
+SQL_SESSIONS_PURGE = 'DELETE FROM auth_sessions WHERE expires_at <= ?'
+# Пользователь сессии и срок её действия; роль читается из users при каждом
+# промахе кэша сессий
+SQL_SESSION_USER = '''
+    SELECT users.*, auth_sessions.expires_at
+    FROM auth_sessions JOIN users ON users.id = auth_sessions.user_id
+    WHERE auth_sessions.token_hash = ? AND auth_sessions.expires_at > ?
+'''
+SQL_REGISTER = '''
+    INSERT INTO users (full_name, username, password, phone, email, birth_date, role)
+    VALUES (?, ?, ?, ?, ?, ?, 'user')
+'''
+# Ближайшие сеансы в окне дат. Ключ страницы - (start_ts, id): условие
+# start_ts >= ? задаёт диапазон по индексу, второе отсекает уже показанные строки
+# с тем же временем. Фильтр по фильму или залу переключает запрос на индекс
+# (film_id, start_ts) или (hall_id, start_ts)
+def _showtimes_window_sql(by_film, by_hall, by_search):
+    filters = ''
+    if by_film:
+        filters += ' AND showtimes.film_id = ?'
+    if by_hall:
+        filters += ' AND showtimes.hall_id = ?'
+    if by_search:
+        filters += ' AND showtimes.film_id IN (SELECT rowid FROM films_fts WHERE films_fts MATCH ?)'
+    return f'''
+        SELECT showtimes.id, films.title, substr(showtimes.start_ts, 1, 10), substr(showtimes.start_ts, 12),
+               halls.name, showtimes.start_ts
+        FROM showtimes
+        JOIN films ON films.id = showtimes.film_id
+        JOIN halls ON halls.id = showtimes.hall_id
+        WHERE showtimes.start_ts >= ? AND (showtimes.start_ts > ? OR showtimes.id > ?)
+          AND showtimes.start_ts < ?{filters}
+        ORDER BY showtimes.start_ts, showtimes.id LIMIT ?
+    '''
+
+
+SQL_SHOWTIMES_WINDOW = {
+    key: _showtimes_window_sql(*key) for key in itertools.product((False, True), repeat=3)
+}
+SQL_SESSIONS_FULL_PAGE = '''
+    SELECT showtimes.id, films.title, films.description, substr(showtimes.start_ts, 1, 10),
+           substr(showtimes.start_ts, 12), halls.name
+    FROM showtimes
+    JOIN films ON films.id = showtimes.film_id
+    LEFT JOIN halls ON halls.id = showtimes.hall_id
+    WHERE showtimes.id > ? ORDER BY showtimes.id LIMIT ?
+'''
+# История покупок пользователя, новые первыми: страница после ключа
+# (purchase_date, id) в обратном порядке. Каждая ветка идёт по своему
+# покрывающему индексу (user_id, purchase_date, id, showtime_id, seat_number,
+# price) с LIMIT, поэтому время
+# не зависит ни от числа билетов в базе, ни от длины истории
+TICKET_HISTORY_FIRST_KEY = ('9999-12-31', 0)
+SQL_TICKET_HISTORY_PAGE = '''
+    SELECT id, purchase_date, title, start_ts, hall, seat_number, price, status FROM (
+        SELECT * FROM (
+            SELECT tickets.id, tickets.purchase_date, films.title, showtimes.start_ts, halls.name AS hall,
+                   tickets.seat_number, tickets.price, '' AS status
+            FROM tickets
+            JOIN showtimes ON showtimes.id = tickets.showtime_id
+            JOIN films ON films.id = showtimes.film_id
+            JOIN halls ON halls.id = showtimes.hall_id
+            WHERE tickets.user_id = ?1 AND (tickets.purchase_date, tickets.id) < (?2, ?3)
+            ORDER BY tickets.purchase_date DESC, tickets.id DESC LIMIT ?4
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT archived_tickets.id, archived_tickets.purchase_date, films.title, archived_showtimes.start_ts,
+                   halls.name, archived_tickets.seat_number, archived_tickets.price, 'в архиве'
+            FROM archived_tickets
+            JOIN archived_showtimes ON archived_showtimes.id = archived_tickets.showtime_id
+            JOIN films ON films.id = archived_showtimes.film_id
+            JOIN halls ON halls.id = archived_showtimes.hall_id
+            WHERE archived_tickets.user_id = ?1 AND (archived_tickets.purchase_date, archived_tickets.id) < (?2, ?3)
+            ORDER BY archived_tickets.purchase_date DESC, archived_tickets.id DESC LIMIT ?4
+        )
+    )
+    ORDER BY purchase_date DESC, id DESC LIMIT ?4
+'''
+# Фильм ищется по названию и создаётся при первом сеансе; пустое обновление
+# нужно, чтобы RETURNING вернул id и для уже существующего фильма
+SQL_FILM_ID = '''
+    INSERT INTO films (title, description) VALUES (?, ?)
+    ON CONFLICT(title) DO UPDATE SET title = excluded.title
+    RETURNING id
+'''
+SQL_FILMS = 'SELECT id, title FROM films ORDER BY title'
+# base_price NULL - сеанс продаётся по базовой цене зала
+SQL_ADD_SESSION = 'INSERT INTO showtimes (film_id, hall_id, start_ts, base_price) VALUES (?, ?, ?, ?)'
+SQL_HALLS = 'SELECT id, name, rows, cols FROM halls ORDER BY id'
+SQL_SESSION_HALL = '''
+    SELECT halls.id, halls.name, halls.rows, halls.cols
+    FROM showtimes JOIN halls ON halls.id = showtimes.hall_id
+    WHERE showtimes.id=?
+'''
+# Пакетное удаление и архивирование: id сеансов собираются во временную
+# таблицу соединения, дальше каждый шаг - один запрос по всем сеансам сразу.
+# Билеты удаляются раньше сеансов, иначе не пропустит внешний ключ
+SQL_CREATE_BATCH_IDS = 'CREATE TEMP TABLE IF NOT EXISTS batch_ids (id INTEGER PRIMARY KEY)'
+SQL_CLEAR_BATCH_IDS = 'DELETE FROM temp.batch_ids'
+SQL_ADD_BATCH_ID = 'INSERT OR IGNORE INTO temp.batch_ids (id) VALUES (?)'
+SQL_BATCH_PAST_SHOWTIMES = '''
+    INSERT INTO temp.batch_ids (id)
+    SELECT id FROM showtimes WHERE start_ts < ? ORDER BY start_ts LIMIT ?
+'''
+SQL_BATCH_IDS = 'SELECT id FROM temp.batch_ids'
+SQL_ARCHIVE_SHOWTIMES = '''
+    INSERT INTO archived_showtimes (id, film_id, hall_id, start_ts, base_price, archived_at)
+    SELECT id, film_id, hall_id, start_ts, base_price, datetime('now') FROM showtimes
+    WHERE id IN (SELECT id FROM temp.batch_ids)
+'''
+SQL_ARCHIVE_TICKETS = '''
+    INSERT INTO archived_tickets (id, user_id, showtime_id, seat_number, purchase_date, price, archived_at)
+    SELECT id, user_id, showtime_id, seat_number, purchase_date, price, datetime('now') FROM tickets
+    WHERE showtime_id IN (SELECT id FROM temp.batch_ids)
+'''
+# Триггер удаления билетов уменьшает daily_stats; архивные продажи в ней остаются
+SQL_KEEP_ARCHIVED_DAILY_STATS = '''
+    INSERT INTO daily_stats (purchase_date, tickets_sold)
+    SELECT date(purchase_date), COUNT(*) FROM tickets
+    WHERE showtime_id IN (SELECT id FROM temp.batch_ids)
+    GROUP BY date(purchase_date)
+    ON CONFLICT(purchase_date) DO UPDATE SET tickets_sold = tickets_sold + excluded.tickets_sold
+'''
+SQL_DELETE_BATCH_TICKETS = 'DELETE FROM tickets WHERE showtime_id IN (SELECT id FROM temp.batch_ids)'
+SQL_DELETE_BATCH_SHOWTIMES = 'DELETE FROM showtimes WHERE id IN (SELECT id FROM temp.batch_ids)'
+SQL_USERS_PAGE = '''
+    SELECT id, full_name, username, phone, email, birth_date, role FROM users
+    WHERE id > ? ORDER BY id LIMIT ?
+'''
+# FTS5 отдаёт совпадения в порядке rowid, поэтому постраничный поиск не сортирует
+SQL_SEARCH_USERS_PAGE = '''
+    SELECT users.id, users.full_name, users.username, users.phone, users.email, users.birth_date, users.role
+    FROM users_fts JOIN users ON users.id = users_fts.rowid
+    WHERE users_fts MATCH ? AND users_fts.rowid > ?
+    ORDER BY users_fts.rowid LIMIT ?
+'''
+SQL_OCCUPIED_SEATS = 'SELECT seat_number FROM tickets WHERE showtime_id=?'
+SQL_SHOWTIME_STATS_PAGE = '''
+    SELECT showtimes.id, films.title, substr(showtimes.start_ts, 1, 10), substr(showtimes.start_ts, 12),
+           halls.name, COALESCE(showtime_stats.tickets_sold, 0), halls.rows * halls.cols,
+           ROUND(100.0 * COALESCE(showtime_stats.tickets_sold, 0) / (halls.rows * halls.cols), 1)
+    FROM showtimes
+    JOIN films ON films.id = showtimes.film_id
+    JOIN halls ON halls.id = showtimes.hall_id
+    LEFT JOIN showtime_stats ON showtime_stats.showtime_id = showtimes.id
+    WHERE showtimes.id > ? ORDER BY showtimes.id LIMIT ?
+'''
+SQL_DAILY_STATS_PAGE = '''
+    SELECT purchase_date, tickets_sold FROM daily_stats
+    WHERE purchase_date > ? AND tickets_sold > 0
+    ORDER BY purchase_date LIMIT ?
+'''
+SQL_FILM_STATS_PAGE = '''
+    SELECT films.title, COUNT(*), SUM(COALESCE(showtime_stats.tickets_sold, 0))
+    FROM films
+    JOIN showtimes ON showtimes.film_id = films.id
+    LEFT JOIN showtime_stats ON showtime_stats.showtime_id = showtimes.id
+    WHERE films.title > ?
+    GROUP BY films.id ORDER BY films.title LIMIT ?
+'''
+
+
+# Цена места: базовая цена сеанса (без неё - зала), умноженная на коэффициент
+# зоны зала по номеру ряда (ряд - число в начале метки 'ряд-место') и на
+# коэффициент правила по времени начала и дню недели сеанса, с округлением до
+# рубля. Из пересекающихся зон и правил действует первая по id.
+# showtime_id и seat_number - выражения SQL (параметры или столбцы).
+# Подзапрос даёт NULL для несуществующего сеанса
+def ticket_price_sql(showtime_id, seat_number):
+    return f'''(
+        SELECT CAST(ROUND(
+            COALESCE(showtimes.base_price, halls.base_price)
+            * COALESCE((
+                SELECT multiplier FROM seat_zones
+                WHERE seat_zones.hall_id = showtimes.hall_id
+                  AND CAST({seat_number} AS INTEGER) BETWEEN seat_zones.first_row AND seat_zones.last_row
+                ORDER BY seat_zones.id LIMIT 1
+            ), 1)
+            * COALESCE((
+                SELECT multiplier FROM price_rules
+                WHERE substr(showtimes.start_ts, 12, 5) >= price_rules.start_time
+                  AND substr(showtimes.start_ts, 12, 5) < price_rules.end_time
+                  AND instr(price_rules.weekdays, strftime('%w', showtimes.start_ts)) > 0
+                ORDER BY price_rules.id LIMIT 1
+            ), 1)
+        ) AS INTEGER)
+        FROM showtimes JOIN halls ON halls.id = showtimes.hall_id
+        WHERE showtimes.id = {showtime_id}
+    )'''
+
+
+# Цена вычисляется в той же вставке: покупка с любой кассы и из любого
+# процесса получает цену по правилам, действующим в момент продажи
+SQL_INSERT_TICKET = f'''
+    INSERT INTO tickets (user_id, showtime_id, seat_number, purchase_date, price)
+    VALUES (?1, ?2, ?3, datetime('now', 'localtime'), {ticket_price_sql('?2', '?3')})
+'''
+SQL_SEAT_PRICE = f'SELECT {ticket_price_sql("?1", "?2")}'
+
+
+SQL_LATEST_CHANGE = 'SELECT COALESCE(MAX(seq), 0) FROM changes'
+SQL_CHANGES_SINCE = '''
+    SELECT seq, kind, showtime_id, start_ts, seat_number FROM changes
+    WHERE seq > ? ORDER BY seq LIMIT ?
+'''
+
+
+# Строка поиска превращается в запрос FTS5: каждое слово ищется по префиксу,
+# все слова должны совпасть. Кавычки и операторы FTS5 из ввода не пропускаются.
+# None, если в строке нет ни одного слова
+def fts_prefix_query(text):
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+# Единая точка доступа к данным для всех экранов
+@profiling.instrumented('db')
+class CinemaRepository:
+    def __init__(self, pool):
+        self.pool = pool
+        self.occupancy_cache = OccupancyCache(self._load_occupancy)
+
+    def user_by_username(self, username):
+        with self.pool.connection() as conn:
+            return conn.execute(SQL_USER_BY_USERNAME, (username,)).fetchone()
+
+    def update_password(self, user_id, password_hash):
+        with self.pool.transaction() as conn:
+            conn.execute(SQL_UPDATE_PASSWORD, (password_hash, user_id))
+
+    def open_auth_session(self, token_hash, user_id, expires_at, now):
+        # Заодно удаляет истёкшие сессии, чтобы таблица не росла
+        with self.pool.transaction() as conn:
+            conn.execute(SQL_SESSIONS_PURGE, (now,))
+            conn.execute(SQL_SESSION_ADD, (token_hash, user_id, expires_at))
+
+    def auth_session_user(self, token_hash, now):
+        # Строка users с expires_at в конце или None, если сессии нет или она истекла
+        with self.pool.connection() as conn:
+            return conn.execute(SQL_SESSION_USER, (token_hash, now)).fetchone()
+
+    def register_user(self, full_name, username, password_hash, phone, email, birth_date):
+        # Бросает sqlite3.IntegrityError, если логин уже существует
+        with self.pool.transaction() as conn:
+            conn.execute(SQL_REGISTER, (full_name, username, password_hash, phone, email, birth_date))
+
+    # Сеансы, начинающиеся после after_key = (start_ts, id) и раньше until,
+    # по времени начала; film_id, hall_id и search (поиск по фильму) необязательны
+    def showtimes_page(self, after_key, limit, until, film_id=None, hall_id=None, search=None):
+        start_ts, showtime_id = after_key
+        match = fts_prefix_query(search)
+        params = [start_ts, start_ts, showtime_id, until]
+        if film_id is not None:
+            params.append(film_id)
+        if hall_id is not None:
+            params.append(hall_id)
+        if match is not None:
+            params.append(match)
+        params.append(limit)
+        sql = SQL_SHOWTIMES_WINDOW[(film_id is not None, hall_id is not None, match is not None)]
+        with self.pool.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    # Постраничные выборки: строки с id больше after_id, не более limit штук
+    def sessions_full_page(self, after_id, limit):
+        with self.pool.connection() as conn:
+            return conn.execute(SQL_SESSIONS_FULL_PAGE, (after_id, limit)).fetchall()
+
+    def add_session(self, title, description, date, time, hall_id=1, price=None):
+        # price - базовая цена сеанса; None - по цене зала
+        with self.pool.transaction() as conn:
+            film_id = conn.execute(SQL_FILM_ID, (title, description)).fetchone()[0]
+            return conn.execute(SQL_ADD_SESSION, (film_id, hall_id, f'{date} {time}', price)).lastrowid
+
+    def list_films(self):
+        with self.pool.connection() as conn:
+            return conn.execute(SQL_FILMS).fetchall()
+
+    @staticmethod
+    def _remove_batch(conn, archive):
+        # Убирает сеансы из temp.batch_ids вместе с билетами;
+        # возвращает (id сеансов, число удалённых сеансов, число билетов)
+        ids = [row[0] for row in conn.execute(SQL_BATCH_IDS)]
+        if archive:
+            conn.execute(SQL_ARCHIVE_SHOWTIMES)
+            conn.execute(SQL_ARCHIVE_TICKETS)
+            conn.execute(SQL_KEEP_ARCHIVED_DAILY_STATS)
+        tickets = conn.execute(SQL_DELETE_BATCH_TICKETS).rowcount
+        showtimes = conn.execute(SQL_DELETE_BATCH_SHOWTIMES).rowcount
+        conn.execute(SQL_CLEAR_BATCH_IDS)
+        return ids, showtimes, tickets
+
+    def _invalidate(self, showtime_ids):
+        for showtime_id in showtime_ids:
+            self.occupancy_cache.invalidate(showtime_id)
+
+    def _remove_sessions(self, session_ids, archive):
+        with self.pool.transaction() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(SQL_CREATE_BATCH_IDS)
+            conn.execute(SQL_CLEAR_BATCH_IDS)
+            conn.executemany(SQL_ADD_BATCH_ID, ((session_id,) for session_id in session_ids))
+            ids, showtimes, tickets = self._remove_batch(conn, archive)
+        self._invalidate(ids)
+        return showtimes, tickets
+
+    # Удаление сеансов одной транзакцией вместе с проданными на них билетами
+    def delete_sessions(self, session_ids):
+        return self._remove_sessions(session_ids, archive=False)
+
+    def delete_session(self, session_id):
+        self.delete_sessions([session_id])
+
+    # Перенос сеансов и их билетов в архивные таблицы одной транзакцией
+    def archive_sessions(self, session_ids):
+        return self._remove_sessions(session_ids, archive=True)
+
+    # Архивирует сеансы, начавшиеся раньше before ('ГГГГ-ММ-ДД ЧЧ:ММ'), пачками
+    # по batch_size сеансов: каждая пачка - своя транзакция, чтобы покупки на
+    # других кассах не ждали весь перенос
+    def purge_sessions(self, before, batch_size=PURGE_BATCH_SIZE):
+        total_showtimes = total_tickets = 0
+        while True:
+            with self.pool.transaction() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute(SQL_CREATE_BATCH_IDS)
+                conn.execute(SQL_CLEAR_BATCH_IDS)
+                conn.execute(SQL_BATCH_PAST_SHOWTIMES, (before, batch_size))
+                ids, showtimes, tickets = self._remove_batch(conn, archive=True)
+            self._invalidate(ids)
+            total_showtimes += showtimes
+            total_tickets += tickets
+            if showtimes < batch_size:
+                return total_showtimes, total_tickets
+
+    def list_halls(self):
+        with self.pool.connection() as conn:
+            return [Hall(*row) for row in conn.execute(SQL_HALLS)]
+
+    # Журнал изменений: номер последней записи и записи после seq
+    def latest_change(self):
+        with self.pool.connection() as conn:
+            return conn.execute(SQL_LATEST_CHANGE).fetchone()[0]
+
+    def changes_since(self, seq, limit):
+        with self.pool.connection() as conn:
+            return conn.execute(SQL_CHANGES_SINCE, (seq, limit)).fetchall()
+
+    def ticket_history_page(self, user_id, after_key, limit):
+        purchase_date, ticket_id = after_key
+        with self.pool.connection() as conn:
+            return conn.execute(SQL_TICKET_HISTORY_PAGE, (user_id, purchase_date, ticket_id, limit)).fetchall()
+
+    def users_page(self, after_id, limit, search=None):
+        # search - поиск по ФИО, логину, email и телефону
+        match = fts_prefix_query(search)
+        with self.pool.connection() as conn:
+            if match is None:
+                return conn.execute(SQL_USERS_PAGE, (after_id, limit)).fetchall()
+            return conn.execute(SQL_SEARCH_USERS_PAGE, (match, after_id, limit)).fetchall()
+
+    # Сводная статистика читается из showtime_stats/daily_stats, без GROUP BY по tickets
+    def showtime_stats_page(self, after_id, limit):
+        with self.pool.connection() as conn:
+            return conn.execute(SQL_SHOWTIME_STATS_PAGE, (after_id, limit)).fetchall()
+
+    def daily_stats_page(self, after_date, limit):
+        with self.pool.connection() as conn:
+            return conn.execute(SQL_DAILY_STATS_PAGE, (after_date, limit)).fetchall()
+
+    def film_stats_page(self, after_title, limit):
+        with self.pool.connection() as conn:
+            return conn.execute(SQL_FILM_STATS_PAGE, (after_title, limit)).fetchall()
+
+    def rebuild_stats(self):
+        with self.pool.transaction() as conn:
+            # BEGIN IMMEDIATE: покупки ждут конца пересчёта и не теряются между DELETE и INSERT
+            conn.execute('BEGIN IMMEDIATE')
+            rebuild_stats(conn.cursor())
+
+    def occupied_seats(self, showtime_id):
+        with self.pool.connection() as conn:
+            return [row[0] for row in conn.execute(SQL_OCCUPIED_SEATS, (showtime_id,))]
+
+    def _load_occupancy(self, showtime_id):
+        with self.pool.connection() as conn:
+            row = conn.execute(SQL_SESSION_HALL, (showtime_id,)).fetchone()
+            if row is None:
+                return None
+            labels = (seat[0] for seat in conn.execute(SQL_OCCUPIED_SEATS, (showtime_id,)))
+            return SeatOccupancy.from_labels(Hall(*row), labels)
+
+    def occupancy(self, showtime_id):
+        # Битовая карта занятых мест сеанса из кэша; None, если сеанса нет
+        return self.occupancy_cache.get(showtime_id)
+
+    def seat_prices(self, showtime_id, seats):
+        # Цены мест по действующим правилам (сколько стоила бы покупка сейчас)
+        with self.pool.connection() as conn:
+            return [conn.execute(SQL_SEAT_PRICE, (showtime_id, seat)).fetchone()[0] for seat in seats]
+
+    def purchase_ticket(self, user_id, showtime_id, seat):
+        # Одна атомарная вставка: занятость места проверяет уникальный индекс.
+        # Возвращает False, если место уже занято
+        try:
+            with self.pool.transaction() as conn:
+                conn.execute(SQL_INSERT_TICKET, (user_id, showtime_id, seat))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+        finally:
+            self.occupancy_cache.invalidate(showtime_id)
+
+    def purchase_seats(self, user_id, showtime_id, seats):
+        # Групповая покупка: все места одним executemany в одной транзакции.
+        # Если хоть одно место уже продано, уникальный индекс откатывает всю покупку
+        try:
+            with self.pool.transaction() as conn:
+                conn.executemany(SQL_INSERT_TICKET, [(user_id, showtime_id, seat) for seat in seats])
+            return True
+        except sqlite3.IntegrityError:
+            return False
+        finally:
+            self.occupancy_cache.invalidate(showtime_id)
+
+    def purchase_tickets(self, purchases):
+        # Групповой коммит: несколько покупок (user_id, showtime_id, seat) в одной
+        # транзакции. Нарушение уникальности откатывает только свою вставку,
+        # поэтому результат возвращается по каждой покупке отдельно
+        results = []
+        try:
+            with self.pool.transaction() as conn:
+                for user_id, showtime_id, seat in purchases:
+                    try:
+                        conn.execute(SQL_INSERT_TICKET, (user_id, showtime_id, seat))
+                        results.append(True)
+                    except sqlite3.IntegrityError:
+                        results.append(False)
+        finally:
+            for _, showtime_id, _ in purchases:
+                self.occupancy_cache.invalidate(showtime_id)
+        return results
+
+
+# Чтение журнала изменений для events.ChangeFeed на своём соединении:
+# PRAGMA data_version соединения меняется, только когда базу изменило
+# другое соединение (в том числе из другого процесса), поэтому журнал
+# читается лишь после чужих коммитов
+class ChangeLog:
+    def __init__(self, path=DB_PATH):
+        self.conn = connect(path)
+        self._version = None
+
+    def changed(self):
+        version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        changed = version != self._version
+        self._version = version
+        return changed
+
+    def latest(self):
+        return self.conn.execute(SQL_LATEST_CHANGE).fetchone()[0]
+
+    def since(self, seq, limit):
+        return self.conn.execute(SQL_CHANGES_SINCE, (seq, limit)).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+_pool = None
+_repository = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool(DB_PATH)
+    return _pool
+
+
+def get_repository():
+    global _repository
+    if _repository is None:
+        _repository = CinemaRepository(get_pool())
+    return _repository
@@ -0,0 +1,101 @@
+import threading
+from collections import namedtuple
+
+# Как часто лента проверяет, не изменилась ли база, секунд
+POLL_INTERVAL = 0.2
+# Сколько записей журнала читается за раз. Если новых записей больше, это
+# массовая операция (импорт, очистка), и вместо правок публикуется RESET
+CHANGES_BATCH = 1000
+
+SHOWTIME_ADDED = 'showtime_added'
+SHOWTIME_REMOVED = 'showtime_removed'
+SEAT_SOLD = 'seat_sold'
+# Изменения не восстановить по отдельности: представления перечитываются целиком
+RESET = 'reset'
+SHOWTIME_CHANGES = (SHOWTIME_ADDED, SHOWTIME_REMOVED)
+# Не из журнала базы: покупка, сохранённая без связи с сервером (offline.py),
+# не прошла при синхронизации. seq - номер записи офлайн-журнала
+PURCHASE_CONFLICT = 'purchase_conflict'
+
+# Запись журнала changes: start_ts - у сеансов, seat_number - у проданных мест
+Change = namedtuple('Change', 'seq kind showtime_id start_ts seat_number')
+
+
+# Шина изменений внутри процесса. Подписчики получают пачки Change в потоке
+# ленты; интерфейс переводит их в свой поток сигналом Qt
+class EventBus:
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def publish(self, changes):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(changes)
+
+
+# Лента изменений: фоновый поток читает журнал после последней увиденной
+# записи и публикует новые записи в шину. latest() и since(seq, limit) дают
+# database.ChangeLog или сервис (для удалённого сервера); changed() -
+# необязательная дешёвая проверка, писал ли кто-нибудь в базу
+class ChangeFeed:
+    def __init__(self, bus, latest, since, changed=None, close=None, interval=POLL_INTERVAL):
+        self.bus = bus
+        self.interval = interval
+        self.seq = None
+        self._latest = latest
+        self._since = since
+        self._changed = changed
+        self._close = close
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._close is not None:
+            self._close()
+
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception:
+                # База занята или сервер недоступен: повторим на следующем шаге
+                pass
+            if self._stop.wait(self.interval):
+                return
+
+    def poll(self):
+        if self.seq is None:
+            # Подписчики получают только изменения после запуска ленты
+            self.seq = self._latest()
+            return
+        if self._changed is not None and not self._changed():
+            return
+        rows = self._since(self.seq, CHANGES_BATCH)
+        if not rows:
+            return
+        if rows[0][0] > self.seq + 1 or len(rows) == CHANGES_BATCH:
+            # Журнал обрезан дальше seq или изменений слишком много для правок
+            self.seq = self._latest()
+            self.bus.publish([Change(self.seq, RESET, None, None, None)])
+            return
+        self.seq = rows[-1][0]
+        self.bus.publish([Change(*row) for row in rows])
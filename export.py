@@ -0,0 +1,194 @@
+import csv
+import os
+
+CHUNK_SIZE = 10000
+
+# Ограничение Excel на число строк листа; дальше выгрузка продолжается на новом листе
+XLSX_MAX_ROWS = 1048576
+
+EXPORT_COLUMNS = ['id', 'full_name', 'title', 'seat_number', 'purchase_date', 'price']
+
+SQL_EXPORT_TICKETS = '''
+    SELECT tickets.id, users.full_name, films.title, tickets.seat_number, tickets.purchase_date, tickets.price
+    FROM tickets
+    JOIN users ON tickets.user_id = users.id
+    JOIN showtimes ON tickets.showtime_id = showtimes.id
+    JOIN films ON showtimes.film_id = films.id
+'''
+SQL_EXPORT_COUNT = '''
+    SELECT COUNT(*)
+    FROM tickets
+    JOIN users ON tickets.user_id = users.id
+    JOIN showtimes ON tickets.showtime_id = showtimes.id
+'''
+
+
+class CsvWriter:
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(EXPORT_COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+# openpyxl в режиме write_only пишет строки сразу в файл и не держит лист в памяти
+class XlsxWriter:
+    def __init__(self, path):
+        from openpyxl import Workbook
+
+        self.path = path
+        self.workbook = Workbook(write_only=True)
+        self.sheet = None
+        self.sheet_rows = 0
+        self._new_sheet()
+
+    def _new_sheet(self):
+        number = len(self.workbook.worksheets) + 1
+        self.sheet = self.workbook.create_sheet('Sheet1' if number == 1 else f'Sheet{number}')
+        self.sheet.append(EXPORT_COLUMNS)
+        self.sheet_rows = 1
+
+    def write(self, rows):
+        for row in rows:
+            if self.sheet_rows >= XLSX_MAX_ROWS:
+                self._new_sheet()
+            self.sheet.append(row)
+            self.sheet_rows += 1
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+class ParquetWriter:
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema([
+            ('id', pa.int64()),
+            ('full_name', pa.string()),
+            ('title', pa.string()),
+            ('seat_number', pa.string()),
+            ('purchase_date', pa.string()),
+            ('price', pa.int64()),
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        self.writer.write_table(self.pa.Table.from_arrays(
+            [self.pa.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema,
+        ))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {
+    'xlsx': XlsxWriter,
+    'csv': CsvWriter,
+    'parquet': ParquetWriter,
+}
+
+
+def export_format(path):
+    return os.path.splitext(path)[1].lstrip('.').lower()
+
+
+def _date_filter(date_from, date_to, after_id=None):
+    conditions = []
+    params = []
+    if after_id is not None:
+        conditions.append('tickets.id > ?')
+        params.append(after_id)
+    if date_from:
+        conditions.append('tickets.purchase_date >= ?')
+        params.append(date_from)
+    if date_to:
+        # purchase_date - отметка времени, поэтому день date_to берётся целиком
+        conditions.append("tickets.purchase_date < date(?, '+1 day')")
+        params.append(date_to)
+    where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+    return where, params
+
+
+def iter_ticket_chunks(conn, date_from=None, date_to=None, chunk_size=CHUNK_SIZE):
+    where, params = _date_filter(date_from, date_to)
+    cursor = conn.execute(SQL_EXPORT_TICKETS + where + ' ORDER BY tickets.id', params)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+
+# Страница выгрузки после билета after_id: ключ следующей - id последней строки
+def ticket_stats_page(conn, after_id, limit, date_from=None, date_to=None):
+    where, params = _date_filter(date_from, date_to, after_id)
+    return conn.execute(SQL_EXPORT_TICKETS + where + ' ORDER BY tickets.id LIMIT ?', [*params, limit]).fetchall()
+
+
+def iter_ticket_pages(fetch_page, chunk_size=CHUNK_SIZE):
+    # fetch_page(after_id, limit) - ticket_stats_page, в том числе через сервер
+    after_id = 0
+    while True:
+        rows = fetch_page(after_id, chunk_size)
+        if not rows:
+            break
+        yield rows
+        after_id = rows[-1][0]
+
+
+def count_tickets(conn, date_from=None, date_to=None):
+    where, params = _date_filter(date_from, date_to)
+    return conn.execute(SQL_EXPORT_COUNT + where, params).fetchone()[0]
+
+
+def _writer_for(path):
+    fmt = export_format(path)
+    if fmt not in WRITERS:
+        raise ValueError(f'Неподдерживаемый формат выгрузки: {fmt}')
+    return WRITERS[fmt]
+
+
+# Запись порций строк chunks в файл path; total и progress - как в
+# export_ticket_stats. Возвращает число записанных строк
+def write_export(path, chunks, total=0, progress=None):
+    writer_class = _writer_for(path)
+    partial_path = path + '.part'
+    written = 0
+    writer = writer_class(partial_path)
+    try:
+        for rows in chunks:
+            writer.write(rows)
+            written += len(rows)
+            if progress:
+                progress(written, total)
+        writer.close()
+    except BaseException:
+        try:
+            writer.close()
+        finally:
+            os.remove(partial_path)
+        raise
+    os.replace(partial_path, path)
+    return written
+
+
+# Потоковая выгрузка статистики билетов: объединение читается порциями по
+# chunk_size строк и сразу дописывается в файл, поэтому память не растёт с
+# числом билетов. Формат определяется по расширению (xlsx, csv, parquet).
+# progress(done, total) вызывается после каждой порции; исключение из него
+# (например, отмена задачи) прерывает выгрузку, недописанный файл удаляется
+def export_ticket_stats(pool, path, date_from=None, date_to=None, progress=None, chunk_size=CHUNK_SIZE):
+    _writer_for(path)
+    with pool.connection() as conn:
+        total = count_tickets(conn, date_from, date_to) if progress else 0
+        return write_export(path, iter_ticket_chunks(conn, date_from, date_to, chunk_size), total, progress)
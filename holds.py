@@ -0,0 +1,63 @@
+import heapq
+import threading
+import time
+
+HOLD_TTL = 300
+
+
+# Временные брони мест в памяти. Бронь ставится при выборе места на кассе и
+# превращается в билет при покупке; непроданная бронь истекает через ttl
+# секунд. Сроки лежат в куче, просроченные брони снимаются при любом обращении
+class SeatHolds:
+    def __init__(self, ttl=HOLD_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._holds = {}
+        self._by_movie = {}
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        now = self.clock()
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, movie_id, seat, owner = heapq.heappop(self._heap)
+            # В куче могут остаться записи продлённых или снятых броней - их пропускаем
+            if self._holds.get((movie_id, seat)) == (owner, expires_at):
+                self._drop(movie_id, seat)
+
+    def _drop(self, movie_id, seat):
+        del self._holds[(movie_id, seat)]
+        seats = self._by_movie[movie_id]
+        del seats[seat]
+        if not seats:
+            del self._by_movie[movie_id]
+
+    def hold(self, movie_id, seat, owner):
+        # Ставит или продлевает бронь; False, если место держит другая касса
+        with self._lock:
+            self._expire()
+            current = self._holds.get((movie_id, seat))
+            if current is not None and current[0] != owner:
+                return False
+            expires_at = self.clock() + self.ttl
+            self._holds[(movie_id, seat)] = (owner, expires_at)
+            self._by_movie.setdefault(movie_id, {})[seat] = owner
+            heapq.heappush(self._heap, (expires_at, movie_id, seat, owner))
+            return True
+
+    def release(self, movie_id, seat, owner):
+        with self._lock:
+            current = self._holds.get((movie_id, seat))
+            if current is not None and current[0] == owner:
+                self._drop(movie_id, seat)
+
+    def holder(self, movie_id, seat):
+        with self._lock:
+            self._expire()
+            current = self._holds.get((movie_id, seat))
+            return current[0] if current is not None else None
+
+    def held_by_others(self, movie_id, owner=None):
+        with self._lock:
+            self._expire()
+            return [seat for seat, holder in self._by_movie.get(movie_id, {}).items() if holder != owner]
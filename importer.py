@@ -0,0 +1,353 @@
+import csv
+import itertools
+import json
+import os
+import re
+from datetime import date
+from functools import lru_cache
+
+from auth import hash_passwords_pooled, is_hashed
+from database import SQL_ADD_SESSION, SQL_FILM_ID, SQL_HALLS
+
+# Сколько записей вставляется одной транзакцией и фиксируется одной контрольной точкой
+SESSIONS_BATCH_SIZE = 50000
+# Пароли пользователей хешируются scrypt, поэтому пачки меньше - прогресс идёт чаще
+USERS_BATCH_SIZE = 2000
+
+# Файлы больше этого размера грузятся без вторичных индексов: индекс строится
+# один раз в конце, а не обновляется на каждой вставке
+DEFER_INDEXES_MIN_BYTES = 8 * 1024 * 1024
+
+READ_SIZE = 1 << 16
+MAX_REPORTED_ERRORS = 100
+
+DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}$')
+TIME_RE = re.compile(r'(\d{2}):(\d{2})$')
+JSON_WS_RE = re.compile(r'[ \t\n\r]*')
+
+SQL_IMPORT_USER = '''
+    INSERT INTO users (full_name, username, password, phone, email, birth_date, role)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(username) DO NOTHING
+'''
+SQL_CHECKPOINT = 'SELECT kind, fingerprint, records_done, indexes FROM import_checkpoints WHERE source=?'
+SQL_SAVE_CHECKPOINT = '''
+    INSERT INTO import_checkpoints (source, kind, fingerprint, records_done, indexes) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(source) DO UPDATE SET records_done=excluded.records_done, indexes=excluded.indexes
+'''
+SQL_DELETE_CHECKPOINT = 'DELETE FROM import_checkpoints WHERE source=?'
+# Уникальные индексы не снимаются: они отсекают дубликаты при вставке
+SQL_SECONDARY_INDEXES = '''
+    SELECT name, sql FROM sqlite_master
+    WHERE type='index' AND tbl_name=? AND sql IS NOT NULL AND sql NOT LIKE 'CREATE UNIQUE%'
+'''
+
+
+def _optional(record, field):
+    value = record.get(field)
+    if value is None:
+        return None
+    value = (value if isinstance(value, str) else str(value)).strip()
+    return value or None
+
+
+def _required(record, field):
+    value = _optional(record, field)
+    if value is None:
+        raise ValueError(f'не заполнено поле {field}')
+    return value
+
+
+# Даты и время в расписании повторяются, поэтому результаты проверки кэшируются
+@lru_cache(maxsize=4096)
+def _check_date(value, field):
+    try:
+        if not DATE_RE.match(value):
+            raise ValueError
+        date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{field}: ожидается дата ГГГГ-ММ-ДД, получено {value!r}') from None
+    return value
+
+
+@lru_cache(maxsize=4096)
+def _check_time(value, field):
+    match = TIME_RE.match(value)
+    if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        raise ValueError(f'{field}: ожидается время ЧЧ:ММ, получено {value!r}')
+    return value
+
+
+# Сеансы: title, description, date, time, hall_id (по умолчанию зал 1),
+# price (базовая цена сеанса в рублях; по умолчанию - цена зала).
+# Фильм находится по названию или создаётся; description берётся у первого сеанса нового фильма
+class SessionImport:
+    table = 'showtimes'
+    batch_size = SESSIONS_BATCH_SIZE
+
+    def prepare(self, conn):
+        self.hall_ids = {row[0] for row in conn.execute(SQL_HALLS)}
+        self.film_ids = {}
+
+    def parse(self, record):
+        hall_id = _optional(record, 'hall_id') or '1'
+        try:
+            hall_id = int(hall_id)
+        except ValueError:
+            raise ValueError(f'hall_id: ожидается число, получено {hall_id!r}') from None
+        if hall_id not in self.hall_ids:
+            raise ValueError(f'зал {hall_id} не существует')
+        price = _optional(record, 'price')
+        if price is not None:
+            try:
+                price = int(price)
+            except ValueError:
+                raise ValueError(f'price: ожидается целое число рублей, получено {price!r}') from None
+            if price < 0:
+                raise ValueError(f'price: цена не может быть отрицательной, получено {price}')
+        start_date = _check_date(_required(record, 'date'), 'date')
+        start_time = _check_time(_required(record, 'time'), 'time')
+        return (
+            _required(record, 'title'),
+            _optional(record, 'description'),
+            hall_id,
+            f'{start_date} {start_time}',
+            price,
+        )
+
+    def prepare_batch(self, rows):
+        return rows
+
+    def insert(self, conn, rows):
+        # Названий в расписании немного, поэтому id фильмов запоминаются на весь импорт.
+        # Фильм, созданный в откатившейся пачке, будет найден или создан заново
+        # следующей пачкой, так как кэш пополняется только после вставки всей пачки
+        film_ids = dict(self.film_ids)
+        showtimes = []
+        for title, description, hall_id, start_ts, price in rows:
+            film_id = film_ids.get(title)
+            if film_id is None:
+                film_id = film_ids[title] = conn.execute(SQL_FILM_ID, (title, description)).fetchone()[0]
+            showtimes.append((film_id, hall_id, start_ts, price))
+        conn.executemany(SQL_ADD_SESSION, showtimes)
+        self.film_ids = film_ids
+        return len(rows)
+
+
+# Пользователи: full_name, username, password, phone, email, birth_date, role.
+# Пароль может прийти готовым хешем scrypt (перенос базы), иначе он хешируется
+# в пуле процессов до начала транзакции. Существующие логины пропускаются
+class UserImport:
+    table = 'users'
+    batch_size = USERS_BATCH_SIZE
+
+    def prepare(self, conn):
+        pass
+
+    def parse(self, record):
+        birth_date = _optional(record, 'birth_date')
+        role = _optional(record, 'role') or 'user'
+        if role not in ('user', 'admin'):
+            raise ValueError(f'role: ожидается user или admin, получено {role!r}')
+        return (
+            _required(record, 'full_name'),
+            _required(record, 'username'),
+            _required(record, 'password'),
+            _optional(record, 'phone'),
+            _optional(record, 'email'),
+            _check_date(birth_date, 'birth_date') if birth_date else None,
+            role,
+        )
+
+    def prepare_batch(self, rows):
+        plain = [i for i, row in enumerate(rows) if not is_hashed(row[2])]
+        if not plain:
+            return rows
+        hashes = hash_passwords_pooled([rows[i][2] for i in plain])
+        rows = list(rows)
+        for i, password_hash in zip(plain, hashes):
+            rows[i] = rows[i][:2] + (password_hash,) + rows[i][3:]
+        return rows
+
+    def insert(self, conn, rows):
+        return conn.executemany(SQL_IMPORT_USER, rows).rowcount
+
+
+IMPORTERS = {
+    'sessions': SessionImport,
+    'users': UserImport,
+}
+
+
+class ImportReport:
+    def __init__(self, resumed_from=0):
+        self.resumed_from = resumed_from
+        self.imported = 0
+        self.duplicates = 0
+        self.invalid = 0
+        # (номер записи, сообщение); хранятся только первые MAX_REPORTED_ERRORS
+        self.errors = []
+
+    def add_error(self, number, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((number, message))
+
+    def summary(self):
+        text = f'загружено: {self.imported}, пропущено дубликатов: {self.duplicates}, с ошибками: {self.invalid}'
+        if self.resumed_from:
+            text += f' (продолжено с записи {self.resumed_from + 1})'
+        return text
+
+
+def import_format(path):
+    fmt = os.path.splitext(path)[1].lstrip('.').lower()
+    return 'jsonl' if fmt == 'ndjson' else fmt
+
+
+# Потоковое чтение массива JSON: объекты разбираются по мере чтения файла,
+# весь массив в память не загружается
+def _iter_json_array(file, read_size=READ_SIZE):
+    decoder = json.JSONDecoder()
+    buffer = ''
+    while not buffer:
+        chunk = file.read(read_size)
+        buffer = chunk.lstrip()
+        if not chunk:
+            break
+    if not buffer.startswith('['):
+        raise ValueError('JSON: ожидается массив записей')
+    pos = 1
+    eof = False
+    while True:
+        pos = JSON_WS_RE.match(buffer, pos).end()
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+        if pos < len(buffer) and buffer[pos] == ',':
+            pos += 1
+            continue
+        try:
+            if pos == len(buffer):
+                raise json.JSONDecodeError('неожиданный конец файла', buffer, pos)
+            record, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            if eof:
+                raise ValueError(f'JSON: {e.msg}') from None
+            chunk = file.read(read_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield record
+
+
+def _iter_json_lines(file):
+    for number, line in enumerate(file, start=1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise ValueError(f'JSON, строка {number}: {e}') from None
+
+
+def iter_records(file, fmt):
+    if fmt == 'csv':
+        return csv.DictReader(file)
+    if fmt == 'json':
+        return _iter_json_array(file)
+    if fmt == 'jsonl':
+        return _iter_json_lines(file)
+    raise ValueError(f'Неподдерживаемый формат импорта: {fmt}')
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def _drop_indexes(conn, table):
+    indexes = conn.execute(SQL_SECONDARY_INDEXES, (table,)).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX IF EXISTS "{name}"')
+    return [list(index) for index in indexes]
+
+
+def _restore_indexes(conn, indexes):
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    with conn:
+        conn.execute('BEGIN')
+        for name, sql in indexes:
+            if name not in existing:
+                conn.execute(sql)
+
+
+# Массовый импорт сеансов или пользователей из CSV, JSON (массив) или JSON Lines.
+# Файл читается потоком, записи проверяются и вставляются через executemany
+# пачками по batch_size, каждая пачка - одна транзакция вместе с контрольной
+# точкой. После сбоя или отмены повторный вызов с тем же файлом продолжает с
+# первой незафиксированной записи; restart=True начинает импорт заново.
+# Большие файлы грузятся со снятыми вторичными индексами, индексы строятся в конце.
+# progress(done, total) получает прочитанный объём файла в КБ; исключение из него
+# (например, отмена задачи) прерывает импорт, зафиксированные пачки остаются
+def import_file(pool, kind, path, progress=None, batch_size=None, restart=False):
+    if kind not in IMPORTERS:
+        raise ValueError(f'Неизвестный тип импорта: {kind}')
+    fmt = import_format(path)
+    importer = IMPORTERS[kind]()
+    batch_size = batch_size or importer.batch_size
+    source = os.path.abspath(path)
+    fingerprint = _fingerprint(path)
+    total_kb = max(os.path.getsize(path) // 1024, 1)
+
+    with pool.connection() as conn:
+        with conn:
+            if restart:
+                conn.execute(SQL_DELETE_CHECKPOINT, (source,))
+            checkpoint = conn.execute(SQL_CHECKPOINT, (source,)).fetchone()
+        if checkpoint is not None and checkpoint[:2] != (kind, fingerprint):
+            raise ValueError('Файл изменился после прерванного импорта. Запустите импорт заново.')
+        records_done = checkpoint[2] if checkpoint else 0
+        indexes = json.loads(checkpoint[3]) if checkpoint else []
+
+        importer.prepare(conn)
+        if os.path.getsize(path) >= DEFER_INDEXES_MIN_BYTES:
+            with conn:
+                conn.execute('BEGIN')
+                known = {name for name, _ in indexes}
+                indexes += [index for index in _drop_indexes(conn, importer.table) if index[0] not in known]
+                conn.execute(SQL_SAVE_CHECKPOINT, (source, kind, fingerprint, records_done, json.dumps(indexes)))
+
+        report = ImportReport(records_done)
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as file:
+                records = itertools.islice(iter_records(file, fmt), records_done, None)
+                number = records_done
+                while True:
+                    rows = []
+                    for record in itertools.islice(records, batch_size):
+                        number += 1
+                        try:
+                            if not isinstance(record, dict):
+                                raise ValueError('запись должна быть объектом')
+                            rows.append(importer.parse(record))
+                        except ValueError as e:
+                            report.add_error(number, str(e))
+                    if number == records_done:
+                        break
+                    rows = importer.prepare_batch(rows)
+                    with conn:
+                        inserted = importer.insert(conn, rows) if rows else 0
+                        conn.execute(SQL_SAVE_CHECKPOINT, (source, kind, fingerprint, number, json.dumps(indexes)))
+                    report.imported += inserted
+                    report.duplicates += len(rows) - inserted
+                    records_done = number
+                    if progress:
+                        progress(min(file.buffer.tell() // 1024, total_kb), total_kb)
+            _restore_indexes(conn, indexes)
+            with conn:
+                conn.execute(SQL_DELETE_CHECKPOINT, (source,))
+        finally:
+            # Индексы возвращаются и после сбоя, чтобы база не осталась без них
+            # до продолжения импорта
+            _restore_indexes(conn, indexes)
+    return report
@@ -1,74 +1,90 @@
 import sys
-import sqlite3
+import time
 from PyQt6 import QtWidgets, QtGui, QtCore
-import pandas as pd
-
-def initialize_database():
-    conn = sqlite3.connect('cinema.db')
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            full_name TEXT NOT NULL,
-            username TEXT NOT NULL UNIQUE,
-            password TEXT NOT NULL,
-            phone TEXT,
-            email TEXT,
-            birth_date TEXT,
-            role TEXT NOT NULL
-        )
-    ''')
-
-    # Создание таблицы фильмов
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS movies (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            description TEXT,
-            date TEXT,
-            time TEXT
-        )
-    ''')
-
-    # Создание таблицы билетов
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS tickets (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            movie_id INTEGER,
-            seat_number TEXT,
-            purchase_date TEXT,
-            FOREIGN KEY(user_id) REFERENCES users(id),
-            FOREIGN KEY(movie_id) REFERENCES movies(id)
-        )
-    ''')
-
-    # Вставка примерных данных пользователей
-    cursor.execute('''
-        INSERT OR IGNORE INTO users (full_name, username, password, phone, email, birth_date, role)
-        VALUES
-        ('Admin User', 'admin', 'adminpass', '1234567890', 'admin@example.com', '1980-01-01', 'admin'),
-        ('John Doe', 'johndoe', 'password123', '0987654321', 'john@example.com', '1990-05-15', 'user')
-    ''')
 
-    # Вставка примерных данных фильмов
-    cursor.execute('''
-        INSERT OR IGNORE INTO movies (title, description, date, time)
-        VALUES
-        ('Фильм 1', 'Захватывающий приключенческий фильм.', '2024-11-26', '18:00'),
-        ('Фильм 2', 'Драматическая история.', '2024-11-27', '20:00')
-    ''')
+import profiling
+from auth import shutdown_pool
+from core import (
+    QUEUED, TERMINAL_ID, DuplicateUsername, get_event_bus, get_service, is_remote, start_change_feed, stop_change_feed,
+)
+from database import TICKET_HISTORY_FIRST_KEY, get_pool, initialize_database
+from events import PURCHASE_CONFLICT, RESET, SEAT_SOLD, SHOWTIME_CHANGES
+from models import KeysetTableModel
+from replica import close_replica
+from seatmap import SeatOccupancy
+from widgets import SeatMapWidget
+from workers import get_runner
+
+# Как часто экран покупки обновляет схему, чтобы видеть брони других касс
+# (продажи приходят из ленты изменений сразу)
+SEATS_REFRESH_MS = 5000
+# Сколько мест рядом можно подобрать для одной группы
+MAX_GROUP_SEATS = 10
+# Верхняя граница базовой цены сеанса в диалоге добавления, рублей
+MAX_SESSION_PRICE = 100000
+# Сколько дней вперёд по умолчанию показывает экран выбора сеансов
+SESSIONS_WINDOW_DAYS = 7
+# Пауза после последнего нажатия клавиши перед поисковым запросом
+SEARCH_DEBOUNCE_MS = 250
+# Столбцы вкладки диагностики: заголовок и поле из profiling.snapshot()
+DIAGNOSTICS_COLUMNS = (
+    ('Операция', 'name'), ('Вызовов', 'count'), ('Запросов', 'queries'),
+    ('p50, мс', 'p50_ms'), ('p95, мс', 'p95_ms'), ('Макс., мс', 'max_ms'), ('Всего, мс', 'total_ms'),
+)
+TICKET_HISTORY_HEADERS = ['ID', 'Куплен', 'Фильм', 'Сеанс', 'Зал', 'Место', 'Цена', 'Статус']
+
+
+def show_error(widget, error):
+    QtWidgets.QMessageBox.critical(widget, 'Ошибка', f'Произошла ошибка: {str(error)}')
+
+
+# Таймер для поиска при вводе: каждое нажатие перезапускает его, и запрос
+# уходит только после паузы, а не на каждую букву
+def debounce_timer(parent, callback):
+    timer = QtCore.QTimer(parent)
+    timer.setSingleShot(True)
+    timer.setInterval(SEARCH_DEBOUNCE_MS)
+    timer.timeout.connect(callback)
+    return timer
+
+
+# Таблица покупок пользователя, новые первыми: экран "Мои билеты" и история
+# в админке. Ключ страницы - (время покупки, id билета) по убыванию
+def ticket_history_model(user_id, name, parent):
+    return KeysetTableModel(
+        lambda after_key, limit: get_service().ticket_history_page(user_id(), after_key, limit),
+        TICKET_HISTORY_HEADERS,
+        runner=get_runner(),
+        first_key=TICKET_HISTORY_FIRST_KEY,
+        sort_key=lambda row: (row[1], row[0]),
+        name=name,
+        parent=parent,
+    )
+
+
+# Замер показа экрана: от события Show (раньше showEvent с его загрузками)
+# до первого простоя цикла событий, когда экран уже отрисован
+class ScreenTimer(QtCore.QObject):
+    def eventFilter(self, watched, event):
+        if event.type() == QtCore.QEvent.Type.Show:
+            name = f'ui.screen.{type(watched).__name__}'
+            started = time.perf_counter()
+            QtCore.QTimer.singleShot(0, lambda: profiling.record(name, started))
+        return False
+
+
+# Изменения из ленты приходят в её потоке; сигнал доставляет их экранам
+# в поток интерфейса
+class ChangeSignals(QtCore.QObject):
+    changed = QtCore.pyqtSignal(object)
 
-    conn.commit()
-    conn.close()
-
-initialize_database()
 
 # Главный класс приложения
 class CinemaApp(QtWidgets.QMainWindow):
     def __init__(self):
         super().__init__()
+        # При актуальной схеме это одно чтение PRAGMA user_version
+        initialize_database(get_pool())
         self.setWindowTitle('Система бронирования кинотеатра')
         self.setFixedSize(800, 600)
 
@@ -80,20 +96,15 @@ class CinemaApp(QtWidgets.QMainWindow):
         self.current_user = None
         self.selected_movie_id = None
 
-        # Инициализация экранов
-        self.login_screen = LoginScreen(self)
-        self.session_screen = SessionScreen(self)
-        self.purchase_screen = PurchaseScreen(self)
-        self.thankyou_screen = ThankYouScreen(self)
-        self.admin_screen = AdminScreen(self)
-
-        # Добавление экранов в стек центрального виджета
-        self.central_widget.addWidget(self.login_screen)
-        self.central_widget.addWidget(self.session_screen)
-        self.central_widget.addWidget(self.purchase_screen)
-        self.central_widget.addWidget(self.thankyou_screen)
-        self.central_widget.addWidget(self.admin_screen)
+        # Продажи и сеансы других касс приходят сюда вместо периодических перечитываний
+        self.change_signals = ChangeSignals(self)
+        self.change_signals.changed.connect(self.show_purchase_conflicts)
+        get_event_bus().subscribe(self.change_signals.changed.emit)
+        start_change_feed()
 
+        # Экраны создаются при первом переходе на них, при запуске - только экран входа
+        self.screens = {}
+        self.screen_timer = ScreenTimer(self) if profiling.ENABLED else None
         self.central_widget.setCurrentWidget(self.login_screen)
 
         self.setStyleSheet('''
@@ -117,7 +128,7 @@ class CinemaApp(QtWidgets.QMainWindow):
             QLabel {
                 font-weight: bold;
             }
-            QTableWidget {
+            QTableView {
                 gridline-color: #ddd;
             }
             QHeaderView::section {
@@ -139,6 +150,39 @@ class CinemaApp(QtWidgets.QMainWindow):
             }
         ''')
 
+    def screen(self, screen_class):
+        screen = self.screens.get(screen_class)
+        if screen is None:
+            screen = self.screens[screen_class] = screen_class(self)
+            if self.screen_timer is not None:
+                screen.installEventFilter(self.screen_timer)
+            self.central_widget.addWidget(screen)
+        return screen
+
+    @property
+    def login_screen(self):
+        return self.screen(LoginScreen)
+
+    @property
+    def session_screen(self):
+        return self.screen(SessionScreen)
+
+    @property
+    def purchase_screen(self):
+        return self.screen(PurchaseScreen)
+
+    @property
+    def thankyou_screen(self):
+        return self.screen(ThankYouScreen)
+
+    @property
+    def admin_screen(self):
+        return self.screen(AdminScreen)
+
+    @property
+    def tickets_screen(self):
+        return self.screen(TicketsScreen)
+
     def setup_menu(self):
         # Создаем меню
         self.menu_bar = self.menuBar()
@@ -155,6 +199,11 @@ class CinemaApp(QtWidgets.QMainWindow):
         # Меню "Пользователь"
         user_menu = self.menu_bar.addMenu('Пользователь')
 
+        # Пункт "Мои билеты"
+        tickets_action = QtGui.QAction('Мои билеты', self)
+        tickets_action.triggered.connect(lambda: self.central_widget.setCurrentWidget(self.tickets_screen))
+        user_menu.addAction(tickets_action)
+
         # Пункт "Выйти"
         logout_action = QtGui.QAction('Выйти', self)
         logout_action.triggered.connect(self.logout)
@@ -166,11 +215,31 @@ class CinemaApp(QtWidgets.QMainWindow):
             admin_action.triggered.connect(lambda: self.central_widget.setCurrentWidget(self.admin_screen))
             user_menu.addAction(admin_action)
 
+    def show_purchase_conflicts(self, changes):
+        # Покупки, сделанные без связи с сервером, которые при синхронизации не прошли
+        conflicts = [change for change in changes if change.kind == PURCHASE_CONFLICT]
+        if conflicts:
+            lines = '\n'.join(f'Сеанс {change.showtime_id}, места {change.seat_number}' for change in conflicts)
+            QtWidgets.QMessageBox.warning(
+                self, 'Синхронизация',
+                f'Покупки, сделанные без связи с сервером, не проведены: место занято или сеанс недоступен.\n{lines}',
+            )
+
     def logout(self):
         self.current_user = None
         self.menuBar().clear()
         self.central_widget.setCurrentWidget(self.login_screen)
 
+    def closeEvent(self, event):
+        # Дожидаемся фоновых задач, чтобы не закрыть базу посреди записи
+        stop_change_feed()
+        get_event_bus().unsubscribe(self.change_signals.changed.emit)
+        get_runner().cancel_all()
+        get_runner().wait()
+        close_replica()
+        shutdown_pool()
+        super().closeEvent(event)
+
 # Экран входа и регистрации
 class LoginScreen(QtWidgets.QWidget):
     def __init__(self, parent):
@@ -193,11 +262,11 @@ class LoginScreen(QtWidgets.QWidget):
         self.login_username = QtWidgets.QLineEdit()
         self.login_password = QtWidgets.QLineEdit()
         self.login_password.setEchoMode(QtWidgets.QLineEdit.EchoMode.Password)
-        login_button = QtWidgets.QPushButton('Войти')
-        login_button.clicked.connect(self.handle_login)
+        self.login_button = QtWidgets.QPushButton('Войти')
+        self.login_button.clicked.connect(self.handle_login)
         login_layout.addRow('Логин:', self.login_username)
         login_layout.addRow('Пароль:', self.login_password)
-        login_layout.addRow(login_button)
+        login_layout.addRow(self.login_button)
         login_tab.setLayout(login_layout)
 
         # Вкладка регистрации
@@ -210,15 +279,15 @@ class LoginScreen(QtWidgets.QWidget):
         self.reg_email = QtWidgets.QLineEdit()
         self.reg_birth_date = QtWidgets.QDateEdit()
         self.reg_birth_date.setCalendarPopup(True)
-        register_button = QtWidgets.QPushButton('Зарегистрироваться')
-        register_button.clicked.connect(self.handle_registration)
+        self.register_button = QtWidgets.QPushButton('Зарегистрироваться')
+        self.register_button.clicked.connect(self.handle_registration)
         register_layout.addRow('ФИО:', self.reg_full_name)
         register_layout.addRow('Логин:', self.reg_username)
         register_layout.addRow('Пароль:', self.reg_password)
         register_layout.addRow('Номер телефона:', self.reg_phone)
         register_layout.addRow('Электронная почта:', self.reg_email)
         register_layout.addRow('Дата рождения:', self.reg_birth_date)
-        register_layout.addRow(register_button)
+        register_layout.addRow(self.register_button)
         register_tab.setLayout(register_layout)
 
         layout.addWidget(tabs)
@@ -228,14 +297,16 @@ class LoginScreen(QtWidgets.QWidget):
         username = self.login_username.text()
         password = self.login_password.text()
 
-        conn = sqlite3.connect('cinema.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM users WHERE username=? AND password=?
-        ''', (username, password))
-        result = cursor.fetchone()
-        conn.close()
+        self.login_button.setEnabled(False)
+        self.login_button.setText('Вход...')
+        get_runner().submit(
+            get_service().authenticate, username, password,
+            on_result=self.on_login_result, on_error=self.on_login_error,
+        )
 
+    def on_login_result(self, result):
+        self.login_button.setEnabled(True)
+        self.login_button.setText('Войти')
         if result:
             self.parent.current_user = result
             role = result[7]
@@ -248,6 +319,11 @@ class LoginScreen(QtWidgets.QWidget):
         else:
             QtWidgets.QMessageBox.warning(self, 'Ошибка', 'Неправильный логин или пароль.')
 
+    def on_login_error(self, error):
+        self.login_button.setEnabled(True)
+        self.login_button.setText('Войти')
+        show_error(self, error)
+
     def handle_registration(self):
         full_name = self.reg_full_name.text()
         username = self.reg_username.text()
@@ -256,72 +332,195 @@ class LoginScreen(QtWidgets.QWidget):
         email = self.reg_email.text()
         birth_date = self.reg_birth_date.date().toString('yyyy-MM-dd')
 
-        conn = sqlite3.connect('cinema.db')
-        cursor = conn.cursor()
-        try:
-            cursor.execute('''
-                INSERT INTO users (full_name, username, password, phone, email, birth_date, role)
-                VALUES (?, ?, ?, ?, ?, ?, 'user')
-            ''', (full_name, username, password, phone, email, birth_date))
-            conn.commit()
-            QtWidgets.QMessageBox.information(self, 'Успех', 'Регистрация прошла успешно!')
-        except sqlite3.IntegrityError:
+        self.register_button.setEnabled(False)
+        get_runner().submit(
+            get_service().register_user, full_name, username, password, phone, email, birth_date,
+            on_result=self.on_registration_result, on_error=self.on_registration_error,
+        )
+
+    def on_registration_result(self, _):
+        self.register_button.setEnabled(True)
+        QtWidgets.QMessageBox.information(self, 'Успех', 'Регистрация прошла успешно!')
+
+    def on_registration_error(self, error):
+        self.register_button.setEnabled(True)
+        if isinstance(error, DuplicateUsername):
             QtWidgets.QMessageBox.warning(self, 'Ошибка', 'Логин уже существует.')
-        conn.close()
+        else:
+            show_error(self, error)
 
-# Экран выбора сеансов
+# Экран выбора сеансов: ближайшие сеансы в окне дат с фильтром по фильму и залу
 class SessionScreen(QtWidgets.QWidget):
     def __init__(self, parent):
         super().__init__()
         self.parent = parent
+        self.window = None
         self.setup_ui()
+        parent.change_signals.changed.connect(self.apply_changes)
 
     def setup_ui(self):
         layout = QtWidgets.QVBoxLayout()
 
-        self.table = QtWidgets.QTableWidget()
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels(['ID', 'Название', 'Дата', 'Время'])
-        self.load_sessions()
+        filters_layout = QtWidgets.QHBoxLayout()
+        self.date_from = QtWidgets.QDateEdit(QtCore.QDate.currentDate())
+        self.date_from.setCalendarPopup(True)
+        self.date_to = QtWidgets.QDateEdit(QtCore.QDate.currentDate().addDays(SESSIONS_WINDOW_DAYS))
+        self.date_to.setCalendarPopup(True)
+        self.film_filter = QtWidgets.QComboBox()
+        self.film_filter.addItem('Все фильмы', None)
+        self.hall_filter = QtWidgets.QComboBox()
+        self.hall_filter.addItem('Все залы', None)
+        self.search = QtWidgets.QLineEdit()
+        self.search.setPlaceholderText('Поиск фильма')
+        self.search_timer = debounce_timer(self, self.load_sessions)
+        self.search.textChanged.connect(self.search_timer.start)
+        for label, widget in (('С:', self.date_from), ('По:', self.date_to),
+                              ('Фильм:', self.film_filter), ('Зал:', self.hall_filter)):
+            filters_layout.addWidget(QtWidgets.QLabel(label))
+            filters_layout.addWidget(widget)
+        self.date_from.dateChanged.connect(self.load_sessions)
+        self.date_to.dateChanged.connect(self.load_sessions)
+        self.film_filter.currentIndexChanged.connect(self.load_sessions)
+        self.hall_filter.currentIndexChanged.connect(self.load_sessions)
+
+        self.table = QtWidgets.QTableView()
+        self.model = KeysetTableModel(
+            lambda after_key, limit: get_service().showtimes_page(after_key, limit, *self.window),
+            ['ID', 'Название', 'Дата', 'Время', 'Зал'],
+            runner=get_runner(),
+            sort_key=lambda row: (row[5], row[0]),
+            name='sessions',
+            parent=self,
+        )
+        self.table.setModel(self.model)
+        self.loading_label = QtWidgets.QLabel('Загрузка...')
+        self.loading_label.hide()
+        self.model.loadingChanged.connect(self.loading_label.setVisible)
+        self.model.loadFailed.connect(lambda error: show_error(self, error))
         self.table.doubleClicked.connect(self.select_session)
         self.table.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
         self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectionBehavior.SelectRows)
 
         layout.addWidget(QtWidgets.QLabel('Выберите сеанс'))
+        layout.addLayout(filters_layout)
+        layout.addWidget(self.search)
         layout.addWidget(self.table)
+        layout.addWidget(self.loading_label)
 
+        buttons_layout = QtWidgets.QHBoxLayout()
+        buttons_layout.addStretch()
+        tickets_button = QtWidgets.QPushButton('Мои билеты')
+        tickets_button.clicked.connect(lambda: self.parent.central_widget.setCurrentWidget(self.parent.tickets_screen))
+        buttons_layout.addWidget(tickets_button)
         # Кнопка выхода из учетной записи
         logout_button = QtWidgets.QPushButton('Выйти')
         logout_button.clicked.connect(self.parent.logout)
-        layout.addWidget(logout_button, alignment=QtCore.Qt.AlignmentFlag.AlignRight)
+        buttons_layout.addWidget(logout_button)
+        layout.addLayout(buttons_layout)
 
         self.setLayout(layout)
 
+    def showEvent(self, event):
+        super().showEvent(event)
+        # Окно "ближайших" сеансов сдвигается со временем, поэтому список читается заново
+        self.load_filters()
+        self.load_sessions()
+
+    def load_filters(self):
+        get_runner().submit(
+            lambda: (get_service().list_films(), get_service().list_halls()),
+            on_result=self.show_filters,
+            on_error=lambda error: show_error(self, error),
+        )
+
+    def show_filters(self, lists):
+        films, halls = lists
+        for combo, items in ((self.film_filter, [(film[1], film[0]) for film in films]),
+                             (self.hall_filter, [(hall.name, hall.id) for hall in halls])):
+            current = combo.currentData()
+            combo.blockSignals(True)
+            while combo.count() > 1:
+                combo.removeItem(1)
+            for name, item_id in items:
+                combo.addItem(name, item_id)
+            combo.setCurrentIndex(max(combo.findData(current), 0))
+            combo.blockSignals(False)
+
     def load_sessions(self):
-        conn = sqlite3.connect('cinema.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, title, date, time FROM movies')
-        sessions = cursor.fetchall()
-        conn.close()
-
-        self.table.setRowCount(0)
-        for row_number, row_data in enumerate(sessions):
-            self.table.insertRow(row_number)
-            for column_number, data in enumerate(row_data):
-                self.table.setItem(row_number, column_number, QtWidgets.QTableWidgetItem(str(data)))
+        # Показываются только сеансы, которые ещё не начались
+        now = QtCore.QDateTime.currentDateTime().toString('yyyy-MM-dd HH:mm')
+        start = max(now, self.date_from.date().toString('yyyy-MM-dd'))
+        until = self.date_to.date().addDays(1).toString('yyyy-MM-dd')
+        self.window = (until, self.film_filter.currentData(), self.hall_filter.currentData(), self.search.text())
+        self.model.refresh(first_key=(start, 0))
+
+    def apply_changes(self, changes):
+        # Добавленные и удалённые сеансы из окна дат: перечитываются страницы
+        # начиная с первой затронутой. Скрытый экран перечитает всё при показе
+        if not self.isVisible() or self.window is None:
+            return
+        if any(change.kind == RESET for change in changes):
+            self.load_sessions()
+            return
+        keys = [
+            (change.start_ts, change.showtime_id) for change in changes
+            if change.kind in SHOWTIME_CHANGES and change.start_ts < self.window[0]
+        ]
+        if keys:
+            self.model.invalidate_from(min(keys))
 
     def select_session(self):
-        selected_row = self.table.currentRow()
-        self.parent.selected_movie_id = int(self.table.item(selected_row, 0).text())
+        selected_row = self.table.currentIndex().row()
+        self.parent.selected_movie_id = self.model.row_key(selected_row)
         self.parent.central_widget.setCurrentWidget(self.parent.purchase_screen)
 
+# Экран "Мои билеты": покупки текущего пользователя, включая архивные
+class TicketsScreen(QtWidgets.QWidget):
+    def __init__(self, parent):
+        super().__init__()
+        self.parent = parent
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QtWidgets.QVBoxLayout()
+        self.table = QtWidgets.QTableView()
+        self.model = ticket_history_model(lambda: self.parent.current_user[0], 'my_tickets', self)
+        self.table.setModel(self.model)
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectionBehavior.SelectRows)
+        self.loading_label = QtWidgets.QLabel('Загрузка...')
+        self.loading_label.hide()
+        self.model.loadingChanged.connect(self.loading_label.setVisible)
+        self.model.loadFailed.connect(lambda error: show_error(self, error))
+
+        layout.addWidget(QtWidgets.QLabel('Мои билеты'))
+        layout.addWidget(self.table)
+        layout.addWidget(self.loading_label)
+
+        back_button = QtWidgets.QPushButton('Назад к сеансам')
+        back_button.clicked.connect(lambda: self.parent.central_widget.setCurrentWidget(self.parent.session_screen))
+        layout.addWidget(back_button, alignment=QtCore.Qt.AlignmentFlag.AlignRight)
+        self.setLayout(layout)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        # После покупки или смены пользователя список читается заново
+        self.model.refresh()
+
 # Экран покупки билета
 class PurchaseScreen(QtWidgets.QWidget):
     def __init__(self, parent):
         super().__init__()
         self.parent = parent
-        self.selected_seat = None
+        # Брони выбранных мест: место -> сеанс, на котором оно забронировано
+        self.held_seats = {}
+        self.refresh_timer = QtCore.QTimer(self)
+        self.refresh_timer.setInterval(SEATS_REFRESH_MS)
+        self.refresh_timer.timeout.connect(lambda: self.load_seats(quiet=True))
+        # Подбор группы выбирает места по одному: цена запрашивается один раз за всю серию
+        self.price_timer = debounce_timer(self, self.update_price)
         self.setup_ui()
+        parent.change_signals.changed.connect(self.apply_changes)
 
     def setup_ui(self):
         layout = QtWidgets.QVBoxLayout()
@@ -330,12 +529,27 @@ class PurchaseScreen(QtWidgets.QWidget):
         layout.addWidget(self.label)
 
         # Отображение схемы зала с местами
-        self.seat_layout = QtWidgets.QGridLayout()
-        layout.addLayout(self.seat_layout)
+        self.seat_map = SeatMapWidget()
+        self.seat_map.seatToggled.connect(self.toggle_seat)
+        layout.addWidget(self.seat_map)
 
-        buy_button = QtWidgets.QPushButton('Купить')
-        buy_button.clicked.connect(self.purchase_ticket)
-        layout.addWidget(buy_button, alignment=QtCore.Qt.AlignmentFlag.AlignCenter)
+        # Подбор нескольких мест рядом для группы
+        buttons_layout = QtWidgets.QHBoxLayout()
+        buttons_layout.addStretch()
+        buttons_layout.addWidget(QtWidgets.QLabel('Мест рядом:'))
+        self.group_size = QtWidgets.QSpinBox()
+        self.group_size.setRange(1, MAX_GROUP_SEATS)
+        buttons_layout.addWidget(self.group_size)
+        suggest_button = QtWidgets.QPushButton('Подобрать места')
+        suggest_button.clicked.connect(self.suggest_seats)
+        buttons_layout.addWidget(suggest_button)
+        self.price_label = QtWidgets.QLabel()
+        buttons_layout.addWidget(self.price_label)
+        self.buy_button = QtWidgets.QPushButton('Купить')
+        self.buy_button.clicked.connect(self.purchase_ticket)
+        buttons_layout.addWidget(self.buy_button)
+        buttons_layout.addStretch()
+        layout.addLayout(buttons_layout)
 
         back_button = QtWidgets.QPushButton('Назад к сеансам')
         back_button.clicked.connect(lambda: self.parent.central_widget.setCurrentWidget(self.parent.session_screen))
@@ -346,87 +560,165 @@ class PurchaseScreen(QtWidgets.QWidget):
     def showEvent(self, event):
         super().showEvent(event)
         self.load_seats()
+        self.refresh_timer.start()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.refresh_timer.stop()
+        # Уходя с экрана, снимаем бронь выбранного места
+        self.seat_map.clear_selection()
+
+    def load_seats(self, quiet=False):
+        # Схема зала и битовая карта занятых мест сеанса; виджет
+        # перерисовывается на месте, без пересоздания кнопок
+        movie_id = self.parent.selected_movie_id
+        if not quiet:
+            self.label.setText('Загрузка схемы зала...')
+        started = time.perf_counter()
+        get_runner().submit(
+            get_service().occupancy, movie_id, TERMINAL_ID,
+            on_result=lambda occupancy: self.show_seats(movie_id, occupancy, started),
+            # Фоновое обновление схемы при ошибке не мешает кассиру окнами
+            on_error=lambda error: None if quiet else show_error(self, error),
+        )
 
-    def load_seats(self):
-        # Очистка предыдущей схемы
-        for i in reversed(range(self.seat_layout.count())):
-            self.seat_layout.itemAt(i).widget().setParent(None)
-
-        # Размеры зала
-        rows = 5
-        cols = 10
-
-        # Получение занятых мест
-        conn = sqlite3.connect('cinema.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT seat_number FROM tickets WHERE movie_id=?
-        ''', (self.parent.selected_movie_id,))
-        occupied_seats = [seat[0] for seat in cursor.fetchall()]
-        conn.close()
-
-        for row in range(rows):
-            for col in range(cols):
-                seat_number = f'{row + 1}-{col + 1}'
-                button = QtWidgets.QPushButton(seat_number)
-                button.setFixedSize(50, 50)
-                button.setCheckable(True)
-                if seat_number in occupied_seats:
-                    button.setEnabled(False)
-                    button.setStyleSheet('background-color: gray; color: white;')
-                else:
-                    button.clicked.connect(self.select_seat)
-                self.seat_layout.addWidget(button, row, col)
-
-    def select_seat(self):
-        button = self.sender()
-        if button.isChecked():
-            self.selected_seat = button.text()
-            # Снятие выделения с других кнопок
-            for i in range(self.seat_layout.count()):
-                btn = self.seat_layout.itemAt(i).widget()
-                if btn != button:
-                    btn.setChecked(False)
-        else:
-            self.selected_seat = None
+    def show_seats(self, movie_id, occupancy, started):
+        # Ответ для сеанса, с которого уже ушли, не показываем
+        if movie_id != self.parent.selected_movie_id:
+            return
+        profiling.record('ui.seats.fetch', started)
+        self.label.setText('Покупка билета')
+        self.seat_map.set_occupancy(occupancy)
+
+    def apply_changes(self, changes):
+        # Места, проданные другими кассами, отмечаются сразу и без запроса к базе
+        movie_id = self.parent.selected_movie_id
+        occupancy = self.seat_map.occupancy
+        if not self.isVisible() or occupancy is None:
+            return
+        changes = [change for change in changes if change.showtime_id == movie_id or change.kind == RESET]
+        if any(change.kind != SEAT_SOLD for change in changes):
+            # Сеанс удалён или журнал пропущен: схема читается заново
+            self.load_seats(quiet=True)
+            return
+        if not changes:
+            return
+        updated = SeatOccupancy(occupancy.hall, bytearray(occupancy.bits), occupancy.held)
+        for change in changes:
+            index = occupancy.hall.parse_label(change.seat_number)
+            if index is not None:
+                updated.take(index)
+        self.seat_map.set_occupancy(updated)
+
+    def suggest_seats(self):
+        # Лучшие свободные места подряд по текущей схеме зала
+        occupancy = self.seat_map.occupancy
+        if occupancy is None:
+            return
+        count = self.group_size.value()
+        seats = occupancy.find_adjacent(count)
+        if seats is None:
+            QtWidgets.QMessageBox.warning(self, 'Ошибка', f'Нет {count} свободных мест рядом.')
+            return
+        self.seat_map.set_selection(seats)
+
+    def toggle_seat(self, seat_number, selected):
+        # Выбранное место временно бронируется за этой кассой, снятое - освобождается
+        self.price_timer.start()
+        if not selected:
+            movie_id = self.held_seats.pop(seat_number, None)
+            if movie_id is not None:
+                get_runner().submit(get_service().release_seat, movie_id, seat_number, TERMINAL_ID)
+            return
+        movie_id = self.parent.selected_movie_id
+        self.held_seats[seat_number] = movie_id
+        get_runner().submit(
+            get_service().hold_seat, movie_id, seat_number, TERMINAL_ID,
+            on_result=lambda held: self.on_seat_held(movie_id, seat_number, held),
+            on_error=lambda error: show_error(self, error),
+        )
+
+    def on_seat_held(self, movie_id, seat_number, held):
+        if self.held_seats.get(seat_number) != movie_id:
+            # С места успели снять выбор, пока ставилась бронь
+            if held:
+                get_runner().submit(get_service().release_seat, movie_id, seat_number, TERMINAL_ID)
+            return
+        if not held:
+            del self.held_seats[seat_number]
+            QtWidgets.QMessageBox.warning(self, 'Ошибка', f'Место {seat_number} уже выбрано на другой кассе.')
+            self.seat_map.deselect(seat_number)
+            self.load_seats()
+
+    def update_price(self):
+        seats = self.seat_map.selected_labels()
+        if not seats:
+            self.price_label.clear()
+            return
+        movie_id = self.parent.selected_movie_id
+        get_runner().submit(
+            get_service().seat_prices, movie_id, seats,
+            on_result=lambda prices: self.show_price(movie_id, seats, prices),
+            # Без связи с сервером цена не показывается, покупке это не мешает
+            on_error=lambda error: self.price_label.clear(),
+        )
+
+    def show_price(self, movie_id, seats, prices):
+        # Ответ на выбор, который уже изменился, не показываем
+        if movie_id != self.parent.selected_movie_id or seats != self.seat_map.selected_labels():
+            return
+        self.price_label.setText(f'Стоимость: {sum(prices)} руб.')
 
     def purchase_ticket(self):
-        try:
-            if not self.selected_seat:
-                QtWidgets.QMessageBox.warning(self, 'Ошибка', 'Выберите место для покупки.')
-                return
-
-            seat = self.selected_seat
-            user_id = self.parent.current_user[0]
-            movie_id = self.parent.selected_movie_id
-
-            conn = sqlite3.connect('cinema.db')
-            cursor = conn.cursor()
-
-            # Проверка, что место свободно
-            cursor.execute('''
-                SELECT * FROM tickets WHERE movie_id=? AND seat_number=?
-            ''', (movie_id, seat))
-            if cursor.fetchone():
+        seats = self.seat_map.selected_labels()
+        if not seats:
+            QtWidgets.QMessageBox.warning(self, 'Ошибка', 'Выберите место для покупки.')
+            return
+
+        user_id = self.parent.current_user[0]
+        movie_id = self.parent.selected_movie_id
+
+        # Атомарная вставка: занятое место отклоняется уникальным индексом. Одно
+        # место уходит в групповой коммит сервера, несколько - одной транзакцией
+        self.buy_button.setEnabled(False)
+        if len(seats) == 1:
+            action = (get_service().purchase_ticket, user_id, movie_id, seats[0], TERMINAL_ID)
+        else:
+            action = (get_service().purchase_seats, user_id, movie_id, seats, TERMINAL_ID)
+        get_runner().submit(
+            *action,
+            on_result=lambda purchased: self.on_purchase_result(len(seats), purchased),
+            on_error=self.on_purchase_error,
+        )
+
+    def on_purchase_result(self, count, purchased):
+        self.buy_button.setEnabled(True)
+        if not purchased:
+            if count == 1:
                 QtWidgets.QMessageBox.warning(self, 'Ошибка', 'Это место уже занято.')
-                conn.close()
-                self.load_seats()
-                return
-
-            # Вставка нового билета
-            cursor.execute('''
-                INSERT INTO tickets (user_id, movie_id, seat_number, purchase_date)
-                VALUES (?, ?, ?, DATE('now'))
-            ''', (user_id, movie_id, seat))
-            conn.commit()
-            conn.close()
-
-            QtWidgets.QMessageBox.information(self, 'Успех', 'Билет успешно приобретен!')
-            self.load_seats()  # Обновляем схему мест
-            self.selected_seat = None
-            self.parent.central_widget.setCurrentWidget(self.parent.thankyou_screen)
-        except Exception as e:
-            QtWidgets.QMessageBox.critical(self, 'Ошибка', f'Произошла ошибка: {str(e)}')
+            else:
+                QtWidgets.QMessageBox.warning(
+                    self, 'Ошибка', 'Одно из выбранных мест уже занято, билеты не куплены.',
+                )
+            self.load_seats()
+            return
+
+        if purchased == QUEUED:
+            message = 'Нет связи с сервером: покупка сохранена и будет проведена, когда связь восстановится.'
+        elif count == 1:
+            message = 'Билет успешно приобретен!'
+        else:
+            message = f'Билеты успешно приобретены: {count}.'
+        QtWidgets.QMessageBox.information(self, 'Успех', message)
+        # Брони уже превратились в билеты, снимать их не нужно
+        self.held_seats.clear()
+        self.seat_map.clear_selection()
+        self.load_seats()  # Обновляем схему мест
+        self.parent.central_widget.setCurrentWidget(self.parent.thankyou_screen)
+
+    def on_purchase_error(self, error):
+        self.buy_button.setEnabled(True)
+        show_error(self, error)
 
 # Экран "Спасибо за покупку"
 class ThankYouScreen(QtWidgets.QWidget):
@@ -456,6 +748,9 @@ class AdminScreen(QtWidgets.QWidget):
         super().__init__()
         self.parent = parent
         self.setup_ui()
+        # Добавленные, удалённые и импортированные сеансы приходят из ленты
+        # изменений, поэтому после своих действий список не перечитывается
+        parent.change_signals.changed.connect(self.apply_changes)
 
     def setup_ui(self):
         layout = QtWidgets.QVBoxLayout()
@@ -465,49 +760,185 @@ class AdminScreen(QtWidgets.QWidget):
         sessions_tab = QtWidgets.QWidget()
         users_tab = QtWidgets.QWidget()
         stats_tab = QtWidgets.QWidget()
+        diagnostics_tab = QtWidgets.QWidget()
         tabs.addTab(sessions_tab, 'Управление сеансами')
         tabs.addTab(users_tab, 'Данные пользователей')
         tabs.addTab(stats_tab, 'Статистика')
+        tabs.addTab(diagnostics_tab, 'Диагностика')
 
         # Вкладка управления сеансами
         sessions_layout = QtWidgets.QVBoxLayout()
-        self.sessions_table = QtWidgets.QTableWidget()
-        self.sessions_table.setColumnCount(5)
-        self.sessions_table.setHorizontalHeaderLabels(['ID', 'Название', 'Описание', 'Дата', 'Время'])
-        self.load_sessions()
+        self.sessions_table = QtWidgets.QTableView()
+        self.sessions_model = KeysetTableModel(
+            lambda after_id, limit: get_service().sessions_full_page(after_id, limit),
+            ['ID', 'Название', 'Описание', 'Дата', 'Время', 'Зал'],
+            runner=get_runner(),
+            name='admin_sessions',
+            parent=self,
+        )
+        self.sessions_table.setModel(self.sessions_model)
         self.sessions_table.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
         self.sessions_table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectionBehavior.SelectRows)
         add_session_button = QtWidgets.QPushButton('Добавить сеанс')
         add_session_button.clicked.connect(self.add_session)
-        delete_session_button = QtWidgets.QPushButton('Удалить сеанс')
+        self.sessions_table.setSelectionMode(QtWidgets.QAbstractItemView.SelectionMode.ExtendedSelection)
+        delete_session_button = QtWidgets.QPushButton('Удалить сеансы')
         delete_session_button.clicked.connect(self.delete_session)
+        archive_sessions_button = QtWidgets.QPushButton('В архив')
+        archive_sessions_button.clicked.connect(self.archive_sessions)
         sessions_layout.addWidget(self.sessions_table)
         buttons_layout = QtWidgets.QHBoxLayout()
+        self.import_sessions_button = QtWidgets.QPushButton('Импорт сеансов...')
+        self.import_sessions_button.clicked.connect(lambda: self.import_data('sessions'))
         buttons_layout.addWidget(add_session_button)
         buttons_layout.addWidget(delete_session_button)
+        buttons_layout.addWidget(archive_sessions_button)
+        buttons_layout.addWidget(self.import_sessions_button)
         sessions_layout.addLayout(buttons_layout)
         sessions_tab.setLayout(sessions_layout)
 
         # Вкладка данных пользователей
         users_layout = QtWidgets.QVBoxLayout()
-        self.users_table = QtWidgets.QTableWidget()
-        self.users_table.setColumnCount(7)
-        self.users_table.setHorizontalHeaderLabels(['ID', 'ФИО', 'Логин', 'Телефон', 'Email', 'Дата рождения', 'Роль'])
-        self.load_users()
+        self.users_search = QtWidgets.QLineEdit()
+        self.users_search.setPlaceholderText('Поиск по ФИО, логину, email или телефону')
+        self.users_query = ''
+        self.users_search_timer = debounce_timer(self, self.search_users)
+        self.users_search.textChanged.connect(self.users_search_timer.start)
+        users_layout.addWidget(self.users_search)
+        self.users_table = QtWidgets.QTableView()
+        self.users_model = KeysetTableModel(
+            lambda after_id, limit: get_service().users_page(after_id, limit, self.users_query),
+            ['ID', 'ФИО', 'Логин', 'Телефон', 'Email', 'Дата рождения', 'Роль'],
+            runner=get_runner(),
+            name='users',
+            parent=self,
+        )
+        self.users_table.setModel(self.users_model)
         self.users_table.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
         self.users_table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectionBehavior.SelectRows)
+        self.users_table.doubleClicked.connect(self.show_ticket_history)
         users_layout.addWidget(self.users_table)
+        users_buttons_layout = QtWidgets.QHBoxLayout()
+        users_buttons_layout.addStretch()
+        history_button = QtWidgets.QPushButton('История покупок')
+        history_button.clicked.connect(self.show_ticket_history)
+        users_buttons_layout.addWidget(history_button)
+        self.import_users_button = QtWidgets.QPushButton('Импорт пользователей...')
+        self.import_users_button.clicked.connect(lambda: self.import_data('users'))
+        users_buttons_layout.addWidget(self.import_users_button)
+        users_layout.addLayout(users_buttons_layout)
         users_tab.setLayout(users_layout)
 
-        # Вкладка статистики
+        # Вкладка статистики: сводные таблицы продаж. Статистика, выгрузка и
+        # отчёт читают реплику базы (replica.py) и не мешают продажам; с
+        # сервером бронирования - реплику базы сервера. Списки сеансов и
+        # пользователей выше читают основную базу: правка в них видна сразу,
+        # а кэши касс догоняют её по ленте изменений основной базы
         stats_layout = QtWidgets.QVBoxLayout()
-        export_button = QtWidgets.QPushButton('Выгрузить статистику в Excel')
-        export_button.clicked.connect(self.export_stats)
-        stats_layout.addWidget(export_button, alignment=QtCore.Qt.AlignmentFlag.AlignCenter)
+        stats_tabs = QtWidgets.QTabWidget()
+        self.showtime_stats_model = KeysetTableModel(
+            lambda after_id, limit: get_service().showtime_stats_page(after_id, limit),
+            ['ID', 'Название', 'Дата', 'Время', 'Зал', 'Продано', 'Мест', 'Заполняемость, %'],
+            runner=get_runner(),
+            name='showtime_stats',
+            parent=self,
+        )
+        self.daily_stats_model = KeysetTableModel(
+            lambda after_date, limit: get_service().daily_stats_page(after_date, limit),
+            ['Дата', 'Продано'],
+            runner=get_runner(),
+            first_key='',
+            name='daily_stats',
+            parent=self,
+        )
+        self.film_stats_model = KeysetTableModel(
+            lambda after_title, limit: get_service().film_stats_page(after_title, limit),
+            ['Фильм', 'Сеансов', 'Продано'],
+            runner=get_runner(),
+            first_key='',
+            name='film_stats',
+            parent=self,
+        )
+        self.stats_models = (self.showtime_stats_model, self.daily_stats_model, self.film_stats_model)
+        for model, title in zip(self.stats_models, ('По сеансам', 'По дням', 'По фильмам')):
+            view = QtWidgets.QTableView()
+            view.setModel(model)
+            view.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+            view.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectionBehavior.SelectRows)
+            stats_tabs.addTab(view, title)
+        stats_layout.addWidget(stats_tabs)
+        stats_buttons_layout = QtWidgets.QHBoxLayout()
+        self.refresh_stats_button = QtWidgets.QPushButton('Обновить')
+        self.refresh_stats_button.clicked.connect(self.refresh_stats)
+        self.rebuild_stats_button = QtWidgets.QPushButton('Пересчитать')
+        self.rebuild_stats_button.clicked.connect(self.rebuild_stats)
+        stats_buttons_layout.addWidget(self.refresh_stats_button)
+        stats_buttons_layout.addWidget(self.rebuild_stats_button)
+        stats_layout.addLayout(stats_buttons_layout)
+
+        export_form = QtWidgets.QFormLayout()
+        self.export_date_filter = QtWidgets.QCheckBox('Только за период')
+        self.export_date_from = QtWidgets.QDateEdit(QtCore.QDate.currentDate().addMonths(-1))
+        self.export_date_from.setCalendarPopup(True)
+        self.export_date_to = QtWidgets.QDateEdit(QtCore.QDate.currentDate())
+        self.export_date_to.setCalendarPopup(True)
+        export_form.addRow(self.export_date_filter)
+        export_form.addRow('С:', self.export_date_from)
+        export_form.addRow('По:', self.export_date_to)
+        stats_layout.addLayout(export_form)
+        export_buttons_layout = QtWidgets.QHBoxLayout()
+        export_buttons_layout.addStretch()
+        self.export_button = QtWidgets.QPushButton('Выгрузить статистику')
+        self.export_button.clicked.connect(self.export_stats)
+        export_buttons_layout.addWidget(self.export_button)
+        self.report_button = QtWidgets.QPushButton('Отчёт о выручке')
+        self.report_button.clicked.connect(self.export_report)
+        export_buttons_layout.addWidget(self.report_button)
+        export_buttons_layout.addStretch()
+        stats_layout.addLayout(export_buttons_layout)
         stats_tab.setLayout(stats_layout)
 
+        # Вкладка диагностики: процентили времени операций из profiling
+        diagnostics_layout = QtWidgets.QVBoxLayout()
+        self.diagnostics_table = QtWidgets.QTableWidget(0, len(DIAGNOSTICS_COLUMNS))
+        self.diagnostics_table.setHorizontalHeaderLabels([title for title, _ in DIAGNOSTICS_COLUMNS])
+        self.diagnostics_table.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.diagnostics_table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectionBehavior.SelectRows)
+        diagnostics_layout.addWidget(self.diagnostics_table)
+        self.slow_queries_label = QtWidgets.QLabel()
+        diagnostics_layout.addWidget(self.slow_queries_label)
+        self.slow_queries_text = QtWidgets.QPlainTextEdit()
+        self.slow_queries_text.setReadOnly(True)
+        diagnostics_layout.addWidget(self.slow_queries_text)
+        diagnostics_buttons_layout = QtWidgets.QHBoxLayout()
+        diagnostics_buttons = (
+            ('Обновить', self.load_diagnostics),
+            ('Сбросить', self.reset_diagnostics),
+            ('Сохранить трассировку...', self.save_diagnostics),
+        )
+        for title, handler in diagnostics_buttons:
+            button = QtWidgets.QPushButton(title)
+            button.clicked.connect(handler)
+            button.setEnabled(profiling.ENABLED)
+            diagnostics_buttons_layout.addWidget(button)
+        diagnostics_layout.addLayout(diagnostics_buttons_layout)
+        diagnostics_tab.setLayout(diagnostics_layout)
+        if profiling.ENABLED:
+            tabs.currentChanged.connect(
+                lambda index: tabs.widget(index) is diagnostics_tab and self.load_diagnostics()
+            )
+        else:
+            self.slow_queries_label.setText('Замеры выключены: запустите приложение с CINEMA_PROFILE=1')
+
         layout.addWidget(tabs)
 
+        self.loading_label = QtWidgets.QLabel('Загрузка...')
+        self.loading_label.hide()
+        for model in (self.sessions_model, self.users_model) + self.stats_models:
+            model.loadingChanged.connect(self.loading_label.setVisible)
+            model.loadFailed.connect(lambda error: show_error(self, error))
+        layout.addWidget(self.loading_label)
+
         # Кнопка выхода из учетной записи
         logout_button = QtWidgets.QPushButton('Выйти')
         logout_button.clicked.connect(self.parent.logout)
@@ -516,79 +947,345 @@ class AdminScreen(QtWidgets.QWidget):
         self.setLayout(layout)
 
     def load_sessions(self):
-        conn = sqlite3.connect('cinema.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM movies')
-        sessions = cursor.fetchall()
-        conn.close()
-
-        self.sessions_table.setRowCount(0)
-        for row_number, row_data in enumerate(sessions):
-            self.sessions_table.insertRow(row_number)
-            for column_number, data in enumerate(row_data):
-                self.sessions_table.setItem(row_number, column_number, QtWidgets.QTableWidgetItem(str(data)))
+        self.sessions_model.refresh()
+
+    def apply_changes(self, changes):
+        if any(change.kind == RESET for change in changes):
+            self.load_sessions()
+            return
+        session_ids = [change.showtime_id for change in changes if change.kind in SHOWTIME_CHANGES]
+        if session_ids:
+            self.sessions_model.invalidate_from(min(session_ids))
 
     def add_session(self):
-        dialog = AddSessionDialog()
+        get_runner().submit(
+            get_service().list_halls,
+            on_result=self.show_add_session_dialog,
+            on_error=lambda error: show_error(self, error),
+        )
+
+    def show_add_session_dialog(self, halls):
+        dialog = AddSessionDialog(halls)
         if dialog.exec():
             title = dialog.title.text()
             description = dialog.description.toPlainText()
             date = dialog.date.date().toString('yyyy-MM-dd')
             time = dialog.time.time().toString('HH:mm')
+            hall_id = dialog.hall.currentData()
+            # 0 в поле цены - сеанс продаётся по базовой цене зала
+            price = dialog.price.value() or None
 
-            conn = sqlite3.connect('cinema.db')
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO movies (title, description, date, time)
-                VALUES (?, ?, ?, ?)
-            ''', (title, description, date, time))
-            conn.commit()
-            conn.close()
-            self.load_sessions()
+            get_runner().submit(
+                get_service().add_session, title, description, date, time, hall_id, price,
+                on_error=lambda error: show_error(self, error),
+            )
 
+    def selected_session_ids(self):
+        rows = sorted({index.row() for index in self.sessions_table.selectionModel().selectedRows()})
+        return [key for key in (self.sessions_model.row_key(row) for row in rows) if key is not None]
+
+    # Удаление и перенос в архив работают с несколькими выбранными сеансами сразу
     def delete_session(self):
-        selected_row = self.sessions_table.currentRow()
-        if selected_row >= 0:
-            session_id = int(self.sessions_table.item(selected_row, 0).text())
-            conn = sqlite3.connect('cinema.db')
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM movies WHERE id=?', (session_id,))
-            conn.commit()
-            conn.close()
-            self.load_sessions()
-        else:
+        session_ids = self.selected_session_ids()
+        if not session_ids:
             QtWidgets.QMessageBox.warning(self, 'Ошибка', 'Выберите сеанс для удаления.')
+            return
+        answer = QtWidgets.QMessageBox.question(
+            self, 'Удаление', f'Удалить сеансов: {len(session_ids)} вместе с проданными на них билетами?',
+        )
+        if answer == QtWidgets.QMessageBox.StandardButton.Yes:
+            self.remove_sessions(get_service().delete_sessions, session_ids, 'Удалено')
+
+    def archive_sessions(self):
+        session_ids = self.selected_session_ids()
+        if not session_ids:
+            QtWidgets.QMessageBox.warning(self, 'Ошибка', 'Выберите сеанс для переноса в архив.')
+            return
+        self.remove_sessions(get_service().archive_sessions, session_ids, 'Перенесено в архив')
+
+    def remove_sessions(self, action, session_ids, done_text):
+        get_runner().submit(
+            action, session_ids,
+            on_result=lambda counts: self.on_sessions_removed(done_text, counts),
+            on_error=lambda error: show_error(self, error),
+        )
+
+    def on_sessions_removed(self, done_text, counts):
+        showtimes, tickets = counts
+        QtWidgets.QMessageBox.information(self, 'Готово', f'{done_text} сеансов: {showtimes}, билетов: {tickets}')
 
     def load_users(self):
-        conn = sqlite3.connect('cinema.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, full_name, username, phone, email, birth_date, role FROM users')
-        users = cursor.fetchall()
-        conn.close()
-
-        self.users_table.setRowCount(0)
-        for row_number, row_data in enumerate(users):
-            self.users_table.insertRow(row_number)
-            for column_number, data in enumerate(row_data):
-                self.users_table.setItem(row_number, column_number, QtWidgets.QTableWidgetItem(str(data)))
+        self.users_model.refresh()
+
+    def show_ticket_history(self):
+        user = self.users_model.row_data(self.users_table.currentIndex().row())
+        if user is None:
+            QtWidgets.QMessageBox.warning(self, 'Ошибка', 'Выберите пользователя.')
+            return
+        TicketHistoryDialog(user[0], user[1]).exec()
+
+    def search_users(self):
+        self.users_query = self.users_search.text()
+        self.load_users()
+
+    def load_stats(self):
+        for model in self.stats_models:
+            model.refresh()
+
+    def refresh_stats(self):
+        # Сначала реплика догоняет основную базу, затем таблицы перечитываются
+        self.refresh_stats_button.setEnabled(False)
+        get_runner().submit(
+            get_service().refresh_stats,
+            on_result=self.on_stats_refreshed,
+            on_error=self.on_stats_refresh_failed,
+        )
+
+    def on_stats_refreshed(self, _):
+        self.refresh_stats_button.setEnabled(True)
+        self.load_stats()
+
+    def on_stats_refresh_failed(self, error):
+        self.refresh_stats_button.setEnabled(True)
+        show_error(self, error)
+
+    def rebuild_stats(self):
+        def rebuild():
+            get_service().rebuild_stats()
+            get_service().refresh_stats()
+
+        self.rebuild_stats_button.setEnabled(False)
+        get_runner().submit(
+            rebuild,
+            on_result=self.on_stats_rebuilt,
+            on_error=self.on_stats_rebuild_failed,
+        )
+
+    def on_stats_rebuilt(self, _):
+        self.rebuild_stats_button.setEnabled(True)
+        self.load_stats()
+
+    def on_stats_rebuild_failed(self, error):
+        self.rebuild_stats_button.setEnabled(True)
+        show_error(self, error)
 
     def export_stats(self):
-        conn = sqlite3.connect('cinema.db')
-        tickets_df = pd.read_sql_query('''
-            SELECT tickets.id, users.full_name, movies.title, tickets.seat_number, tickets.purchase_date
-            FROM tickets
-            JOIN users ON tickets.user_id = users.id
-            JOIN movies ON tickets.movie_id = movies.id
-        ''', conn)
-        conn.close()
-        tickets_df.to_excel('ticket_stats.xlsx', index=False)
-        QtWidgets.QMessageBox.information(self, 'Успех', 'Статистика успешно выгружена в ticket_stats.xlsx')
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self, 'Выгрузить статистику', 'ticket_stats.xlsx',
+            'Excel (*.xlsx);;CSV (*.csv);;Parquet (*.parquet)',
+        )
+        if not path:
+            return
+        date_from = date_to = None
+        if self.export_date_filter.isChecked():
+            date_from = self.export_date_from.date().toString('yyyy-MM-dd')
+            date_to = self.export_date_to.date().toString('yyyy-MM-dd')
+
+        self.export_button.setEnabled(False)
+        self.export_progress = QtWidgets.QProgressDialog('Выгрузка статистики...', 'Отмена', 0, 0, self)
+        self.export_progress.setWindowModality(QtCore.Qt.WindowModality.WindowModal)
+        job = get_runner().submit(
+            lambda job: get_service().export_ticket_stats(path, date_from, date_to, progress=job.report_progress),
+            with_job=True,
+            on_result=lambda written: self.on_export_finished(path, written),
+            on_error=self.on_export_failed,
+            on_cancel=self.on_export_cancelled,
+            on_progress=self.on_export_progress,
+        )
+        self.export_progress.canceled.connect(job.cancel)
+        self.export_progress.show()
+
+    def on_export_progress(self, done, total):
+        self.export_progress.setMaximum(total)
+        self.export_progress.setValue(done)
+
+    def finish_export(self):
+        self.export_button.setEnabled(True)
+        self.export_progress.reset()
+
+    def on_export_finished(self, path, written):
+        self.finish_export()
+        QtWidgets.QMessageBox.information(self, 'Успех', f'Статистика успешно выгружена в {path} (строк: {written})')
+
+    def on_export_failed(self, error):
+        self.finish_export()
+        show_error(self, error)
+
+    def on_export_cancelled(self):
+        self.finish_export()
+
+    def export_report(self):
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self, 'Отчёт о выручке', 'revenue_report.xlsx', 'Excel (*.xlsx);;CSV (*.csv)',
+        )
+        if not path:
+            return
+        # pandas грузится только при первом отчёте
+        from reports import save_report
+
+        date_from = date_to = None
+        if self.export_date_filter.isChecked():
+            date_from = self.export_date_from.date().toString('yyyy-MM-dd')
+            date_to = self.export_date_to.date().toString('yyyy-MM-dd')
+
+        def build(job):
+            report = get_service().revenue_report(date_from, date_to, progress=job.report_progress)
+            save_report(report, path)
+            return report
+
+        self.report_button.setEnabled(False)
+        self.report_progress = QtWidgets.QProgressDialog('Расчёт выручки...', 'Отмена', 0, 0, self)
+        self.report_progress.setWindowModality(QtCore.Qt.WindowModality.WindowModal)
+        job = get_runner().submit(
+            build,
+            with_job=True,
+            on_result=lambda report: self.on_report_finished(path, report),
+            on_error=self.on_report_failed,
+            on_cancel=self.finish_report,
+            on_progress=self.on_report_progress,
+        )
+        self.report_progress.canceled.connect(job.cancel)
+        self.report_progress.show()
+
+    def on_report_progress(self, done, total):
+        self.report_progress.setMaximum(total)
+        self.report_progress.setValue(done)
+
+    def finish_report(self):
+        self.report_button.setEnabled(True)
+        self.report_progress.reset()
+
+    def on_report_finished(self, path, report):
+        self.finish_report()
+        QtWidgets.QMessageBox.information(self, 'Успех', f'Отчёт сохранён в {path}: {report.summary()}')
+
+    def on_report_failed(self, error):
+        self.finish_report()
+        show_error(self, error)
+
+    def load_diagnostics(self):
+        rows = profiling.snapshot()
+        self.diagnostics_table.setRowCount(len(rows))
+        for row_number, row in enumerate(rows):
+            for column, (_, key) in enumerate(DIAGNOSTICS_COLUMNS):
+                value = row[key]
+                item = QtWidgets.QTableWidgetItem(f'{value:.1f}' if isinstance(value, float) else str(value))
+                if column:
+                    item.setTextAlignment(
+                        QtCore.Qt.AlignmentFlag.AlignRight | QtCore.Qt.AlignmentFlag.AlignVCenter
+                    )
+                self.diagnostics_table.setItem(row_number, column, item)
+        self.diagnostics_table.resizeColumnsToContents()
+
+        slow = profiling.slow_queries()
+        self.slow_queries_label.setText(f'Медленные запросы (от {profiling.SLOW_QUERY_MS:g} мс): {len(slow)}')
+        lines = []
+        for query in reversed(slow):
+            lines.append(f'{query["ms"]:.1f} мс, {query["operation"]}: {" ".join(query["sql"].split())}')
+            lines.extend(f'    {line}' for line in query['plan'])
+        self.slow_queries_text.setPlainText('\n'.join(lines))
+
+    def reset_diagnostics(self):
+        profiling.reset()
+        self.load_diagnostics()
+
+    def save_diagnostics(self):
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, 'Сохранить трассировку', 'trace.json', 'JSON (*.json)')
+        if not path:
+            return
+        get_runner().submit(
+            profiling.dump, path,
+            on_result=lambda events: QtWidgets.QMessageBox.information(
+                self, 'Успех', f'Трассировка сохранена в {path} (событий: {events})'
+            ),
+            on_error=lambda error: show_error(self, error),
+        )
+
+    # Массовый импорт идёт в фоне; прерванный импорт того же файла продолжается
+    # с последней зафиксированной пачки
+    def import_data(self, kind):
+        if is_remote():
+            # Импорт пишет в базу этого процесса, а касса, работающая через
+            # сервер, читает базу сервера: данные туда не попали бы
+            QtWidgets.QMessageBox.information(
+                self, 'Импорт',
+                'Касса работает через сервер бронирования. Импорт выполняется на сервере:\n'
+                f'python manage.py import {kind} ФАЙЛ',
+            )
+            return
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self, 'Импорт', '', 'Данные (*.csv *.json *.jsonl *.ndjson)',
+        )
+        if not path:
+            return
+        from importer import import_file
+
+        self.import_sessions_button.setEnabled(False)
+        self.import_users_button.setEnabled(False)
+        self.import_progress = QtWidgets.QProgressDialog('Импорт данных...', 'Прервать', 0, 0, self)
+        self.import_progress.setWindowModality(QtCore.Qt.WindowModality.WindowModal)
+        job = get_runner().submit(
+            lambda job: import_file(get_pool(), kind, path, progress=job.report_progress),
+            with_job=True,
+            on_result=lambda report: self.on_import_finished(kind, report),
+            on_error=self.on_import_failed,
+            on_cancel=self.finish_import,
+            on_progress=self.on_import_progress,
+        )
+        self.import_progress.canceled.connect(job.cancel)
+        self.import_progress.show()
+
+    def on_import_progress(self, done, total):
+        self.import_progress.setMaximum(total)
+        self.import_progress.setValue(done)
+
+    def finish_import(self):
+        self.import_sessions_button.setEnabled(True)
+        self.import_users_button.setEnabled(True)
+        self.import_progress.reset()
+
+    def on_import_finished(self, kind, report):
+        self.finish_import()
+        if kind == 'users':
+            self.load_users()
+        message = f'Импорт завершён: {report.summary()}'
+        if report.errors:
+            message += '\n\n' + '\n'.join(f'Запись {number}: {error}' for number, error in report.errors[:10])
+        QtWidgets.QMessageBox.information(self, 'Импорт', message)
+
+    def on_import_failed(self, error):
+        self.finish_import()
+        show_error(self, error)
+
+# Диалоговое окно истории покупок пользователя
+class TicketHistoryDialog(QtWidgets.QDialog):
+    def __init__(self, user_id, full_name):
+        super().__init__()
+        self.setWindowTitle(f'История покупок: {full_name}')
+        self.resize(700, 400)
+        self.user_id = user_id
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QtWidgets.QVBoxLayout()
+        self.table = QtWidgets.QTableView()
+        self.model = ticket_history_model(lambda: self.user_id, 'user_tickets', self)
+        self.table.setModel(self.model)
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.model.loadFailed.connect(lambda error: show_error(self, error))
+        close_button = QtWidgets.QPushButton('Закрыть')
+        close_button.clicked.connect(self.accept)
+
+        layout.addWidget(self.table)
+        layout.addWidget(close_button, alignment=QtCore.Qt.AlignmentFlag.AlignRight)
+        self.setLayout(layout)
 
 # Диалоговое окно добавления сеанса
 class AddSessionDialog(QtWidgets.QDialog):
-    def __init__(self):
+    def __init__(self, halls):
         super().__init__()
         self.setWindowTitle('Добавить сеанс')
+        self.halls = halls
         self.setup_ui()
 
     def setup_ui(self):
@@ -598,6 +1295,14 @@ class AddSessionDialog(QtWidgets.QDialog):
         self.date = QtWidgets.QDateEdit()
         self.date.setCalendarPopup(True)
         self.time = QtWidgets.QTimeEdit()
+        self.hall = QtWidgets.QComboBox()
+        for hall in self.halls:
+            self.hall.addItem(f'{hall.name} ({hall.rows}x{hall.cols})', hall.id)
+        self.price = QtWidgets.QSpinBox()
+        self.price.setRange(0, MAX_SESSION_PRICE)
+        self.price.setSingleStep(50)
+        self.price.setSuffix(' руб.')
+        self.price.setSpecialValueText('по цене зала')
         add_button = QtWidgets.QPushButton('Добавить')
         add_button.clicked.connect(self.accept)
 
@@ -605,6 +1310,8 @@ class AddSessionDialog(QtWidgets.QDialog):
         layout.addRow('Описание:', self.description)
         layout.addRow('Дата:', self.date)
         layout.addRow('Время:', self.time)
+        layout.addRow('Зал:', self.hall)
+        layout.addRow('Базовая цена:', self.price)
         layout.addRow(add_button)
         self.setLayout(layout)
 
@@ -0,0 +1,107 @@
+# Служебные команды для обслуживания базы без запуска интерфейса.
+#
+# Примеры:
+#   python manage.py rebuild-stats
+#   python manage.py import sessions schedule.csv
+#   python manage.py import users users.jsonl --restart
+#   python manage.py purge --days 90   (например, из cron раз в сутки)
+#   python manage.py report revenue.xlsx --from 2024-01-01 --to 2024-12-31
+#   python manage.py backup backups/cinema-2024-12-31.db   (без остановки касс)
+import argparse
+import sys
+
+from auth import shutdown_pool
+from core import BookingService
+from database import get_pool, get_repository, initialize_database
+from importer import IMPORTERS, import_file
+from replica import snapshot
+
+
+def rebuild_stats(args):
+    get_repository().rebuild_stats()
+    print('Сводная статистика пересчитана')
+
+
+def import_data(args):
+    def progress(done, total):
+        print(f'\rИмпорт: {done} из {total} КБ', end='', file=sys.stderr, flush=True)
+
+    try:
+        report = import_file(
+            get_pool(), args.kind, args.path, progress=progress, batch_size=args.batch_size, restart=args.restart,
+        )
+    finally:
+        print(file=sys.stderr)
+        shutdown_pool()
+    for number, message in report.errors:
+        print(f'запись {number}: {message}', file=sys.stderr)
+    print(f'Импорт завершён: {report.summary()}')
+    return 1 if report.invalid else 0
+
+
+def purge(args):
+    showtimes, tickets = BookingService(get_repository()).purge_sessions(args.days)
+    print(f'В архив перенесено сеансов: {showtimes}, билетов: {tickets}')
+
+
+def report(args):
+    # pandas нужен только отчёту и не грузится для остальных команд
+    from reports import build_report, save_report
+
+    def progress(done, total):
+        print(f'\rОтчёт: {done} из {total} билетов', end='', file=sys.stderr, flush=True)
+
+    try:
+        result = build_report(get_pool(), args.date_from, args.date_to, progress=progress)
+    finally:
+        print(file=sys.stderr)
+    save_report(result, args.path)
+    print(f'Отчёт сохранён в {args.path}: {result.summary()}')
+
+
+def backup(args):
+    def progress(done, total):
+        print(f'\rКопирование: {done} из {total} страниц', end='', file=sys.stderr, flush=True)
+
+    try:
+        snapshot(args.path, progress=progress)
+    finally:
+        print(file=sys.stderr)
+    print(f'Резервная копия сохранена в {args.path}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Обслуживание базы кинотеатра')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    rebuild_parser = commands.add_parser('rebuild-stats', help='пересчитать сводные таблицы продаж по tickets')
+    rebuild_parser.set_defaults(handler=rebuild_stats)
+
+    import_parser = commands.add_parser('import', help='массовый импорт сеансов или пользователей из CSV/JSON')
+    import_parser.add_argument('kind', choices=sorted(IMPORTERS))
+    import_parser.add_argument('path', help='файл .csv, .json (массив) или .jsonl')
+    import_parser.add_argument('--batch-size', type=int, help='записей в одной транзакции')
+    import_parser.add_argument('--restart', action='store_true', help='начать заново, не продолжая прерванный импорт')
+    import_parser.set_defaults(handler=import_data)
+
+    purge_parser = commands.add_parser('purge', help='перенести в архив прошедшие сеансы и их билеты')
+    purge_parser.add_argument('--days', type=int, default=90, help='архивировать сеансы старше стольких дней')
+    purge_parser.set_defaults(handler=purge)
+
+    report_parser = commands.add_parser('report', help='отчёт о выручке и заполняемости')
+    report_parser.add_argument('path', help='файл .xlsx (листы) или .csv (файл на таблицу)')
+    report_parser.add_argument('--from', dest='date_from', help='билеты, купленные с этой даты (ГГГГ-ММ-ДД)')
+    report_parser.add_argument('--to', dest='date_to', help='билеты, купленные по эту дату включительно')
+    report_parser.set_defaults(handler=report)
+
+    backup_parser = commands.add_parser('backup', help='резервная копия базы без остановки приложения')
+    backup_parser.add_argument('path', help='файл копии; существующий заменяется только готовой копией')
+    backup_parser.set_defaults(handler=backup)
+
+    args = parser.parse_args(argv)
+    initialize_database(get_pool())
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
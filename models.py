@@ -0,0 +1,194 @@
+import bisect
+import time
+from collections import OrderedDict
+
+from PyQt6 import QtCore
+
+import profiling
+
+PAGE_SIZE = 200
+CACHED_PAGES = 20
+
+
+# Табличная модель с постраничной подгрузкой по ключу (keyset pagination).
+# fetch_page(after_key, limit) возвращает строки, упорядоченные по ключу;
+# ключ строки - первый столбец или результат sort_key(row), если сортировка
+# составная. В памяти хранится не более CACHED_PAGES страниц, для
+# остальных запоминается только ключ, с которого страница начинается.
+# first_key - значение меньше любого ключа (0 для id, '' для строк).
+# Если передан runner (workers.JobRunner), страницы читаются в фоне.
+# name - имя таблицы в замерах profiling: ui.<name>.fetch (ожидание
+# страницы) и ui.<name>.populate (вставка строк в модель и вид)
+class KeysetTableModel(QtCore.QAbstractTableModel):
+    loadingChanged = QtCore.pyqtSignal(bool)
+    loadFailed = QtCore.pyqtSignal(object)
+
+    def __init__(self, fetch_page, headers, page_size=PAGE_SIZE, cached_pages=CACHED_PAGES, runner=None,
+                 first_key=0, sort_key=None, name='table', parent=None):
+        super().__init__(parent)
+        self._name = name
+        self._fetch_page = fetch_page
+        self._first_key = first_key
+        self._sort_key = sort_key or (lambda row: row[0])
+        self._headers = headers
+        self._page_size = page_size
+        self._cached_pages = cached_pages
+        self._runner = runner
+        self._generation = 0
+        self._reset_state()
+
+    def _reset_state(self):
+        # Ответы на запросы, отправленные до сброса, отбрасываются по номеру поколения
+        self._generation += 1
+        self._anchors = []
+        self._pages = OrderedDict()
+        self._loading_pages = set()
+        self._rows = 0
+        self._last_key = self._first_key
+        self._exhausted = False
+        self._fetching = False
+        self._pending = 0
+
+    def refresh(self, first_key=None):
+        # Новый first_key задаёт другое начало выборки (например, окно дат)
+        if first_key is not None:
+            self._first_key = first_key
+        was_loading = self._pending > 0
+        self.beginResetModel()
+        self._reset_state()
+        self.endResetModel()
+        if was_loading:
+            self.loadingChanged.emit(False)
+
+    def invalidate_from(self, key):
+        # Строка с ключом key добавлена или удалена: страницы до неё остаются,
+        # с её страницы таблица перечитывается
+        if key > self._last_key and not self._exhausted:
+            # Изменение за последней загруженной строкой придёт с очередной страницей
+            return
+        self._generation += 1
+        self._loading_pages.clear()
+        if self._pending > 0:
+            self._pending = 0
+            self.loadingChanged.emit(False)
+        number = max(bisect.bisect_left(self._anchors, key) - 1, 0)
+        if number < len(self._anchors):
+            self.beginRemoveRows(QtCore.QModelIndex(), number * self._page_size, self._rows - 1)
+            self._last_key = self._anchors[number]
+            del self._anchors[number:]
+            for stale in [page for page in self._pages if page >= number]:
+                del self._pages[stale]
+            self._rows = number * self._page_size
+            self.endRemoveRows()
+        self._exhausted = False
+        self._fetching = False
+        self.fetchMore()
+
+    def _request(self, after_key, on_rows):
+        generation = self._generation
+        started = time.perf_counter()
+
+        def deliver(rows):
+            if generation == self._generation:
+                self._set_pending(-1)
+                profiling.record(f'ui.{self._name}.fetch', started)
+                with profiling.timed(f'ui.{self._name}.populate'):
+                    on_rows(rows)
+
+        def fail(error):
+            if generation == self._generation:
+                self._set_pending(-1)
+                self._fetching = False
+                self._loading_pages.clear()
+                self.loadFailed.emit(error)
+
+        self._set_pending(1)
+        if self._runner is None:
+            deliver(self._fetch_page(after_key, self._page_size))
+        else:
+            self._runner.submit(self._fetch_page, after_key, self._page_size, on_result=deliver, on_error=fail)
+
+    def _set_pending(self, delta):
+        was_loading = self._pending > 0
+        self._pending += delta
+        if was_loading != (self._pending > 0):
+            self.loadingChanged.emit(self._pending > 0)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else self._rows
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._headers)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.ItemDataRole.DisplayRole):
+        if role == QtCore.Qt.ItemDataRole.DisplayRole and orientation == QtCore.Qt.Orientation.Horizontal:
+            return self._headers[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=QtCore.Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != QtCore.Qt.ItemDataRole.DisplayRole:
+            return None
+        row = self.row_data(index.row())
+        if row is None:
+            return None
+        return str(row[index.column()])
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return not parent.isValid() and not self._exhausted and not self._fetching
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if parent.isValid() or self._exhausted or self._fetching:
+            return
+        self._fetching = True
+        self._request(self._last_key, self._append_page)
+
+    def _append_page(self, rows):
+        self._fetching = False
+        if len(rows) < self._page_size:
+            self._exhausted = True
+        if not rows:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), self._rows, self._rows + len(rows) - 1)
+        self._store_page(len(self._anchors), rows)
+        self._anchors.append(self._last_key)
+        self._rows += len(rows)
+        self._last_key = self._sort_key(rows[-1])
+        self.endInsertRows()
+
+    def row_data(self, row):
+        if row < 0 or row >= self._rows:
+            return None
+        number, offset = divmod(row, self._page_size)
+        page = self._page(number)
+        # Страница ещё загружается или укоротилась, если строки удалили после её загрузки
+        if page is None or offset >= len(page):
+            return None
+        return page[offset]
+
+    def row_key(self, row):
+        data = self.row_data(row)
+        return data[0] if data is not None else None
+
+    def _page(self, number):
+        page = self._pages.get(number)
+        if page is not None:
+            self._pages.move_to_end(number)
+            return page
+        if number not in self._loading_pages:
+            self._loading_pages.add(number)
+            self._request(self._anchors[number], lambda rows: self._reload_page(number, rows))
+        return self._pages.get(number)
+
+    def _reload_page(self, number, rows):
+        # Вытесненная из кэша страница прочитана заново - просим вид перерисовать её строки
+        self._loading_pages.discard(number)
+        self._store_page(number, rows)
+        first = number * self._page_size
+        last = min(first + self._page_size, self._rows) - 1
+        self.dataChanged.emit(self.index(first, 0), self.index(last, len(self._headers) - 1))
+
+    def _store_page(self, number, rows):
+        self._pages[number] = rows
+        self._pages.move_to_end(number)
+        while len(self._pages) > self._cached_pages:
+            self._pages.popitem(last=False)
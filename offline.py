@@ -0,0 +1,419 @@
+import http.client
+import json
+import threading
+import time
+from datetime import datetime
+
+from core import (
+    QUEUED, InvalidSeat, NotAuthenticated, ServiceError, UnknownSession, hall_from_json, hall_to_json,
+    occupancy_from_json, occupancy_to_json,
+)
+from database import connect
+from events import PURCHASE_CONFLICT, RESET, SEAT_SOLD, SHOWTIME_CHANGES, SHOWTIME_REMOVED, Change
+
+OFFLINE_DB_PATH = 'offline.db'
+# Версия ключей кэша: записи с ключами прежней версии удаляются при запуске
+CACHE_VERSION = 1
+# Как часто без связи проверяется, не вернулся ли сервер, секунд
+RETRY_INTERVAL = 5
+# Сколько покупок из журнала уходит на сервер одним HTTP-запросом
+REPLAY_BATCH = 50
+# Брони других касс не попадают в журнал изменений, поэтому схема зала
+# берётся из кэша, только пока она моложе этого срока, секунд
+OCCUPANCY_MAX_AGE = 5
+
+# Ошибки связи: сервер недоступен, соединение оборвалось или истёк таймаут
+NETWORK_ERRORS = (OSError, http.client.HTTPException)
+# Отказы сервера продать именно эти места (кроме ответа "занято"): покупка
+# из журнала становится конфликтом. Остальные ошибки - истёкшая сессия,
+# временный сбой на сервере - оставляют её в журнале до следующей попытки
+REJECTIONS = (InvalidSeat, UnknownSession)
+
+SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS cache (
+        method TEXT NOT NULL,
+        args TEXT NOT NULL,
+        showtime_id INTEGER,
+        data TEXT NOT NULL,
+        stored_at REAL NOT NULL,
+        PRIMARY KEY (method, args)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS journal (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        movie_id INTEGER NOT NULL,
+        seats TEXT NOT NULL,
+        owner TEXT,
+        created_at TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        error TEXT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS journal_status ON journal (status, id)',
+)
+
+SQL_CACHE_GET = 'SELECT data, stored_at FROM cache WHERE method = ? AND args = ?'
+SQL_CACHE_PUT = '''
+    INSERT OR REPLACE INTO cache (method, args, showtime_id, data, stored_at) VALUES (?, ?, ?, ?, ?)
+'''
+SQL_JOURNAL_ADD = '''
+    INSERT INTO journal (user_id, movie_id, seats, owner, created_at) VALUES (?, ?, ?, ?, ?)
+'''
+SQL_JOURNAL_PENDING = '''
+    SELECT id, user_id, movie_id, seats, owner FROM journal
+    WHERE status = 'pending' AND user_id = ? ORDER BY id LIMIT ?
+'''
+
+
+class OfflineError(ServiceError):
+    pass
+
+
+def showtime_key(row):
+    # Ключ страницы строки списка сеансов: (start_ts, id)
+    return row[5], row[0]
+
+
+def merge_showtimes(window, after_key, limit, rows):
+    # Запись кэша списка сеансов с новой страницей rows, пришедшей после
+    # after_key. Страница продолжает записанный ряд, если начинается внутри
+    # него; иначе ряд начинается заново с неё. Начавшиеся сеансы выбрасываются
+    now = datetime.now().strftime('%Y-%m-%d %H:%M')
+    full = len(rows) == limit
+    if window is None or after_key < tuple(window['from']):
+        window = {'from': list(after_key), 'rows': [], 'complete': False}
+    before = [row for row in window['rows'] if showtime_key(row) <= after_key and row[5] >= now]
+    after = []
+    if full and rows:
+        last = showtime_key(rows[-1])
+        after = [row for row in window['rows'] if showtime_key(row) > last]
+    return {
+        'from': window['from'],
+        'rows': before + list(rows) + after,
+        'complete': window['complete'] if full else True,
+    }
+
+
+# Кассовый терминал, переживающий потерю связи с сервером бронирования.
+# Оборачивает client.RemoteBookingService:
+#  - список сеансов, фильмы, залы и схемы залов читаются из локального кэша
+#    (файл SQLite), а сервер спрашивается только при промахе. Записи кэша
+#    удаляет лента изменений (apply_changes), поэтому кэш не устаревает;
+#    записи, сохранённые до запуска, используются только без связи.
+#    Страницы списка сеансов одного окна дат и фильтров копятся в одной
+#    записи, а схема зала хранится по сеансу: ключи не зависят ни от
+#    текущей минуты, ни от владельца броней, который у каждого запуска свой;
+#  - покупка без связи записывается в журнал в том же файле и проводится,
+#    когда сервер снова доступен: фоновый поток отправляет журнал пачками.
+#    Если место за это время продали, покупка помечается конфликтом и
+#    публикуется в шину событием PURCHASE_CONFLICT, чтобы кассир её разобрал.
+#    Автоматически другое место не подбирается: если связь оборвалась после
+#    коммита на сервере, повтор тоже вернёт "занято", и пересадка продала бы
+#    зрителю второе место. Токены сессий в файл не пишутся: покупки
+#    пользователя проводятся, когда он вошёл на кассе, под его текущей
+#    сессией (сервер берёт покупателя из сессии), остальные ждут его входа
+# Остальные методы (вход, администрирование) идут на сервер напрямую
+class OfflineBookingService:
+    def __init__(self, remote, path=OFFLINE_DB_PATH, bus=None, retry_interval=RETRY_INTERVAL):
+        self.remote = remote
+        self.bus = bus
+        self.retry_interval = retry_interval
+        self.online = True
+        self.started = time.time()
+        self.conn = connect(path)
+        # Покупка в журнале должна пережить отключение питания
+        self.conn.execute('PRAGMA synchronous=FULL')
+        with self.conn:
+            for sql in SCHEMA:
+                self.conn.execute(sql)
+            if self.conn.execute('PRAGMA user_version').fetchone()[0] < CACHE_VERSION:
+                self.conn.execute('DELETE FROM cache')
+                self.conn.execute(f'PRAGMA user_version = {CACHE_VERSION}')
+            if 'token' in {row[1] for row in self.conn.execute('PRAGMA table_info(journal)')}:
+                # Журнал прежней версии хранил токены сессий: столбец удаляется
+                # вместе с ними
+                self.conn.execute('ALTER TABLE journal DROP COLUMN token')
+        self._lock = threading.Lock()
+        # Растёт при каждом сбросе кэша: ответ сервера на запрос, начатый до
+        # сброса, в кэш не записывается
+        self._generation = 0
+        # Брони этой кассы {(сеанс, место): владелец}: в схеме из кэша они не
+        # показываются чужими
+        self._holds = {}
+        # Токен, с которым сервер отказал в доступе: журнал ждёт нового входа
+        self._rejected_token = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='offline-replay', daemon=True)
+        self._thread.start()
+
+    def __getattr__(self, name):
+        return getattr(self.remote, name)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.conn.close()
+
+    def _go_offline(self):
+        self.online = False
+
+    def _cached(self, method, args, fetch, encode=None, decode=None, showtime_id=None, max_age=None):
+        key = json.dumps(args, ensure_ascii=False)
+        with self._lock:
+            row = self.conn.execute(SQL_CACHE_GET, (method, key)).fetchone()
+            generation = self._generation
+        if row is not None:
+            data, stored_at = row
+            fresh = stored_at >= self.started and (max_age is None or time.time() - stored_at < max_age)
+            if fresh or not self.online:
+                value = json.loads(data)
+                return decode(value) if decode else value
+        if self.online:
+            try:
+                result = fetch()
+            except NETWORK_ERRORS:
+                self._go_offline()
+            else:
+                data = json.dumps(encode(result) if encode else result, ensure_ascii=False)
+                with self._lock:
+                    if generation == self._generation:
+                        with self.conn:
+                            self.conn.execute(SQL_CACHE_PUT, (method, key, showtime_id, data, time.time()))
+                return result
+        if row is None:
+            raise OfflineError('Нет связи с сервером, а в локальном кэше этих данных нет.')
+        value = json.loads(row[0])
+        return decode(value) if decode else value
+
+    # Запись кэша списка сеансов: {'from': ключ, 'rows': [...], 'complete': bool}
+    # - сеансы окна подряд по ключу (start_ts, id) начиная после from;
+    # complete - после последней строки сеансов в окне нет. Первый ключ
+    # страницы - текущая минута, поэтому начавшиеся сеансы отсекаются при
+    # чтении, а не отдельными записями кэша
+    def showtimes_page(self, after_key, limit, until, film_id=None, hall_id=None, search=None):
+        key = json.dumps([until, film_id, hall_id, search], ensure_ascii=False)
+        after_key = tuple(after_key)
+        with self._lock:
+            row = self.conn.execute(SQL_CACHE_GET, ('showtimes_page', key)).fetchone()
+            generation = self._generation
+        window = json.loads(row[0]) if row is not None else None
+        page = None
+        if window is not None:
+            page = [item for item in window['rows'] if showtime_key(item) > after_key][:limit]
+            covered = after_key >= tuple(window['from']) and (len(page) == limit or window['complete'])
+            if (covered and row[1] >= self.started) or not self.online:
+                return page
+        if self.online:
+            try:
+                result = self.remote.showtimes_page(after_key, limit, until, film_id, hall_id, search)
+            except NETWORK_ERRORS:
+                self._go_offline()
+            else:
+                window = merge_showtimes(window, after_key, limit, result)
+                data = json.dumps(window, ensure_ascii=False)
+                with self._lock:
+                    if generation == self._generation:
+                        with self.conn:
+                            self.conn.execute(SQL_CACHE_PUT, ('showtimes_page', key, None, data, time.time()))
+                return result
+        if page is None:
+            raise OfflineError('Нет связи с сервером, а в локальном кэше этих данных нет.')
+        return page
+
+    def list_films(self):
+        return self._cached('list_films', [], self.remote.list_films)
+
+    def list_halls(self):
+        return self._cached(
+            'list_halls', [], self.remote.list_halls,
+            encode=lambda halls: [hall_to_json(hall) for hall in halls],
+            decode=lambda halls: [hall_from_json(hall) for hall in halls],
+        )
+
+    def occupancy(self, movie_id, owner=None):
+        occupancy = self._cached(
+            'occupancy', [movie_id], lambda: self.remote.occupancy(movie_id, owner),
+            encode=occupancy_to_json, decode=occupancy_from_json, showtime_id=movie_id, max_age=OCCUPANCY_MAX_AGE,
+        )
+        if occupancy is None:
+            return None
+        with self._lock:
+            own = [
+                seat for (held_movie, seat), holder in self._holds.items() if held_movie == movie_id and holder == owner
+            ]
+        return occupancy.without_holds(own) if own else occupancy
+
+    def _forget_holds(self, movie_id, seats):
+        with self._lock:
+            for seat in seats:
+                self._holds.pop((movie_id, seat), None)
+
+    def apply_changes(self, changes):
+        # Подписчик шины: изменения на сервере удаляют затронутые записи кэша
+        kinds = {change.kind for change in changes}
+        with self._lock, self.conn:
+            self._generation += 1
+            if RESET in kinds:
+                self.conn.execute('DELETE FROM cache')
+                return
+            removed = {change.showtime_id for change in changes if change.kind in (SEAT_SOLD, SHOWTIME_REMOVED)}
+            self.conn.executemany(
+                "DELETE FROM cache WHERE method = 'occupancy' AND showtime_id = ?", [(movie_id,) for movie_id in removed],
+            )
+            if kinds & set(SHOWTIME_CHANGES):
+                self.conn.execute("DELETE FROM cache WHERE method IN ('showtimes_page', 'list_films')")
+
+    # Брони без связи живут только на этой кассе
+    def hold_seat(self, movie_id, seat, owner):
+        held = True
+        if self.online:
+            try:
+                held = self.remote.hold_seat(movie_id, seat, owner)
+            except NETWORK_ERRORS:
+                self._go_offline()
+        if held:
+            with self._lock:
+                self._holds[(movie_id, seat)] = owner
+        return held
+
+    def release_seat(self, movie_id, seat, owner):
+        self._forget_holds(movie_id, [seat])
+        if self.online:
+            try:
+                self.remote.release_seat(movie_id, seat, owner)
+            except NETWORK_ERRORS:
+                self._go_offline()
+
+    # Без связи покупка возвращает QUEUED: она сохранена и будет проведена позже
+    def purchase_ticket(self, user_id, movie_id, seat, owner=None):
+        return self._purchase(
+            user_id, movie_id, [seat], owner, lambda: self.remote.purchase_ticket(user_id, movie_id, seat, owner),
+        )
+
+    def purchase_seats(self, user_id, movie_id, seats, owner=None):
+        return self._purchase(
+            user_id, movie_id, seats, owner, lambda: self.remote.purchase_seats(user_id, movie_id, seats, owner),
+        )
+
+    def _purchase(self, user_id, movie_id, seats, owner, send):
+        result = None
+        if self.online:
+            try:
+                result = send()
+            except NETWORK_ERRORS:
+                self._go_offline()
+        if result is None:
+            result = self._queue(user_id, movie_id, seats, owner)
+        if result:
+            # Проданное или принятое в журнал место больше не бронь этой кассы
+            self._forget_holds(movie_id, seats)
+        return result
+
+    def _queue(self, user_id, movie_id, seats, owner):
+        # Место, занятое по последней известной схеме, не продаётся и без связи.
+        # Принятая покупка сразу отмечается в кэшированных схемах зала
+        with self._lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT args, data FROM cache WHERE method = 'occupancy' AND showtime_id = ?", (movie_id,),
+            ).fetchall()
+            updated = []
+            for args, data in rows:
+                occupancy = occupancy_from_json(json.loads(data))
+                indices = [occupancy.hall.parse_label(seat) for seat in seats]
+                if any(index is not None and occupancy.is_taken(index) for index in indices):
+                    return False
+                for index in indices:
+                    if index is not None:
+                        occupancy.take(index)
+                updated.append((json.dumps(occupancy_to_json(occupancy), ensure_ascii=False), args))
+            self.conn.executemany(
+                "UPDATE cache SET data = ? WHERE method = 'occupancy' AND args = ?", updated,
+            )
+            self.conn.execute(SQL_JOURNAL_ADD, (
+                user_id, movie_id, json.dumps(seats, ensure_ascii=False), owner,
+                datetime.now().isoformat(sep=' ', timespec='seconds'),
+            ))
+        return QUEUED
+
+    def pending_count(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM journal WHERE status = 'pending'").fetchone()[0]
+
+    def conflicts(self):
+        # Покупки, которые сервер не принял: (id, movie_id, места, причина, когда)
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, movie_id, seats, error, created_at FROM journal WHERE status = 'conflict' ORDER BY id",
+            ).fetchall()
+        return [(row_id, movie_id, json.loads(seats), error, created_at)
+                for row_id, movie_id, seats, error, created_at in rows]
+
+    def _run(self):
+        while not self._stop.wait(self.retry_interval):
+            if not self.online:
+                try:
+                    self.remote.latest_change()
+                except NETWORK_ERRORS:
+                    continue
+                except ServiceError:
+                    pass
+                self.online = True
+            try:
+                self.replay()
+            except NETWORK_ERRORS:
+                self._go_offline()
+
+    def replay(self):
+        # Журнал уходит на сервер по порядку, пачками по REPLAY_BATCH покупок в
+        # одном HTTP-запросе; одиночные места сервер проводит групповым коммитом.
+        # Проводятся покупки пользователя, вошедшего на кассе
+        user_id = self.remote.user_id
+        token = self.remote.token
+        if user_id is None or token == self._rejected_token:
+            return
+        while True:
+            with self._lock:
+                rows = self.conn.execute(SQL_JOURNAL_PENDING, (user_id, REPLAY_BATCH)).fetchall()
+            if not rows:
+                return
+            calls = []
+            for _, _, movie_id, seats, owner in rows:
+                seats = json.loads(seats)
+                if len(seats) == 1:
+                    calls.append(('purchase_ticket', {
+                        'user_id': user_id, 'movie_id': movie_id, 'seat': seats[0], 'owner': owner,
+                    }))
+                else:
+                    calls.append(('purchase_seats', {
+                        'user_id': user_id, 'movie_id': movie_id, 'seats': seats, 'owner': owner,
+                    }))
+            results = self.remote.batch(calls, return_errors=True)
+            conflicts = []
+            postponed = False
+            with self._lock, self.conn:
+                for (row_id, _, movie_id, seats, _), result in zip(rows, results):
+                    if result is True:
+                        self.conn.execute('DELETE FROM journal WHERE id = ?', (row_id,))
+                        continue
+                    if isinstance(result, Exception) and not isinstance(result, REJECTIONS):
+                        if isinstance(result, NotAuthenticated):
+                            self._rejected_token = token
+                        postponed = True
+                        continue
+                    error = str(result) if isinstance(result, Exception) else 'место уже занято'
+                    self.conn.execute(
+                        "UPDATE journal SET status = 'conflict', error = ? WHERE id = ?", (error, row_id),
+                    )
+                    # Кэшированная схема с непроданными местами больше не верна
+                    self.conn.execute(
+                        "DELETE FROM cache WHERE method = 'occupancy' AND showtime_id = ?", (movie_id,),
+                    )
+                    conflicts.append(Change(row_id, PURCHASE_CONFLICT, movie_id, None, ', '.join(json.loads(seats))))
+            if conflicts and self.bus is not None:
+                self.bus.publish(conflicts)
+            if postponed:
+                # Оставшиеся покупки ждут следующей попытки
+                return
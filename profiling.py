@@ -0,0 +1,276 @@
+# Замеры горячих путей интерфейса и базы. По умолчанию выключены и ничего
+# не стоят: декоратор возвращает класс как есть, record и timed сразу выходят.
+#
+#   CINEMA_PROFILE=1               время и число запросов по операциям
+#   CINEMA_SLOW_QUERY_MS=50        порог медленного запроса, мс
+#   CINEMA_PROFILE_OUT=trace.json  при выходе сохранить замеры и трассировку
+#                                  (формат Chrome trace: chrome://tracing, Perfetto)
+#   CINEMA_CPROFILE=ui.prof        при выходе сохранить cProfile главного потока
+import atexit
+import bisect
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import types
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+ENABLED = os.environ.get('CINEMA_PROFILE', '') not in ('', '0')
+SLOW_QUERY_MS = float(os.environ.get('CINEMA_SLOW_QUERY_MS', '50'))
+PROFILE_OUT = os.environ.get('CINEMA_PROFILE_OUT')
+CPROFILE_OUT = os.environ.get('CINEMA_CPROFILE')
+
+# Сколько последних замеров операции хранится для процентилей
+SAMPLES = 4096
+# Верхние границы корзин гистограммы, мс; последняя корзина - всё, что дольше
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+TRACE_EVENTS = 100000
+SLOW_QUERIES = 200
+# Сколько выражений одной операции запоминается для поиска медленных
+STATEMENTS_PER_OPERATION = 1000
+
+# Выражения, для которых есть смысл в EXPLAIN QUERY PLAN
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class OperationStats:
+    def __init__(self):
+        self.count = 0
+        self.queries = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=SAMPLES)
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, ms, queries):
+        self.count += 1
+        self.queries += queries
+        self.total += ms
+        self.max = max(self.max, ms)
+        self.samples.append(ms)
+        self.buckets[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+
+    def percentile(self, fraction):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return 0.0
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+    def to_json(self, name):
+        return {
+            'name': name,
+            'count': self.count,
+            'queries': self.queries,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'max_ms': self.max,
+            'total_ms': self.total,
+            'histogram': dict(zip([f'<={bound}' for bound in BUCKETS_MS] + [f'>{BUCKETS_MS[-1]}'], self.buckets)),
+        }
+
+
+# Операция с базой, которая сейчас выполняется в потоке: сюда трассировка
+# sqlite3 складывает выражения вместе с моментом их запуска
+class _Operation:
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.statements = []
+        self.overflow = None
+
+
+_lock = threading.Lock()
+_stats = {}
+_trace = deque(maxlen=TRACE_EVENTS)
+_slow = deque(maxlen=SLOW_QUERIES)
+_local = threading.local()
+_origin = time.perf_counter()
+
+
+def record(name, started, queries=0):
+    # Замер операции, начатой в момент started (time.perf_counter()) и
+    # закончившейся сейчас
+    if not ENABLED:
+        return
+    finished = time.perf_counter()
+    ms = (finished - started) * 1000
+    with _lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = OperationStats()
+        stats.add(ms, queries)
+        _trace.append({
+            'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+            'ts': (started - _origin) * 1e6, 'dur': ms * 1000, 'args': {'queries': queries},
+        })
+
+
+@contextmanager
+def timed(name):
+    if not ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, started)
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+@contextmanager
+def operation(name, pool=None):
+    # Замер обращения к базе: время, число выражений SQL и медленные
+    # выражения. pool нужен, чтобы получить для них EXPLAIN QUERY PLAN
+    if not ENABLED:
+        yield
+        return
+    stack = _stack()
+    if stack:
+        # Время вложенной операции не приписывается последнему выражению внешней
+        stack[-1].statements.append((None, time.perf_counter()))
+    op = _Operation(name)
+    stack.append(op)
+    try:
+        yield
+    finally:
+        stack.pop()
+        finished = time.perf_counter()
+        record(name, op.started, op.queries)
+        if stack:
+            stack[-1].queries += op.queries
+            stack[-1].statements.append((None, finished))
+        _report_slow(op, finished, pool)
+
+
+def _on_statement(sql):
+    stack = getattr(_local, 'stack', None)
+    if not stack:
+        return
+    op = stack[-1]
+    op.queries += 1
+    if len(op.statements) < STATEMENTS_PER_OPERATION:
+        op.statements.append((sql, time.perf_counter()))
+    elif op.overflow is None:
+        op.overflow = time.perf_counter()
+
+
+def attach(conn):
+    # Трассировка выражений соединения для operation(); sqlite3 передаёт
+    # текст с подставленными параметрами, поэтому его можно объяснить как есть
+    if ENABLED:
+        conn.set_trace_callback(_on_statement)
+
+
+def _report_slow(op, finished, pool):
+    # Выражение длится до запуска следующего, последнее - до конца операции
+    ends = [started for _, started in op.statements[1:]] + [op.overflow or finished]
+    for (sql, started), ended in zip(op.statements, ends):
+        ms = (ended - started) * 1000
+        if sql is None or ms < SLOW_QUERY_MS:
+            continue
+        plan = explain(pool, sql) if pool is not None else []
+        with _lock:
+            _slow.append({'operation': op.name, 'ms': ms, 'sql': sql, 'plan': plan})
+        print(f'Медленный запрос ({ms:.1f} мс) в {op.name}:\n  {" ".join(sql.split())}', file=sys.stderr)
+        for line in plan:
+            print(f'    {line}', file=sys.stderr)
+
+
+def explain(pool, sql):
+    # План запроса строками с отступом по вложенности
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return []
+    try:
+        with pool.connection() as conn:
+            rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}').fetchall()
+    except sqlite3.Error as e:
+        # Например, запрос к временной таблице другого соединения
+        return [f'план недоступен: {e}']
+    depth = {0: -1}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node] + detail)
+    return lines
+
+
+def instrumented(prefix):
+    # Декоратор класса: каждый открытый метод замеряется как операция
+    # prefix.имя_метода. Без CINEMA_PROFILE класс не меняется
+    def decorate(cls):
+        if not ENABLED:
+            return cls
+        for name, method in list(vars(cls).items()):
+            if not name.startswith('_') and isinstance(method, types.FunctionType):
+                setattr(cls, name, _wrap(f'{prefix}.{name}', method))
+        return cls
+    return decorate
+
+
+def _wrap(name, method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with operation(name, getattr(self, 'pool', None)):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def snapshot():
+    # Сводка по операциям, самые затратные по суммарному времени - первыми
+    with _lock:
+        rows = [stats.to_json(name) for name, stats in _stats.items()]
+    return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+
+def slow_queries():
+    with _lock:
+        return list(_slow)
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _trace.clear()
+        _slow.clear()
+
+
+def dump(path):
+    # Сводка, медленные запросы и события трассировки в одном JSON
+    with _lock:
+        events = list(_trace)
+    data = {
+        'operations': snapshot(),
+        'slow_queries': slow_queries(),
+        'traceEvents': events,
+        'displayTimeUnit': 'ms',
+    }
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, indent=1)
+    return len(events)
+
+
+if ENABLED and PROFILE_OUT:
+    atexit.register(dump, PROFILE_OUT)
+
+if CPROFILE_OUT:
+    import cProfile
+
+    _profiler = cProfile.Profile()
+    _profiler.enable()
+
+    @atexit.register
+    def _dump_cprofile():
+        _profiler.disable()
+        _profiler.dump_stats(CPROFILE_OUT)
@@ -0,0 +1,164 @@
+import os
+import sqlite3
+import threading
+import time
+
+from database import DB_PATH, CinemaRepository, ConnectionPool, connect
+
+# Копия базы для отчётов, выгрузок и статистики админки
+REPLICA_PATH = 'cinema.replica.db'
+# Как часто реплика догоняет основную базу, секунд. Каждое обновление
+# копирует базу целиком, поэтому чаще раза в несколько минут не стоит
+REPLICA_INTERVAL = 300
+# Сколько соединений читает реплику
+REPLICA_POOL_SIZE = 2
+# Страниц за один шаг онлайн-копирования (при странице 4 КБ - 4 МБ)
+BACKUP_PAGES = 1024
+
+SQL_START_READ = 'SELECT COUNT(*) FROM sqlite_master'
+
+
+class ReplicaStopped(Exception):
+    pass
+
+
+def replica_path_for(path):
+    # Реплика лежит рядом с базой: cinema.db -> cinema.replica.db
+    stem, ext = os.path.splitext(path)
+    return f'{stem}.replica{ext}'
+
+
+# Онлайн-копия базы source в target (соединения sqlite3) через backup API
+# шагами по pages страниц. Чтение на source открыто одной транзакцией на всё
+# копирование: копия - согласованный снимок, а продажи на других соединениях
+# в режиме WAL не ждут её и не перезапускают копирование с начала.
+# progress(done, total) получает число скопированных страниц после каждого
+# шага; исключение из него (JobCancelled) прерывает копирование, и target
+# остаётся прежним
+def backup_database(source, target, pages=BACKUP_PAGES, progress=None):
+    def step(status, remaining, total):
+        if progress:
+            progress(total - remaining, total)
+
+    source.execute('BEGIN')
+    try:
+        source.execute(SQL_START_READ).fetchone()
+        source.backup(target, pages=pages, progress=step)
+    finally:
+        source.rollback()
+
+
+# Резервная копия работающей базы в файл path. Копия пишется во временный
+# файл рядом и подменяет path только целиком; журнал копии переводится в
+# DELETE, чтобы она была одним файлом без -wal и -shm
+def snapshot(path, source_path=DB_PATH, pages=BACKUP_PAGES, progress=None):
+    partial_path = f'{path}.part'
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+    source = connect(source_path)
+    try:
+        target = sqlite3.connect(partial_path)
+        try:
+            backup_database(source, target, pages, progress)
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+    except BaseException:
+        for leftover in (partial_path, f'{partial_path}-wal', f'{partial_path}-shm'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    finally:
+        source.close()
+    os.replace(partial_path, path)
+
+
+# Реплика только для чтения: тяжёлые чтения идут в отдельный файл и не
+# держат на основной базе долгих транзакций, которые мешают контрольным
+# точкам WAL и делят диск с продажами. Фоновый поток раз в interval секунд
+# копирует в реплику основную базу, если её изменили (PRAGMA data_version,
+# как в ChangeLog). Реплика тоже в режиме WAL: пока идёт копирование,
+# читатели видят предыдущую версию, новая появляется одним коммитом
+class Replica:
+    def __init__(self, path=DB_PATH, replica_path=REPLICA_PATH, interval=REPLICA_INTERVAL):
+        self.interval = interval
+        self.refreshed_at = None
+        self.pool = ConnectionPool(replica_path, REPLICA_POOL_SIZE, read_only=True)
+        self.repository = CinemaRepository(self.pool)
+        self._source = connect(path)
+        self._target = connect(replica_path)
+        self._version = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self, force=False):
+        # Возвращает True, если реплика скопирована заново
+        with self._lock:
+            version = self._source.execute('PRAGMA data_version').fetchone()[0]
+            if not force and version == self._version:
+                return False
+            backup_database(self._source, self._target, progress=self._check_stop)
+            self._version = version
+            self.refreshed_at = time.time()
+            return True
+
+    def _check_stop(self, done, total):
+        # Остановка не ждёт конца копирования большой базы
+        if self._stop.is_set():
+            raise ReplicaStopped()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='replica', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            self.pool.close()
+            self._source.close()
+            self._target.close()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception:
+                # База занята или копирование остановлено: повторим на следующем шаге
+                pass
+
+
+_replica = None
+_replica_lock = threading.Lock()
+
+
+# Реплика базы path, сразу скопированная (чтобы ей было что читать) и
+# обновляемая в фоне
+def start_replica(path=DB_PATH, replica_path=REPLICA_PATH, interval=REPLICA_INTERVAL):
+    replica = Replica(path, replica_path, interval)
+    try:
+        replica.refresh()
+    except BaseException:
+        replica.stop()
+        raise
+    replica.start()
+    return replica
+
+
+def get_replica():
+    global _replica
+    with _replica_lock:
+        if _replica is None:
+            _replica = start_replica()
+    return _replica
+
+
+def close_replica():
+    global _replica
+    with _replica_lock:
+        if _replica is not None:
+            _replica.stop()
+            _replica = None
@@ -0,0 +1,201 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Сколько билетов читается из базы за раз
+CHUNK_SIZE = 100000
+# Юлианский день 1970-01-01 00:00: от него отсчитываются номера дней покупки
+UNIX_EPOCH_JULIAN_DAY = 2440587.5
+# Строка SQL_REPORT_TICKETS в порции билетов
+TICKET_DTYPE = np.dtype([('showtime_id', np.int64), ('price', np.int64), ('day', np.int64)])
+
+REPORT_FORMATS = ('xlsx', 'csv')
+
+# Сеансы вместе с архивными: номер, фильм, начало, зал, мест в зале
+SQL_REPORT_SHOWTIMES = '''
+    SELECT showtimes.id, films.title, showtimes.start_ts, halls.name, halls.rows * halls.cols
+    FROM showtimes
+    JOIN films ON films.id = showtimes.film_id
+    JOIN halls ON halls.id = showtimes.hall_id
+    UNION ALL
+    SELECT archived_showtimes.id, films.title, archived_showtimes.start_ts, halls.name, halls.rows * halls.cols
+    FROM archived_showtimes
+    JOIN films ON films.id = archived_showtimes.film_id
+    JOIN halls ON halls.id = archived_showtimes.hall_id
+'''
+# Билет: сеанс, цена (-1 - цена неизвестна) и номер дня покупки от
+# 1970-01-01 (0 - дата не разобрана). Поля идут отдельными столбцами без
+# упаковки в одно число, поэтому ни id сеанса, ни цена не ограничены
+# разрядностью; порция разбирается в структурный массив одним np.fromiter
+SQL_REPORT_TICKETS = f'''
+    SELECT showtime_id, COALESCE(price, -1),
+           MAX(COALESCE(CAST(julianday(purchase_date) - {UNIX_EPOCH_JULIAN_DAY} AS INTEGER), 0), 0)
+    FROM {{table}}{{where}}
+'''
+SQL_REPORT_COUNT = 'SELECT COUNT(*) FROM {table}{where}'
+
+
+def _date_filter(date_from, date_to):
+    conditions = []
+    params = []
+    if date_from:
+        conditions.append('purchase_date >= ?')
+        params.append(date_from)
+    if date_to:
+        conditions.append("purchase_date < date(?, '+1 day')")
+        params.append(date_to)
+    where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+    return where, params
+
+
+def _accumulate(total, keys, weights=None):
+    # Сумма weights (без них - число строк) по целочисленному ключу за один
+    # вызов bincount; массив итогов растёт до наибольшего встреченного ключа
+    part = np.bincount(keys, weights=weights)
+    if len(part) > len(total):
+        total = np.pad(total, (0, len(part) - len(total)))
+    total[:len(part)] += part
+    return total
+
+
+def _lookup(total, keys):
+    values = np.zeros(len(keys))
+    inside = keys < len(total)
+    values[inside] = total[keys[inside]]
+    return values
+
+
+def _with_occupancy(frame):
+    frame['occupancy'] = (100 * frame['sold'] / frame['seats']).round(1)
+    frame['avg_price'] = (frame['revenue'] / frame['priced']).round(0).fillna(0).astype('int64')
+    return frame.drop(columns='priced')
+
+
+class RevenueReport:
+    def __init__(self, showtimes, films, halls, days, sold, revenue):
+        # Таблицы pandas.DataFrame: по сеансам, фильмам, залам и дням покупки;
+        # sold и revenue - итоги по всем билетам отчёта
+        self.sold = sold
+        self.revenue = revenue
+        self.showtimes = showtimes
+        self.films = films
+        self.halls = halls
+        self.days = days
+
+    def tables(self):
+        return {'showtimes': self.showtimes, 'films': self.films, 'halls': self.halls, 'days': self.days}
+
+    # Отчёт в JSON для ответа сервера бронирования и обратно
+    def to_json(self):
+        tables = {name: frame.to_dict(orient='split', index=False) for name, frame in self.tables().items()}
+        return {'tables': tables, 'sold': self.sold, 'revenue': self.revenue}
+
+    @classmethod
+    def from_json(cls, data):
+        tables = {
+            name: pd.DataFrame(table['data'], columns=table['columns']) for name, table in data['tables'].items()
+        }
+        return cls(tables['showtimes'], tables['films'], tables['halls'], tables['days'], data['sold'], data['revenue'])
+
+    def summary(self):
+        seats = int(self.showtimes['seats'].sum())
+        occupancy = 100 * self.showtimes['sold'].sum() / seats if seats else 0
+        return f'продано билетов: {self.sold}, выручка: {self.revenue} руб., заполняемость: {occupancy:.1f}%'
+
+
+# Отчёт о выручке и заполняемости по билетам (включая архивные), купленным с
+# date_from по date_to включительно. Билеты читаются порциями по chunk_size
+# строк, каждая порция сразу сворачивается в суммы по сеансам и дням через
+# numpy.bincount, поэтому память не растёт с числом билетов; сводки по фильмам
+# и залам - группировки pandas по таблице сеансов. Без фильтра по датам в
+# отчёт входят все сеансы, с фильтром - только сеансы с продажами за период.
+# Билеты без цены (проданные до появления цен) считаются в проданных, но не
+# в выручке и средней цене. progress(done, total) - как в export_ticket_stats
+def build_report(pool, date_from=None, date_to=None, progress=None, chunk_size=CHUNK_SIZE):
+    where, params = _date_filter(date_from, date_to)
+    sold, revenue, priced = np.zeros(0), np.zeros(0), np.zeros(0)
+    day_sold, day_revenue = np.zeros(0), np.zeros(0)
+    done = 0
+    with pool.connection() as conn:
+        total = 0
+        if progress:
+            total = sum(
+                conn.execute(SQL_REPORT_COUNT.format(table=table, where=where), params).fetchone()[0]
+                for table in ('tickets', 'archived_tickets')
+            )
+        for table in ('tickets', 'archived_tickets'):
+            cursor = conn.execute(
+                SQL_REPORT_TICKETS.format(table=table, where=where), params,
+            )
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                chunk = np.fromiter(rows, dtype=TICKET_DTYPE, count=len(rows))
+                showtime_ids, prices, days = chunk['showtime_id'], chunk['price'], chunk['day']
+                known = prices >= 0
+                paid = np.where(known, prices, 0)
+                sold = _accumulate(sold, showtime_ids)
+                revenue = _accumulate(revenue, showtime_ids, paid)
+                priced = _accumulate(priced, showtime_ids, known)
+                day_sold = _accumulate(day_sold, days)
+                day_revenue = _accumulate(day_revenue, days, paid)
+                done += len(rows)
+                if progress:
+                    progress(done, total)
+        showtimes = pd.DataFrame(
+            conn.execute(SQL_REPORT_SHOWTIMES).fetchall(), columns=['id', 'title', 'start_ts', 'hall', 'seats'],
+        )
+
+    ids = showtimes['id'].to_numpy(dtype=np.int64)
+    showtimes['sold'] = _lookup(sold, ids).astype('int64')
+    showtimes['revenue'] = _lookup(revenue, ids).astype('int64')
+    showtimes['priced'] = _lookup(priced, ids).astype('int64')
+    if where:
+        showtimes = showtimes[showtimes['sold'] > 0]
+    showtimes = showtimes.sort_values('id', ignore_index=True)
+
+    def summarize(column):
+        frame = showtimes.groupby(column, as_index=False).agg(
+            showtimes=('id', 'size'), sold=('sold', 'sum'), seats=('seats', 'sum'),
+            revenue=('revenue', 'sum'), priced=('priced', 'sum'),
+        )
+        return _with_occupancy(frame.sort_values('revenue', ascending=False, ignore_index=True))
+
+    films = summarize('title')
+    halls = summarize('hall')
+    showtimes = _with_occupancy(showtimes)
+
+    numbers = np.flatnonzero(day_sold)
+    numbers = numbers[numbers > 0]
+    days = pd.DataFrame({
+        'date': pd.to_datetime(numbers, unit='D').strftime('%Y-%m-%d'),
+        'sold': day_sold[numbers].astype('int64'),
+        'revenue': day_revenue[numbers].astype('int64'),
+    })
+    return RevenueReport(showtimes, films, halls, days, done, int(day_revenue.sum()))
+
+
+# xlsx - все таблицы листами одной книги; csv - файл на таблицу рядом с path:
+# report.csv превращается в report_showtimes.csv, report_films.csv и т.д.
+def save_report(report, path):
+    stem, ext = os.path.splitext(path)
+    fmt = ext.lstrip('.').lower()
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f'Неподдерживаемый формат отчёта: {fmt}')
+    if fmt == 'csv':
+        for name, frame in report.tables().items():
+            frame.to_csv(f'{stem}_{name}.csv', index=False)
+        return
+    # pandas выбирает формат книги по расширению, поэтому оно остаётся последним
+    partial_path = f'{stem}.part{ext}'
+    try:
+        with pd.ExcelWriter(partial_path, engine='openpyxl') as writer:
+            for name, frame in report.tables().items():
+                frame.to_excel(writer, sheet_name=name, index=False)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    os.replace(partial_path, path)
@@ -0,0 +1,182 @@
+import threading
+from collections import OrderedDict
+
+OCCUPANCY_CACHE_SIZE = 256
+
+
+# Зал произвольного размера. Места нумеруются подряд по рядам:
+# index = row * cols + col, в базе место хранится как строка 'ряд-место'
+class Hall:
+    def __init__(self, hall_id, name, rows, cols):
+        self.id = hall_id
+        self.name = name
+        self.rows = rows
+        self.cols = cols
+
+    @property
+    def seat_count(self):
+        return self.rows * self.cols
+
+    def seat_index(self, row, col):
+        return row * self.cols + col
+
+    def seat_position(self, index):
+        return divmod(index, self.cols)
+
+    def seat_label(self, index):
+        row, col = divmod(index, self.cols)
+        return f'{row + 1}-{col + 1}'
+
+    def parse_label(self, label):
+        # Возвращает None для строк вне схемы зала
+        try:
+            row, col = (int(part) - 1 for part in label.split('-'))
+        except (AttributeError, ValueError):
+            return None
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return self.seat_index(row, col)
+        return None
+
+
+# Занятость мест сеанса в виде битовой карты: один бит на место.
+# held - такая же карта мест, временно забронированных другими кассами
+class SeatOccupancy:
+    def __init__(self, hall, bits=None, held=None):
+        self.hall = hall
+        self.bits = bits if bits is not None else bytearray((hall.seat_count + 7) // 8)
+        self.held = held
+
+    @classmethod
+    def from_labels(cls, hall, labels):
+        occupancy = cls(hall)
+        for label in labels:
+            index = hall.parse_label(label)
+            if index is not None:
+                occupancy.take(index)
+        return occupancy
+
+    def with_holds(self, labels):
+        held = bytearray(len(self.bits))
+        for label in labels:
+            index = self.hall.parse_label(label)
+            if index is not None:
+                held[index >> 3] |= 1 << (index & 7)
+        return SeatOccupancy(self.hall, self.bits, held)
+
+    def without_holds(self, labels):
+        # Копия, в которой места labels не считаются чужими бронями
+        if self.held is None:
+            return self
+        held = bytearray(self.held)
+        for label in labels:
+            index = self.hall.parse_label(label)
+            if index is not None:
+                held[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+        return SeatOccupancy(self.hall, self.bits, held)
+
+    def is_taken(self, index):
+        return bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    def is_held(self, index):
+        return self.held is not None and bool(self.held[index >> 3] & (1 << (index & 7)))
+
+    def take(self, index):
+        self.bits[index >> 3] |= 1 << (index & 7)
+
+    def release(self, index):
+        self.bits[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+
+    def unavailable_mask(self):
+        # Проданные и чужие забронированные места одним целым: бит i - место i
+        mask = int.from_bytes(self.bits, 'little')
+        if self.held is not None:
+            mask |= int.from_bytes(self.held, 'little')
+        return mask
+
+    def find_adjacent(self, count):
+        # Лучшие count свободных мест подряд в одном ряду или None. Ряды
+        # перебираются от ряда на двух третях глубины зала, в ряду берётся
+        # блок ближе всего к центру. Свободные места ряда - битовая маска,
+        # после сдвигов с AND бит j остаётся, только если свободны места j..j+count-1
+        hall = self.hall
+        if not 0 < count <= hall.cols:
+            return None
+        free = ~self.unavailable_mask()
+        row_mask = (1 << hall.cols) - 1
+        best_row = hall.rows * 2 // 3
+        center = (hall.cols - count) / 2
+        for row in sorted(range(hall.rows), key=lambda row: (abs(row - best_row), row)):
+            run = (free >> (row * hall.cols)) & row_mask
+            length = 1
+            while run and length < count:
+                step = min(length, count - length)
+                run &= run >> step
+                length += step
+            if not run:
+                continue
+            starts = [col for col in range(hall.cols - count + 1) if run >> col & 1]
+            col = min(starts, key=lambda col: abs(col - center))
+            first = hall.seat_index(row, col)
+            return list(range(first, first + count))
+        return None
+
+    def taken_count(self):
+        return sum(bin(byte).count('1') for byte in self.bits)
+
+    def free_count(self):
+        return self.hall.seat_count - self.taken_count()
+
+
+# Кэш занятости по сеансам. loader(movie_id) строит SeatOccupancy из базы;
+# запись сбрасывается при покупке, чтобы следующий запрос перечитал места
+class OccupancyCache:
+    def __init__(self, loader, size=OCCUPANCY_CACHE_SIZE):
+        self._loader = loader
+        self._size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Счётчики сбросов: по сеансу и общий для clear(). Схема, загруженная
+        # из базы до сброса, в кэш не записывается - иначе покупка, прошедшая
+        # во время загрузки, показывала бы проданное место свободным.
+        # Счётчиков по сеансам не больше size: дальше они сбрасываются вместе
+        # с общим, и загрузки, начатые до этого, просто не попадут в кэш
+        self._generations = {}
+        self._cleared = 0
+
+    def _generation(self, movie_id):
+        return self._cleared, self._generations.get(movie_id, 0)
+
+    def get(self, movie_id):
+        with self._lock:
+            occupancy = self._entries.get(movie_id)
+            if occupancy is not None:
+                self._entries.move_to_end(movie_id)
+                return occupancy
+            generation = self._generation(movie_id)
+        occupancy = self._loader(movie_id)
+        if occupancy is None:
+            return None
+        with self._lock:
+            if generation == self._generation(movie_id):
+                self._entries[movie_id] = occupancy
+                while len(self._entries) > self._size:
+                    self._entries.popitem(last=False)
+        return occupancy
+
+    def invalidate(self, movie_id):
+        with self._lock:
+            if movie_id not in self._generations and len(self._generations) >= self._size:
+                self._reset_generations()
+            self._generations[movie_id] = self._generations.get(movie_id, 0) + 1
+            self._entries.pop(movie_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._reset_generations()
+            self._entries.clear()
+
+    def _reset_generations(self):
+        # Новый общий счётчик отличает любую прежнюю загрузку, поэтому
+        # счётчики по сеансам больше не нужны
+        self._cleared += 1
+        self._generations.clear()
@@ -0,0 +1,301 @@
+# Сервер бронирования: один процесс владеет базой, кассовые терминалы
+# обращаются к нему по HTTP/JSON (клиент - client.RemoteBookingService).
+#
+# POST /rpc принимает {"id": ..., "method": ..., "params": {...}} или список
+# таких запросов (пакет); ответы возвращаются в том же порядке.
+# Чтение идёт в пуле потоков, все записи - в одном потоке, а покупки,
+# пришедшие одновременно, фиксируются одной транзакцией.
+#
+# Вход (authenticate) возвращает пользователя и токен сессии; остальные
+# вызовы, кроме регистрации, принимаются только с действующим токеном в поле
+# "token" запроса. Администрирование доступно роли admin, покупка проводится
+# на пользователя сессии, чужую историю покупок видит только администратор.
+# Владелец броней - тоже сессия: owner из запроса заменяется, поэтому снять
+# или перехватить бронь другой кассы нельзя.
+#
+# Статистика продаж, выгрузка и отчёт о выручке читают реплику базы сервера
+# (replica.py, файл рядом с --db): касса в режиме CINEMA_SERVER получает их
+# отсюда, а не из своей локальной базы. Списки сеансов и пользователей
+# админки читают основную базу: по ним правят данные, правка видна сразу, а
+# кэши касс догоняют её по ленте изменений, которая идёт от основной базы.
+#
+# Сервер также по расписанию переносит в архив прошедшие сеансы (--purge-days).
+#
+# Запуск: python server.py [--host 127.0.0.1] [--port 8765] [--db cinema.db] [--purge-days 90]
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from auth import shutdown_pool, token_digest
+from core import AccessDenied, BookingService, NotAuthenticated, ServiceError, hall_to_json, occupancy_to_json
+from database import DB_PATH, ChangeLog, CinemaRepository, ConnectionPool, initialize_database
+from events import ChangeFeed, EventBus
+from replica import replica_path_for, start_replica
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+READ_WORKERS = 8
+MAX_PURCHASE_BATCH = 500
+# Наибольший размер тела запроса, байт: пакет из сотен покупок много меньше
+MAX_BODY_SIZE = 4 * 1024 * 1024
+# Как часто запускается плановая архивация прошедших сеансов, в секундах
+PURGE_INTERVAL = 6 * 60 * 60
+
+READ_METHODS = {
+    'authenticate', 'showtimes_page', 'sessions_full_page', 'users_page', 'list_films', 'list_halls', 'occupancy',
+    'latest_change', 'changes_since', 'ticket_history_page', 'seat_prices', 'refresh_stats', 'showtime_stats_page',
+    'daily_stats_page', 'film_stats_page', 'ticket_stats_page', 'count_ticket_stats', 'revenue_report',
+}
+# Групповая покупка идёт своей транзакцией в потоке записи, между пачками
+# одиночных покупок: её места продаются все сразу или ни одно
+WRITE_METHODS = {
+    'register_user', 'add_session', 'delete_session', 'delete_sessions', 'archive_sessions', 'purge_sessions',
+    'purchase_seats', 'rebuild_stats',
+}
+# Брони живут в памяти процесса, а не в базе, поэтому не занимают поток записи
+HOLD_METHODS = {'hold_seat', 'release_seat'}
+# Доступны без входа
+PUBLIC_METHODS = {'authenticate', 'register_user'}
+# Только для роли admin
+ADMIN_METHODS = {
+    'sessions_full_page', 'users_page', 'add_session', 'delete_session', 'delete_sessions', 'archive_sessions',
+    'purge_sessions', 'rebuild_stats', 'refresh_stats', 'showtime_stats_page', 'daily_stats_page', 'film_stats_page',
+    'ticket_stats_page', 'count_ticket_stats', 'revenue_report',
+}
+# Покупка всегда на пользователя сессии: user_id из запроса не учитывается
+PURCHASE_METHODS = {'purchase_ticket', 'purchase_seats'}
+# Вызовы с владельцем броней: owner из запроса заменяется сессией
+OWNER_METHODS = HOLD_METHODS | PURCHASE_METHODS | {'occupancy'}
+
+ENCODERS = {
+    'occupancy': occupancy_to_json,
+    'list_halls': lambda halls: [hall_to_json(hall) for hall in halls],
+    'revenue_report': lambda report: report.to_json(),
+}
+
+
+def error_payload(message):
+    return {'error': {'type': 'ServiceError', 'message': message}}
+
+
+class BookingServer:
+    def __init__(self, service, read_workers=READ_WORKERS, purge_days=0, purge_interval=PURGE_INTERVAL):
+        self.service = service
+        self.purge_days = purge_days
+        self.purge_interval = purge_interval
+        self.readers = ThreadPoolExecutor(read_workers, thread_name_prefix='reader')
+        self.writer = ThreadPoolExecutor(1, thread_name_prefix='writer')
+        self._pending_purchases = []
+        self._flushing = False
+
+    async def call(self, request):
+        request_id = request.get('id') if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict):
+                raise ServiceError('Некорректный запрос.')
+            method = request.get('method')
+            params = request.get('params') or {}
+            if method not in READ_METHODS | HOLD_METHODS | WRITE_METHODS | PURCHASE_METHODS:
+                raise ServiceError(f'Неизвестный метод: {method}')
+            if method not in PUBLIC_METHODS:
+                params = await self._authorize(request.get('token'), method, params)
+            if method == 'authenticate':
+                result = await self._authenticate(params)
+            elif method == 'purchase_ticket':
+                result = await self._purchase(
+                    params['user_id'], params['movie_id'], params['seat'], params.get('owner'),
+                )
+            else:
+                executor = self.writer if method in WRITE_METHODS else self.readers
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(executor, partial(getattr(self.service, method), **params))
+                result = ENCODERS.get(method, lambda value: value)(result)
+        except ServiceError as e:
+            return {'id': request_id, 'error': {'type': type(e).__name__, 'message': str(e)}}
+        except Exception as e:
+            return {'id': request_id, 'error': {'type': 'ServiceError', 'message': str(e)}}
+        return {'id': request_id, 'result': result}
+
+    async def _authenticate(self, params):
+        # Пароль проверяется в читающем потоке, сессия записывается в потоке записи
+        loop = asyncio.get_running_loop()
+        user = await loop.run_in_executor(self.readers, partial(self.service.authenticate, **params))
+        if user is None:
+            return None
+        token = await loop.run_in_executor(self.writer, self.service.open_session, user)
+        return {'user': user, 'token': token}
+
+    async def _authorize(self, token, method, params):
+        # Возвращает params, в которых покупатель заменён пользователем сессии,
+        # а владелец броней - самой сессией
+        user = await asyncio.get_running_loop().run_in_executor(self.readers, self.service.session_user, token)
+        if user is None:
+            raise NotAuthenticated('Сессия истекла или не начата: войдите снова.')
+        is_admin = user[7] == 'admin'
+        if method in ADMIN_METHODS and not is_admin:
+            raise AccessDenied('Недостаточно прав.')
+        if method == 'ticket_history_page' and params.get('user_id') != user[0] and not is_admin:
+            raise AccessDenied('Недостаточно прав.')
+        if method in PURCHASE_METHODS:
+            params = dict(params, user_id=user[0])
+        if method in OWNER_METHODS:
+            params = dict(params, owner=token_digest(token))
+        return params
+
+    async def dispatch(self, payload):
+        if isinstance(payload, list):
+            return list(await asyncio.gather(*(self.call(request) for request in payload)))
+        return await self.call(payload)
+
+    # Групповой коммит покупок: пока идёт запись одной пачки, новые покупки
+    # копятся в очереди и уходят следующей транзакцией
+    async def _purchase(self, user_id, movie_id, seat, owner):
+        future = asyncio.get_running_loop().create_future()
+        self._pending_purchases.append(((user_id, movie_id, seat, owner), future))
+        if not self._flushing:
+            self._flushing = True
+            asyncio.ensure_future(self._flush_purchases())
+        result = await future
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def _flush_purchases(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while self._pending_purchases:
+                batch = self._pending_purchases[:MAX_PURCHASE_BATCH]
+                del self._pending_purchases[:len(batch)]
+                try:
+                    results = await loop.run_in_executor(
+                        self.writer, self.service.commit_purchases, [purchase for purchase, _ in batch],
+                    )
+                except Exception as e:
+                    results = [e] * len(batch)
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            self._flushing = False
+
+    async def route(self, method, path, body):
+        if method == 'GET' and path == '/health':
+            return '200 OK', {'status': 'ok'}
+        if method == 'POST' and path == '/rpc':
+            try:
+                payload = json.loads(body or b'null')
+            except ValueError:
+                return '400 Bad Request', error_payload('Некорректный JSON.')
+            return '200 OK', await self.dispatch(payload)
+        return '404 Not Found', error_payload('Не найдено.')
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                length = headers.get('content-length', '0')
+                # Без прочитанного тела неизвестно, где начнётся следующий
+                # запрос, поэтому отказ закрывает соединение
+                if not (length.isascii() and length.isdigit()):
+                    status, payload = '400 Bad Request', error_payload('Некорректная длина запроса.')
+                    keep_alive = False
+                elif int(length) > MAX_BODY_SIZE:
+                    status, payload = '413 Payload Too Large', error_payload('Слишком большой запрос.')
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(int(length))
+                    status, payload = await self.route(method, path, body)
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                head = (
+                    f'HTTP/1.1 {status}\r\n'
+                    'Content-Type: application/json; charset=utf-8\r\n'
+                    f'Content-Length: {len(data)}\r\n'
+                    f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'
+                )
+                writer.write(head.encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    # Плановая архивация идёт в потоке записи, как и остальные изменения базы
+    async def purge_periodically(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                showtimes, tickets = await loop.run_in_executor(
+                    self.writer, self.service.purge_sessions, self.purge_days,
+                )
+                if showtimes:
+                    print(f'В архив перенесено сеансов: {showtimes}, билетов: {tickets}')
+            except Exception as e:
+                print(f'Ошибка плановой архивации: {e}')
+            await asyncio.sleep(self.purge_interval)
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        if self.purge_days:
+            asyncio.ensure_future(self.purge_periodically())
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.readers.shutdown()
+        self.writer.shutdown()
+        shutdown_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сервер бронирования кинотеатра')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--read-workers', type=int, default=READ_WORKERS)
+    parser.add_argument('--purge-days', type=int, default=0,
+                        help='архивировать сеансы старше стольких дней (0 - не архивировать)')
+    parser.add_argument('--purge-interval', type=int, default=PURGE_INTERVAL, help='период архивации, секунд')
+    args = parser.parse_args()
+
+    # Соединений хватает на все читающие потоки и поток записи
+    pool = ConnectionPool(args.db, size=args.read_workers + 1)
+    initialize_database(pool)
+    replica = start_replica(args.db, replica_path_for(args.db))
+    service = BookingService(CinemaRepository(pool), replica=replica)
+    server = BookingServer(service, args.read_workers, args.purge_days, args.purge_interval)
+    # Продажи, сделанные в обход сервера (другим терминалом на той же базе),
+    # сбрасывают кэш занятости сервера
+    bus = EventBus()
+    bus.subscribe(service.apply_changes)
+    log = ChangeLog(args.db)
+    feed = ChangeFeed(bus, log.latest, log.since, log.changed, log.close)
+    feed.start()
+    print(f'Сервер бронирования слушает http://{args.host}:{args.port}')
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        feed.stop()
+        server.close()
+        replica.stop()
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from auth import shutdown_pool
+from core import BookingService
+from database import CinemaRepository, ConnectionPool, initialize_database
+from seed import seed
+
+# Масштаб базы для замеров pytest-benchmark; большие масштабы - benchmarks/load_test.py
+SEEDED_TICKETS = 10000
+
+
+@pytest.fixture(scope='session', autouse=True)
+def scrypt_pool():
+    yield
+    shutdown_pool()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'cinema.db')
+
+
+@pytest.fixture
+def pool(db_path):
+    pool = ConnectionPool(db_path)
+    initialize_database(pool)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def service(pool):
+    return BookingService(CinemaRepository(pool))
+
+
+# Заполненная seed.py база, общая для всех замеров: (путь, счётчики seed)
+@pytest.fixture(scope='session')
+def seeded(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('seeded') / 'cinema.db')
+    pool = ConnectionPool(path)
+    initialize_database(pool)
+    counts = seed(pool, SEEDED_TICKETS)
+    pool.close()
+    return path, counts
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# Сервер бронирования в отдельном процессе на базе теста; stop() и start()
+# имитируют обрыв связи и возвращение сервера на том же порту
+class ServerProcess:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.port = free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'server.py'), '--db', self.db_path, '--port', str(self.port)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=0.2).close()
+                return
+            except OSError:
+                time.sleep(0.05)
+        self.stop()
+        raise RuntimeError('сервер не запустился')
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+
+@pytest.fixture
+def server(db_path, pool):
+    server = ServerProcess(db_path)
+    server.start()
+    yield server
+    server.stop()
@@ -0,0 +1,88 @@
+# Замеры pytest-benchmark основных операций кассы на базе seed.py
+# (SEEDED_TICKETS билетов). Нужен пакет pytest-benchmark; без него модуль
+# пропускается. Сравнение с прошлым прогоном:
+#   python -m pytest tests/test_benchmarks.py --benchmark-autosave
+#   python -m pytest tests/test_benchmarks.py --benchmark-compare --benchmark-compare-fail=mean:20%
+# Нагрузка на больших масштабах и конкуренция касс - benchmarks/load_test.py
+import itertools
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from core import BookingService
+from database import CinemaRepository, ConnectionPool
+from export import export_ticket_stats
+from seed import HALL_COLS, HALL_ROWS, SEED_PASSWORD, TICKETS_PER_SHOWTIME, seat_label
+
+PAGE_SIZE = 200
+
+
+@pytest.fixture
+def seeded_service(seeded):
+    path, counts = seeded
+    pool = ConnectionPool(path)
+    yield BookingService(CinemaRepository(pool)), counts
+    pool.close()
+
+
+def test_login_cold(benchmark, seeded_service):
+    service, counts = seeded_service
+    username = f'load{counts["first_user"]}'
+
+    def login():
+        service.auth_cache.invalidate(username)
+        return service.authenticate(username, SEED_PASSWORD)
+
+    assert benchmark.pedantic(login, rounds=10, warmup_rounds=1) is not None
+
+
+def test_login_cached(benchmark, seeded_service):
+    service, counts = seeded_service
+    username = f'load{counts["first_user"]}'
+    service.authenticate(username, SEED_PASSWORD)
+    assert benchmark(service.authenticate, username, SEED_PASSWORD) is not None
+
+
+def test_session_list(benchmark, seeded_service):
+    service, _ = seeded_service
+    now = datetime.now().strftime('%Y-%m-%d %H:%M')
+    until = (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d')
+    assert benchmark(service.showtimes_page, (now, 0), PAGE_SIZE, until)
+
+
+def test_seat_map_cold(benchmark, seeded_service):
+    service, counts = seeded_service
+    rng = random.Random(1)
+    showtimes = range(counts['first_showtime'], counts['first_showtime'] + counts['showtimes'])
+
+    def seat_map():
+        showtime_id = rng.choice(showtimes)
+        service.repository.occupancy_cache.invalidate(showtime_id)
+        return service.occupancy(showtime_id)
+
+    assert benchmark(seat_map).taken_count() >= TICKETS_PER_SHOWTIME
+
+
+def test_purchase(benchmark, seeded_service):
+    service, counts = seeded_service
+    # Свободные места: у каждого сеанса seed.py продал первые TICKETS_PER_SHOWTIME
+    seats = itertools.product(
+        range(counts['first_showtime'], counts['first_showtime'] + counts['showtimes']),
+        range(TICKETS_PER_SHOWTIME, HALL_ROWS * HALL_COLS),
+    )
+
+    def purchase():
+        showtime_id, index = next(seats)
+        return service.purchase_ticket(counts['first_user'], showtime_id, seat_label(index))
+
+    assert benchmark.pedantic(purchase, rounds=500)
+
+
+def test_export(benchmark, seeded_service, tmp_path):
+    service, counts = seeded_service
+    path = str(tmp_path / 'stats.csv')
+    written = benchmark.pedantic(export_ticket_stats, args=(service.repository.pool, path), rounds=3)
+    assert written >= counts['tickets']
@@ -0,0 +1,62 @@
+import socket
+import threading
+
+import pytest
+
+from client import RemoteBookingService
+
+
+# Сервер, который читает запрос и рвёт соединение, не ответив: как если бы
+# связь оборвалась после того, как сервер получил запрос
+class DroppingServer:
+    def __init__(self):
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen()
+        self.url = f'http://127.0.0.1:{self.sock.getsockname()[1]}'
+        self.requests = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            with conn:
+                if conn.recv(65536):
+                    self.requests += 1
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture
+def dropping_server():
+    server = DroppingServer()
+    yield server
+    server.close()
+
+
+def test_purchase_is_not_resent_after_lost_response(dropping_server):
+    remote = RemoteBookingService(dropping_server.url)
+    with pytest.raises(ConnectionError):
+        remote.purchase_ticket(1, 1, '1-1')
+    assert dropping_server.requests == 1
+
+
+def test_read_is_retried_once(dropping_server):
+    remote = RemoteBookingService(dropping_server.url)
+    with pytest.raises(ConnectionError):
+        remote.list_films()
+    assert dropping_server.requests == 2
+
+
+def test_purchase_after_server_restart_uses_new_connection(server):
+    remote = RemoteBookingService(server.url)
+    remote.authenticate('johndoe', 'password123')
+    remote.list_films()
+    server.stop()
+    server.start()
+    assert remote.purchase_ticket(1, 1, '4-1') is True
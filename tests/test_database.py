@@ -0,0 +1,60 @@
+import sqlite3
+
+from database import (
+    SCHEMA_VERSION, SQL_TICKET_HISTORY_PAGE, ConnectionPool, _migration_1_base_schema, initialize_database, schema_version,
+)
+
+
+def test_fresh_database_gets_all_migrations(pool):
+    with pool.connection() as conn:
+        assert schema_version(conn) == SCHEMA_VERSION
+        assert conn.execute('PRAGMA foreign_key_check').fetchall() == []
+        assert conn.execute('SELECT COUNT(*) FROM showtimes').fetchone()[0] == 2
+
+
+def test_baseline_database_keeps_its_rows(db_path):
+    # База прежней версии: схема и примерные данные уже есть, user_version 0
+    conn = sqlite3.connect(db_path)
+    _migration_1_base_schema(conn.cursor())
+    conn.commit()
+    conn.close()
+
+    pool = ConnectionPool(db_path)
+    initialize_database(pool)
+    with pool.connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM showtimes').fetchone()[0] == 2
+        assert conn.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 2
+    pool.close()
+
+
+def test_showtimes_keyset_pages_cover_window_once(service):
+    for day in range(1, 6):
+        for hour in ('10:00', '10:00', '12:00'):
+            service.add_session(f'Фильм {day}', '', f'2030-01-0{day}', hour)
+    expected = [row[0] for row in service.showtimes_page(('2030-01-01', 0), 1000, '2030-02-01')]
+
+    seen = []
+    key = ('2030-01-01', 0)
+    while True:
+        rows = service.showtimes_page(key, 4, '2030-02-01')
+        if not rows:
+            break
+        seen += [row[0] for row in rows]
+        key = (rows[-1][5], rows[-1][0])
+    assert seen == expected
+    assert len(seen) == 15
+
+
+def test_seat_is_sold_once(service):
+    assert service.purchase_ticket(2, 1, '1-1') is True
+    assert service.purchase_ticket(1, 1, '1-1') is False
+    assert service.purchase_seats(1, 1, ['1-2', '1-1']) is False
+    assert service.occupancy(1).taken_count() == 1
+
+
+def test_ticket_history_reads_only_covering_indexes(pool):
+    with pool.connection() as conn:
+        plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + SQL_TICKET_HISTORY_PAGE, (1, '9999', 0, 10))]
+    scans = [step for step in plan if 'tickets' in step.split(' USING')[0]]
+    assert len(scans) == 2
+    assert all('COVERING INDEX idx_' in step and '_user_purchased' in step for step in scans)
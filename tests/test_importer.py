@@ -0,0 +1,55 @@
+import csv
+
+import pytest
+
+from importer import import_file
+
+
+class Cancelled(Exception):
+    pass
+
+
+def write_schedule(path, count):
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['title', 'description', 'date', 'time', 'hall_id', 'price'])
+        for i in range(count):
+            writer.writerow([f'Фильм {i % 3}', '', '2030-01-01', f'{10 + i:02d}:00', 1, 300])
+        writer.writerow(['Без даты', '', '', '10:00', 1, 300])
+
+
+def showtimes(pool):
+    with pool.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM showtimes WHERE start_ts >= '2030'").fetchone()[0]
+
+
+def test_interrupted_import_resumes_after_last_batch(pool, tmp_path):
+    path = str(tmp_path / 'schedule.csv')
+    write_schedule(path, 10)
+
+    def cancel(done, total):
+        raise Cancelled()
+
+    with pytest.raises(Cancelled):
+        import_file(pool, 'sessions', path, progress=cancel, batch_size=4)
+    assert showtimes(pool) == 4
+
+    report = import_file(pool, 'sessions', path, batch_size=4)
+    assert report.resumed_from == 4
+    assert report.imported == 6
+    assert [number for number, _ in report.errors] == [11]
+    assert showtimes(pool) == 10
+
+
+def test_restart_ignores_checkpoint(pool, tmp_path):
+    path = str(tmp_path / 'schedule.csv')
+    write_schedule(path, 5)
+
+    def cancel(done, total):
+        raise Cancelled()
+
+    with pytest.raises(Cancelled):
+        import_file(pool, 'sessions', path, progress=cancel, batch_size=2)
+    report = import_file(pool, 'sessions', path, batch_size=2, restart=True)
+    assert report.resumed_from == 0
+    assert report.imported == 5
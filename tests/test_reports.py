@@ -0,0 +1,22 @@
+from reports import build_report
+
+
+def test_report_keeps_large_prices_apart_from_showtimes(pool):
+    with pool.connection() as conn:
+        conn.executemany(
+            'INSERT INTO tickets (user_id, showtime_id, seat_number, price, purchase_date) VALUES (1, ?, ?, ?, ?)',
+            [
+                (1, '1-1', 2000000, '2030-01-01 10:00'),
+                (1, '1-2', 300, '2030-01-01 11:00'),
+                (2, '1-1', None, '2030-01-02 10:00'),
+            ],
+        )
+        conn.commit()
+
+    report = build_report(pool, chunk_size=2)
+    assert report.sold == 3
+    assert report.revenue == 2000300
+    by_id = report.showtimes.set_index('id')
+    assert by_id.loc[1, ['sold', 'revenue', 'avg_price']].tolist() == [2, 2000300, 1000150]
+    assert by_id.loc[2, ['sold', 'revenue', 'avg_price']].tolist() == [1, 0, 0]
+    assert report.days.values.tolist() == [['2030-01-01', 2, 2000300], ['2030-01-02', 1, 0]]
@@ -0,0 +1,78 @@
+import threading
+
+from holds import SeatHolds
+from seatmap import Hall, OccupancyCache, SeatOccupancy
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_find_adjacent_returns_free_run_in_one_row():
+    hall = Hall(1, 'Зал', 3, 5)
+    # Лучший ряд - на две трети глубины зала (третий); в нём свободны только места 4 и 5
+    occupancy = SeatOccupancy.from_labels(hall, ['3-1', '3-2', '3-3'])
+    seats = occupancy.find_adjacent(2)
+    assert [hall.seat_label(index) for index in seats] == ['3-4', '3-5']
+    seats = occupancy.find_adjacent(3)
+    rows = {hall.seat_position(index)[0] for index in seats}
+    assert len(rows) == 1 and seats == list(range(seats[0], seats[0] + 3))
+    assert not any(occupancy.is_taken(index) for index in seats)
+
+
+def test_find_adjacent_without_room():
+    hall = Hall(1, 'Зал', 2, 3)
+    occupancy = SeatOccupancy.from_labels(hall, ['1-2', '2-2'])
+    assert occupancy.find_adjacent(2) is None
+    assert occupancy.find_adjacent(4) is None
+
+
+def test_seat_hold_expires():
+    clock = FakeClock()
+    holds = SeatHolds(ttl=10, clock=clock)
+    assert holds.hold(1, '1-1', 'a')
+    assert not holds.hold(1, '1-1', 'b')
+    assert holds.held_by_others(1, 'b') == ['1-1']
+    clock.now = 10
+    assert holds.holder(1, '1-1') is None
+    assert holds.hold(1, '1-1', 'b')
+
+
+def test_occupancy_loaded_before_invalidation_is_not_cached():
+    hall = Hall(1, 'Зал', 1, 2)
+    loading = threading.Event()
+    resume = threading.Event()
+    loads = []
+
+    def loader(movie_id):
+        loads.append(movie_id)
+        if len(loads) == 1:
+            loading.set()
+            resume.wait()
+        return SeatOccupancy(hall)
+
+    cache = OccupancyCache(loader)
+    thread = threading.Thread(target=cache.get, args=(1,))
+    thread.start()
+    loading.wait()
+    # Покупка сбрасывает запись, пока первая загрузка ещё идёт
+    cache.invalidate(1)
+    resume.set()
+    thread.join()
+    cache.get(1)
+    assert loads == [1, 1]
+
+
+def test_occupancy_generations_stay_bounded():
+    hall = Hall(1, 'Зал', 1, 2)
+    cache = OccupancyCache(lambda movie_id: SeatOccupancy(hall), size=4)
+    for movie_id in range(100):
+        cache.get(movie_id)
+        cache.invalidate(movie_id)
+    assert len(cache._generations) <= 4
+    cache.clear()
+    assert cache._generations == {}
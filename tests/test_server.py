@@ -0,0 +1,217 @@
+import csv
+import socket
+import time
+
+import pytest
+
+from client import RemoteBookingService
+from core import QUEUED, AccessDenied, NotAuthenticated
+from database import CinemaRepository
+from offline import OfflineBookingService
+
+
+def test_calls_need_session(server):
+    remote = RemoteBookingService(server.url)
+    with pytest.raises(NotAuthenticated):
+        remote.users_page(0, 10)
+    with pytest.raises(NotAuthenticated):
+        remote.delete_sessions([1])
+    remote.token = 'unknown'
+    with pytest.raises(NotAuthenticated):
+        remote.list_films()
+
+
+def test_user_cannot_administer_or_buy_for_others(server, pool):
+    remote = RemoteBookingService(server.url)
+    user = remote.authenticate('johndoe', 'password123')
+    with pytest.raises(AccessDenied):
+        remote.users_page(0, 10)
+    with pytest.raises(AccessDenied):
+        remote.delete_sessions([1])
+    with pytest.raises(AccessDenied):
+        remote.ticket_history_page(1, ('9999', 0), 10)
+
+    assert remote.purchase_ticket(1, 1, '1-1') is True
+    with pool.connection() as conn:
+        assert conn.execute("SELECT user_id FROM tickets WHERE seat_number = '1-1'").fetchall() == [(user[0],)]
+
+
+def test_holds_belong_to_the_session(server):
+    first = RemoteBookingService(server.url)
+    first.authenticate('johndoe', 'password123')
+    second = RemoteBookingService(server.url)
+    second.authenticate('admin', 'adminpass')
+    assert first.hold_seat(1, '1-1', 'terminal') is True
+    # Тот же owner из другой сессии - чужая касса
+    second.release_seat(1, '1-1', 'terminal')
+    assert second.hold_seat(1, '1-1', 'terminal') is False
+    seat = second.occupancy(1, 'terminal').hall.parse_label('1-1')
+    assert second.occupancy(1, 'terminal').is_held(seat)
+    assert not first.occupancy(1, 'terminal').is_held(seat)
+
+
+def raw_request(server, content_length):
+    with socket.create_connection(('127.0.0.1', server.port), timeout=5) as sock:
+        sock.sendall(f'POST /rpc HTTP/1.1\r\nContent-Length: {content_length}\r\n\r\n'.encode('latin-1'))
+        return sock.recv(4096).split(b'\r\n', 1)[0]
+
+
+def test_request_length_is_checked(server):
+    assert raw_request(server, 64 * 1024 * 1024) == b'HTTP/1.1 413 Payload Too Large'
+    assert raw_request(server, -5) == b'HTTP/1.1 400 Bad Request'
+    assert raw_request(server, 'abc') == b'HTTP/1.1 400 Bad Request'
+
+
+def test_admin_lists_users(server):
+    remote = RemoteBookingService(server.url)
+    assert remote.authenticate('admin', 'adminpass')[7] == 'admin'
+    assert len(remote.users_page(0, 10)) == 2
+
+
+def test_stats_export_and_report_read_server_replica(server, tmp_path):
+    user = RemoteBookingService(server.url)
+    user.authenticate('johndoe', 'password123')
+    assert user.purchase_seats(1, 1, ['1-1', '1-2']) is True
+    with pytest.raises(AccessDenied):
+        user.showtime_stats_page(0, 10)
+    with pytest.raises(AccessDenied):
+        user.ticket_stats_page(0, 10)
+
+    admin = RemoteBookingService(server.url)
+    admin.authenticate('admin', 'adminpass')
+    admin.refresh_stats()
+    assert [row[5] for row in admin.showtime_stats_page(0, 10) if row[0] == 1] == [2]
+
+    path = str(tmp_path / 'stats.csv')
+    progress = []
+    assert admin.export_ticket_stats(path, progress=lambda done, total: progress.append((done, total))) == 2
+    assert progress == [(2, 2)]
+    with open(path, encoding='utf-8') as file:
+        assert [row[3] for row in csv.reader(file)][1:] == ['1-1', '1-2']
+
+    report = admin.revenue_report()
+    assert report.sold == 2
+    assert report.showtimes.set_index('id').loc[1, 'sold'] == 2
+
+
+def test_offline_purchases_replay_after_server_restart(server, pool, tmp_path):
+    remote = RemoteBookingService(server.url, timeout=2)
+    user = remote.authenticate('johndoe', 'password123')
+    service = OfflineBookingService(remote, str(tmp_path / 'offline.db'), retry_interval=0.1)
+    try:
+        service.occupancy(1)
+        server.stop()
+        assert service.purchase_ticket(user[0], 1, '2-1') == QUEUED
+        assert service.purchase_seats(user[0], 1, ['3-1', '3-2']) == QUEUED
+        assert service.purchase_ticket(user[0], 1, '2-2') == QUEUED
+        # Пока касса без связи, место 2-2 продаёт другая касса
+        CinemaRepository(pool).purchase_ticket(1, 1, '2-2')
+
+        server.start()
+        deadline = time.monotonic() + 10
+        while service.pending_count() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert service.pending_count() == 0
+        assert [seats for _, _, seats, _, _ in service.conflicts()] == [['2-2']]
+        with pool.connection() as conn:
+            sold = conn.execute(
+                "SELECT seat_number FROM tickets WHERE showtime_id = 1 AND user_id = ? ORDER BY seat_number", (user[0],),
+            ).fetchall()
+        assert sold == [('2-1',), ('3-1',), ('3-2',)]
+    finally:
+        service.close()
+
+
+def test_offline_journal_waits_for_its_user_without_storing_tokens(server, pool, tmp_path):
+    remote = RemoteBookingService(server.url, timeout=2)
+    user = remote.authenticate('johndoe', 'password123')
+    path = tmp_path / 'offline.db'
+    # Журнал проводится вручную, без фонового потока
+    service = OfflineBookingService(remote, str(path), retry_interval=3600)
+    try:
+        service.occupancy(1)
+        server.stop()
+        assert service.purchase_ticket(user[0], 1, '5-1') == QUEUED
+        assert remote.token.encode() not in path.read_bytes()
+
+        server.start()
+        # На кассе вошёл другой пользователь: чужая покупка ждёт входа покупателя
+        remote.authenticate('admin', 'adminpass')
+        service.replay()
+        assert service.pending_count() == 1
+        remote.authenticate('johndoe', 'password123')
+        service.replay()
+        assert service.pending_count() == 0
+        with pool.connection() as conn:
+            assert conn.execute("SELECT user_id FROM tickets WHERE seat_number = '5-1'").fetchall() == [(user[0],)]
+    finally:
+        service.close()
+
+
+def test_expired_session_leaves_offline_purchases_pending(server, pool, tmp_path):
+    remote = RemoteBookingService(server.url, timeout=2)
+    user = remote.authenticate('johndoe', 'password123')
+    service = OfflineBookingService(remote, str(tmp_path / 'offline.db'), retry_interval=3600)
+    try:
+        service.occupancy(1)
+        server.stop()
+        assert service.purchase_ticket(user[0], 1, '5-3') == QUEUED
+        server.start()
+        # Сессия истекла, пока касса была без связи
+        with pool.connection() as conn:
+            conn.execute('DELETE FROM auth_sessions')
+            conn.commit()
+        service.replay()
+        assert service.pending_count() == 1
+        assert service.conflicts() == []
+
+        remote.authenticate('johndoe', 'password123')
+        service.replay()
+        assert service.pending_count() == 0
+        assert service.conflicts() == []
+    finally:
+        service.close()
+
+
+def test_offline_cache_survives_new_minute_and_restart(server, pool, tmp_path):
+    repository = CinemaRepository(pool)
+    for hour in ('10:00', '12:00', '14:00'):
+        repository.add_session('Фильм 1', '', '2030-01-01', hour)
+    path = str(tmp_path / 'offline.db')
+    remote = RemoteBookingService(server.url, timeout=2)
+    remote.authenticate('johndoe', 'password123')
+    service = OfflineBookingService(remote, path, retry_interval=3600)
+    try:
+        assert len(service.showtimes_page(('2030-01-01 09:59', 0), 2, '2030-01-02')) == 2
+        assert len(service.showtimes_page(('2030-01-01 12:00', 10 ** 9), 2, '2030-01-02')) == 1
+        assert service.hold_seat(1, '1-1', 'terminal') is True
+        service.occupancy(1, 'terminal')
+    finally:
+        service.close()
+    server.stop()
+
+    # Новый запуск кассы: другой владелец броней, прошла минута, сервера нет
+    service = OfflineBookingService(remote, path, retry_interval=3600)
+    try:
+        page = service.showtimes_page(('2030-01-01 10:01', 0), 10, '2030-01-02')
+        assert [row[3] for row in page] == ['12:00', '14:00']
+        assert service.occupancy(1, 'another') is not None
+    finally:
+        service.close()
+
+
+def test_own_holds_are_not_shown_as_foreign(server, tmp_path):
+    remote = RemoteBookingService(server.url, timeout=2)
+    remote.authenticate('johndoe', 'password123')
+    service = OfflineBookingService(remote, str(tmp_path / 'offline.db'), retry_interval=3600)
+    try:
+        assert service.hold_seat(1, '1-1', 'terminal') is True
+        # После повторного входа сервер считает бронь прежней сессии чужой,
+        # но держит её эта касса
+        remote.authenticate('johndoe', 'password123')
+        occupancy = service.occupancy(1, 'terminal')
+        assert not occupancy.is_held(occupancy.hall.parse_label('1-1'))
+        service.release_seat(1, '1-1', 'terminal')
+        assert service.occupancy(1, 'terminal').is_held(occupancy.hall.parse_label('1-1'))
+    finally:
+        service.close()
@@ -0,0 +1,155 @@
+from PyQt6 import QtCore, QtGui, QtWidgets
+
+import profiling
+
+SEAT_SIZE = 50
+SEAT_SPACING = 6
+
+FREE_COLOR = QtGui.QColor('#0078D7')
+TAKEN_COLOR = QtGui.QColor('gray')
+HELD_COLOR = QtGui.QColor('#E8A33D')
+SELECTED_COLOR = QtGui.QColor('#2E8B57')
+
+
+# Схема зала, нарисованная целиком в одном paintEvent. Клик определяет место
+# по координатам и переключает его выбор; выбрать можно несколько мест.
+# seatToggled(место, выбрано) сообщает о каждом изменении выбора
+class SeatMapWidget(QtWidgets.QWidget):
+    seatToggled = QtCore.pyqtSignal(str, bool)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.occupancy = None
+        self.selected = []
+        self.setSizePolicy(QtWidgets.QSizePolicy.Policy.Expanding, QtWidgets.QSizePolicy.Policy.Expanding)
+
+    def set_occupancy(self, occupancy):
+        # Сеанс в зале того же размера: геометрия не пересчитывается, меняются только цвета мест
+        same_hall = (
+            self.occupancy is not None and occupancy is not None
+            and (self.occupancy.hall.rows, self.occupancy.hall.cols) == (occupancy.hall.rows, occupancy.hall.cols)
+        )
+        labels = [self.occupancy.hall.seat_label(index) for index in self.selected] if self.occupancy else []
+        self.occupancy = occupancy
+        # Места, которые успели занять, и весь выбор в другом зале снимаются
+        for index, label in list(zip(self.selected, labels)):
+            if not same_hall or self.is_taken(index):
+                self.selected.remove(index)
+                self.seatToggled.emit(label, False)
+        if not same_hall:
+            self.updateGeometry()
+        self.update()
+
+    def is_taken(self, index):
+        # Место под бронью другой кассы выбрать тоже нельзя
+        return self.occupancy is not None and (self.occupancy.is_taken(index) or self.occupancy.is_held(index))
+
+    def selected_labels(self):
+        if self.occupancy is None:
+            return []
+        return [self.occupancy.hall.seat_label(index) for index in self.selected]
+
+    def toggle(self, index):
+        if index in self.selected:
+            self.selected.remove(index)
+            self.seatToggled.emit(self.occupancy.hall.seat_label(index), False)
+        else:
+            self.selected.append(index)
+            self.seatToggled.emit(self.occupancy.hall.seat_label(index), True)
+        self.update()
+
+    def set_selection(self, indices):
+        # Заменяет выбор: лишние места снимаются, новые добавляются
+        for index in [index for index in self.selected if index not in indices]:
+            self.toggle(index)
+        for index in indices:
+            if index not in self.selected:
+                self.toggle(index)
+
+    def deselect(self, label):
+        index = self.occupancy.hall.parse_label(label) if self.occupancy is not None else None
+        if index in self.selected:
+            self.toggle(index)
+
+    def clear_selection(self):
+        self.set_selection([])
+
+    def sizeHint(self):
+        if self.occupancy is None:
+            return QtCore.QSize(0, 0)
+        hall = self.occupancy.hall
+        return QtCore.QSize(hall.cols * (SEAT_SIZE + SEAT_SPACING), hall.rows * (SEAT_SIZE + SEAT_SPACING))
+
+    def _geometry(self):
+        # Размер ячейки подбирается под виджет, чтобы большие залы помещались целиком
+        hall = self.occupancy.hall
+        step = min(self.width() / hall.cols, self.height() / hall.rows, SEAT_SIZE + SEAT_SPACING)
+        left = (self.width() - step * hall.cols) / 2
+        top = (self.height() - step * hall.rows) / 2
+        return step, left, top
+
+    def _seat_rect(self, step, left, top, row, col):
+        spacing = step * SEAT_SPACING / (SEAT_SIZE + SEAT_SPACING)
+        return QtCore.QRectF(left + col * step, top + row * step, step - spacing, step - spacing)
+
+    def seat_at(self, point):
+        if self.occupancy is None:
+            return None
+        hall = self.occupancy.hall
+        step, left, top = self._geometry()
+        col = int((point.x() - left) // step)
+        row = int((point.y() - top) // step)
+        if not (0 <= row < hall.rows and 0 <= col < hall.cols):
+            return None
+        if not self._seat_rect(step, left, top, row, col).contains(point):
+            return None
+        return hall.seat_index(row, col)
+
+    def mousePressEvent(self, event):
+        if event.button() != QtCore.Qt.MouseButton.LeftButton:
+            return super().mousePressEvent(event)
+        index = self.seat_at(event.position())
+        if index is None or self.is_taken(index):
+            return
+        self.toggle(index)
+
+    def paintEvent(self, event):
+        with profiling.timed('ui.seatmap.paint'):
+            self._paint(event)
+
+    def _paint(self, event):
+        if self.occupancy is None:
+            return
+        hall = self.occupancy.hall
+        step, left, top = self._geometry()
+        painter = QtGui.QPainter(self)
+        painter.setRenderHint(QtGui.QPainter.RenderHint.Antialiasing)
+        painter.setPen(QtCore.Qt.PenStyle.NoPen)
+        font = painter.font()
+        font.setPixelSize(max(int(step / 4), 6))
+        painter.setFont(font)
+        # Подписи рисуются только если помещаются в ячейку
+        draw_labels = step >= 24
+        exposed = event.rect()
+        selected = set(self.selected)
+        for row in range(hall.rows):
+            for col in range(hall.cols):
+                rect = self._seat_rect(step, left, top, row, col)
+                if not exposed.intersects(rect.toAlignedRect()):
+                    continue
+                index = hall.seat_index(row, col)
+                if index in selected:
+                    color = SELECTED_COLOR
+                elif self.occupancy.is_taken(index):
+                    color = TAKEN_COLOR
+                elif self.occupancy.is_held(index):
+                    color = HELD_COLOR
+                else:
+                    color = FREE_COLOR
+                painter.setBrush(color)
+                painter.drawRoundedRect(rect, 5, 5)
+                if draw_labels:
+                    painter.setPen(QtGui.QColor('white'))
+                    painter.drawText(rect, QtCore.Qt.AlignmentFlag.AlignCenter, hall.seat_label(index))
+                    painter.setPen(QtCore.Qt.PenStyle.NoPen)
+        painter.end()
@@ -0,0 +1,103 @@
+import threading
+
+from PyQt6 import QtCore
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobSignals(QtCore.QObject):
+    finished = QtCore.pyqtSignal(object)
+    failed = QtCore.pyqtSignal(object)
+    progress = QtCore.pyqtSignal(int, int)
+    cancelled = QtCore.pyqtSignal()
+
+
+# Фоновая задача для QThreadPool. Результат, ошибка и прогресс приходят
+# сигналами, поэтому обработчики выполняются в потоке интерфейса
+class Job(QtCore.QRunnable):
+    def __init__(self, fn, args, kwargs, with_job=False):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.with_job = with_job
+        self.signals = JobSignals()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def check_cancelled(self):
+        if self._cancelled.is_set():
+            raise JobCancelled()
+
+    def report_progress(self, done, total):
+        # Вызывается из самой задачи; заодно точка проверки отмены
+        self.check_cancelled()
+        self.signals.progress.emit(done, total)
+
+    def run(self):
+        try:
+            if self.with_job:
+                result = self.fn(*self.args, job=self, **self.kwargs)
+            else:
+                result = self.fn(*self.args, **self.kwargs)
+        except JobCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(e)
+        else:
+            if self._cancelled.is_set():
+                self.signals.cancelled.emit()
+            else:
+                self.signals.finished.emit(result)
+
+
+# Очередь фоновых задач для экранов: вся работа с базой и файлами
+# выполняется вне потока интерфейса
+class JobRunner:
+    def __init__(self, pool=None):
+        self.pool = pool or QtCore.QThreadPool.globalInstance()
+        self._active = set()
+
+    def submit(self, fn, *args, on_result=None, on_error=None, on_progress=None, on_cancel=None,
+               with_job=False, **kwargs):
+        job = Job(fn, args, kwargs, with_job=with_job)
+        # Задача удерживается до завершения, иначе её сигналы могут быть уничтожены раньше времени
+        job.setAutoDelete(False)
+        self._active.add(job)
+        if on_result is not None:
+            job.signals.finished.connect(on_result)
+        if on_error is not None:
+            job.signals.failed.connect(on_error)
+        if on_progress is not None:
+            job.signals.progress.connect(on_progress)
+        if on_cancel is not None:
+            job.signals.cancelled.connect(on_cancel)
+        for signal in (job.signals.finished, job.signals.failed, job.signals.cancelled):
+            signal.connect(lambda *_, job=job: self._active.discard(job))
+        self.pool.start(job)
+        return job
+
+    def cancel_all(self):
+        for job in list(self._active):
+            job.cancel()
+
+    def wait(self, msecs=-1):
+        return self.pool.waitForDone(msecs)
+
+
+_runner = None
+
+
+def get_runner():
+    global _runner
+    if _runner is None:
+        _runner = JobRunner()
+    return _runner